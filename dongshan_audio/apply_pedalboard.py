@@ -3,103 +3,167 @@ apply_pedalboard.py
 """
 import sys
 import os
+import threading
+import numpy as np
 import soundfile as sf
 from pedalboard import (
-    Pedalboard, Reverb, Delay, Chorus, Distortion, 
+    Pedalboard, Reverb, Delay, Chorus, Distortion,
     HighpassFilter, LowpassFilter, Gain, Compressor, Limiter
 )
 
-def apply_fx(theme_name, input_wav, output_wav):
+# 主題效果預設：(效果器類別, 參數)
+PRESETS = {
+    # 1. 瓜棚火車站 (Train) - 寬廣、機械感、回音
+    'train': [
+        (Compressor, dict(threshold_db=-10, ratio=2.5)),
+        (Delay, dict(delay_seconds=0.25, feedback=0.3, mix=0.2)), # 營造車站大廳回音
+        (Reverb, dict(room_size=0.6, wet_level=0.3)),
+        (Limiter, dict(threshold_db=-1.0)),
+    ],
+
+    # 2. 神秘河道 (River) - 濕潤、洞穴感、流動
+    'river': [
+        (HighpassFilter, dict(cutoff_frequency_hz=150)), # 去除低頻雜訊
+        (Chorus, dict(rate_hz=1.5, depth=0.3, mix=0.4)), # 水波感
+        (Reverb, dict(room_size=0.8, damping=0.2, wet_level=0.5)), # 洞穴大殘響
+        (Gain, dict(gain_db=-2.0)),
+    ],
+
+    # 3. 梅花湖 (Lake) - 清澈、平靜、開闊
+    'lake': [
+        (Compressor, dict(threshold_db=-12, ratio=2.0)),
+        (Reverb, dict(room_size=0.4, wet_level=0.25)), # 自然空間
+        (Gain, dict(gain_db=-1.0)),
+    ],
+
+    # 4. 新寮瀑布 (Waterfall) - 轟鳴、濕氣、力量
+    'waterfall': [
+        (LowpassFilter, dict(cutoff_frequency_hz=8000)), # 柔化高頻刺耳聲
+        (Reverb, dict(room_size=0.9, wet_level=0.6)),    # 巨大空間感
+        (Compressor, dict(threshold_db=-8, ratio=3.0)),  # 壓制動態
+        (Limiter, dict(threshold_db=-0.5)),
+    ],
+
+    # 5. 三奇美徑 (RiceField) - 輕快、風聲、乾燥
+    'rice_field': [
+        (HighpassFilter, dict(cutoff_frequency_hz=100)),
+        (Chorus, dict(rate_hz=0.8, depth=0.15, mix=0.2)), # 微風感
+        (Reverb, dict(room_size=0.3, wet_level=0.15)),    # 開放空間
+        (Gain, dict(gain_db=0.0)),
+    ],
+
+    # 6. 宜農牧場 (Farm) - 溫暖、親切、小空間
+    'farm': [
+        (Compressor, dict(threshold_db=-10, ratio=2.0)),
+        (Reverb, dict(room_size=0.2, wet_level=0.15)), # 小木屋空間
+        (Gain, dict(gain_db=1.0)), # 稍微大聲一點
+    ],
+
+    # 7. 水火同源 (FireWater) - 神秘、溫暖、共振
+    'fire_water': [
+        (Delay, dict(delay_seconds=0.4, feedback=0.4, mix=0.3)), # 傳說的回音
+        (Reverb, dict(room_size=0.7, wet_level=0.4)),
+        (LowpassFilter, dict(cutoff_frequency_hz=6000)), # 溫暖火光
+        (Limiter, dict(threshold_db=-1.0)),
+    ],
+
+    # 8. 仁山植物園 (Forest) - 夢幻、精靈、空氣感
+    'forest': [
+        (HighpassFilter, dict(cutoff_frequency_hz=200)),
+        (Chorus, dict(rate_hz=2.0, depth=0.25, mix=0.3)), # 精靈飛舞感
+        (Delay, dict(delay_seconds=0.5, feedback=0.2, mix=0.2)),
+        (Reverb, dict(room_size=0.85, width=1.0, wet_level=0.5)), # 森林深處
+        (Gain, dict(gain_db=-2.0)),
+    ],
+}
+
+# Default
+DEFAULT_PRESET = [(Reverb, dict(room_size=0.5))]
+
+# 串流處理每次讀取的取樣數：pedalboard 內部以 8192 取樣為單位處理，
+# 區塊取其倍數時分段邊界與一次處理相同，輸出逐位元一致；記憶體用量與檔案長度無關
+BLOCK_FRAMES = 16 * 8192
+
+# 已建立的效果鏈，同一行程內重複使用 (每次使用前 reset 清掉殘響狀態)
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def describe_preset(theme_name):
+    # 可轉為 JSON 的效果鏈描述，供產物快取計算鍵
+    preset = PRESETS.get(theme_name, DEFAULT_PRESET)
+    return [[plugin.__name__, params] for plugin, params in preset]
+
+
+def build_board(theme_name):
+    preset = PRESETS.get(theme_name, DEFAULT_PRESET)
+    return Pedalboard([plugin(**params) for plugin, params in preset])
+
+
+def get_board(theme_name):
+    # 回傳 (board, lock)；同一個 board 不可被多個執行緒同時使用
+    with _boards_lock:
+        if theme_name not in _boards:
+            _boards[theme_name] = (build_board(theme_name), threading.Lock())
+        return _boards[theme_name]
+
+
+def process(theme_name, audio, sample_rate):
+    board, lock = get_board(theme_name)
+    with lock:
+        board.reset()
+        return board(audio, sample_rate)
+
+
+def process_stream(theme_name, blocks, sample_rate):
+    # 逐塊處理 (frames, channels) float32 音訊；reset=False 讓殘響與延遲跨塊延續
+    board, lock = get_board(theme_name)
+    with lock:
+        board.reset()
+        for block in blocks:
+            yield board.process(block, sample_rate, reset=False)
+
+
+def read_blocks(path, frames=BLOCK_FRAMES):
+    # 逐塊讀成 (frames, channels) float32；最後一塊的取樣數不多於聲道數時
+    # pedalboard 無法判斷聲道軸，併入前一塊 (分段邊界不變，輸出仍一致)
+    pending = None
+    for block in sf.blocks(path, blocksize=frames, dtype='float32', always_2d=True):
+        if pending is not None:
+            if len(block) <= block.shape[1]:
+                block = np.concatenate([pending, block])
+            else:
+                yield pending
+        pending = block
+    if pending is not None:
+        yield pending
+
+
+def apply_fx(theme_name, input_wav, output_wav, stream=True):
+    # stream=True 時逐塊讀取、處理、寫出 (一小時的配樂也只佔幾 MB)；
+    # False 時整個檔案一次處理，兩者輸出相同
     print(f"    Applying Pedalboard EFX ({theme_name})...")
-    
+
     try:
-        audio, sample_rate = sf.read(input_wav)
-        
-        # 1. 瓜棚火車站 (Train) - 寬廣、機械感、回音
-        if theme_name == 'train':
-            board = Pedalboard([
-                Compressor(threshold_db=-10, ratio=2.5),
-                Delay(delay_seconds=0.25, feedback=0.3, mix=0.2), # 營造車站大廳回音
-                Reverb(room_size=0.6, wet_level=0.3),
-                Limiter(threshold_db=-1.0)
-            ])
-
-        # 2. 神秘河道 (River) - 濕潤、洞穴感、流動
-        elif theme_name == 'river':
-            board = Pedalboard([
-                HighpassFilter(cutoff_frequency_hz=150), # 去除低頻雜訊
-                Chorus(rate_hz=1.5, depth=0.3, mix=0.4), # 水波感
-                Reverb(room_size=0.8, damping=0.2, wet_level=0.5), # 洞穴大殘響
-                Gain(gain_db=-2.0)
-            ])
-
-        # 3. 梅花湖 (Lake) - 清澈、平靜、開闊
-        elif theme_name == 'lake':
-            board = Pedalboard([
-                Compressor(threshold_db=-12, ratio=2.0),
-                Reverb(room_size=0.4, wet_level=0.25), # 自然空間
-                Gain(gain_db=-1.0)
-            ])
-            
-        # 4. 新寮瀑布 (Waterfall) - 轟鳴、濕氣、力量
-        elif theme_name == 'waterfall':
-            board = Pedalboard([
-                LowpassFilter(cutoff_frequency_hz=8000), # 柔化高頻刺耳聲
-                Reverb(room_size=0.9, wet_level=0.6),    # 巨大空間感
-                Compressor(threshold_db=-8, ratio=3.0),  # 壓制動態
-                Limiter(threshold_db=-0.5)
-            ])
-
-        # 5. 三奇美徑 (RiceField) - 輕快、風聲、乾燥
-        elif theme_name == 'rice_field':
-            board = Pedalboard([
-                HighpassFilter(cutoff_frequency_hz=100),
-                Chorus(rate_hz=0.8, depth=0.15, mix=0.2), # 微風感
-                Reverb(room_size=0.3, wet_level=0.15),    # 開放空間
-                Gain(gain_db=0.0)
-            ])
-
-        # 6. 宜農牧場 (Farm) - 溫暖、親切、小空間
-        elif theme_name == 'farm':
-            board = Pedalboard([
-                Compressor(threshold_db=-10, ratio=2.0),
-                Reverb(room_size=0.2, wet_level=0.15), # 小木屋空間
-                Gain(gain_db=1.0) # 稍微大聲一點
-            ])
-
-        # 7. 水火同源 (FireWater) - 神秘、溫暖、共振
-        elif theme_name == 'fire_water':
-            board = Pedalboard([
-                Delay(delay_seconds=0.4, feedback=0.4, mix=0.3), # 傳說的回音
-                Reverb(room_size=0.7, wet_level=0.4),
-                LowpassFilter(cutoff_frequency_hz=6000), # 溫暖火光
-                Limiter(threshold_db=-1.0)
-            ])
-
-        # 8. 仁山植物園 (Forest) - 夢幻、精靈、空氣感
-        elif theme_name == 'forest':
-            board = Pedalboard([
-                HighpassFilter(cutoff_frequency_hz=200),
-                Chorus(rate_hz=2.0, depth=0.25, mix=0.3), # 精靈飛舞感
-                Delay(delay_seconds=0.5, feedback=0.2, mix=0.2),
-                Reverb(room_size=0.85, width=1.0, wet_level=0.5), # 森林深處
-                Gain(gain_db=-2.0)
-            ])
-            
+        if stream:
+            info = sf.info(input_wav)
+            with sf.SoundFile(output_wav, 'w', info.samplerate, info.channels) as out:
+                for block in process_stream(theme_name, read_blocks(input_wav), info.samplerate):
+                    out.write(block)
         else:
-            # Default
-            board = Pedalboard([Reverb(room_size=0.5)])
-
-        # Apply output
-        effected = board(audio, sample_rate)
-        sf.write(output_wav, effected, sample_rate)
+            audio, sample_rate = sf.read(input_wav, dtype='float32', always_2d=True)
+            sf.write(output_wav, process(theme_name, audio, sample_rate), sample_rate)
         print("    Effects applied successfully")
+        return True
 
     except Exception as e:
         print(f"    [!] Error applying effects: {e}")
+        return False
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: python apply_pedalboard.py <theme> <input_wav> <output_wav>")
+    args = [a for a in sys.argv[1:] if a != '--oneshot']
+    if len(args) < 3:
+        print("Usage: python apply_pedalboard.py <theme> <input_wav> <output_wav> [--oneshot]")
     else:
-        apply_fx(sys.argv[1], sys.argv[2], sys.argv[3])
+        stream = '--oneshot' not in sys.argv
+        sys.exit(0 if apply_fx(args[0], args[1], args[2], stream) else 1)
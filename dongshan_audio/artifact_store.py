@@ -0,0 +1,167 @@
+"""
+artifact_store.py — 冬山鄉探險隊：階段產物快取
+
+每個產物 (BGM MP3、混音 MP3 …) 以「輸入檔雜湊 + 參數」的雜湊作為鍵：
+- artifacts/objects/<key>.<ext>  產物本體 (內容定址)
+- artifacts/records/<輸出檔>.json 輸出位置目前對應的鍵
+
+每個輸出各自一個紀錄檔，平行的行程同時寫入也不會互相覆蓋。
+清除不再被引用的產物：
+
+    python artifact_store.py gc [--dry-run]
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+STORE_DIR = "artifacts"
+OBJECTS_DIR = os.path.join(STORE_DIR, "objects")
+RECORDS_DIR = os.path.join(STORE_DIR, "records")
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_key(stage, params, inputs=()):
+    # params 需可轉為 JSON；inputs 為輸入檔路徑，以內容雜湊參與計算
+    payload = {
+        'stage': stage,
+        'params': params,
+        'inputs': [file_hash(p) for p in inputs],
+    }
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _object_path(key, output_path):
+    ext = os.path.splitext(output_path)[1]
+    return os.path.join(OBJECTS_DIR, f"{key}{ext}")
+
+
+def _record_path(output_path):
+    name = output_path.replace(os.sep, '/').replace('/', '__')
+    return os.path.join(RECORDS_DIR, f"{name}.json")
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def lookup(output_path):
+    try:
+        with open(_record_path(output_path), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(output_path, key):
+    # 輸出檔存在、鍵相同，且未被手動改動過
+    rec = lookup(output_path)
+    if not rec or rec.get('key') != key or not os.path.exists(output_path):
+        return False
+    return rec.get('stamp') == _stamp(output_path)
+
+
+def has_object(key, output_path):
+    return os.path.exists(_object_path(key, output_path))
+
+
+def status(output_path, key):
+    # 'fresh' 已是最新 / 'restore' 可由快取取回 / 'build' 需重新產生
+    if is_fresh(output_path, key):
+        return 'fresh'
+    if has_object(key, output_path):
+        return 'restore'
+    return 'build'
+
+
+def _write_record(output_path, key, stage):
+    os.makedirs(RECORDS_DIR, exist_ok=True)
+    rec = {
+        'output': output_path.replace(os.sep, '/'),
+        'stage': stage,
+        'key': key,
+        'stamp': _stamp(output_path),
+    }
+    path = _record_path(output_path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(rec, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def _copy(src, dst):
+    # 一律複製而非 hard link：之後就地覆寫輸出檔時不會連帶改到快取本體
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def restore(output_path, key, stage):
+    # 從快取取回產物到輸出位置；快取中沒有時回傳 False
+    obj = _object_path(key, output_path)
+    if not os.path.exists(obj):
+        return False
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    _copy(obj, output_path)
+    _write_record(output_path, key, stage)
+    return True
+
+
+def commit(output_path, key, stage):
+    # 將剛產生的輸出檔收進快取並記錄
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
+    _copy(output_path, _object_path(key, output_path))
+    _write_record(output_path, key, stage)
+
+
+def gc(dry_run=False):
+    keep = set()
+    if os.path.isdir(RECORDS_DIR):
+        for name in os.listdir(RECORDS_DIR):
+            try:
+                with open(os.path.join(RECORDS_DIR, name), encoding='utf-8') as f:
+                    keep.add(json.load(f)['key'])
+            except (OSError, ValueError, KeyError):
+                continue
+    removed, freed = 0, 0
+    if not os.path.isdir(OBJECTS_DIR):
+        return removed, freed
+    for name in sorted(os.listdir(OBJECTS_DIR)):
+        if name.split('.')[0] in keep:
+            continue
+        path = os.path.join(OBJECTS_DIR, name)
+        size = os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] != 'gc':
+        print("Usage: python artifact_store.py gc [--dry-run]")
+        return
+    dry_run = '--dry-run' in args
+    removed, freed = gc(dry_run=dry_run)
+    verb = "可清除" if dry_run else "已清除"
+    print(f"🧹 {verb} {removed} 個未引用的產物 ({freed / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
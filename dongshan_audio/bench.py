@@ -0,0 +1,318 @@
+"""
+bench.py — 冬山鄉探險隊：效能基準
+
+量測配樂生成、效果鏈、混音與 TTS 排程的速度，結果存成 JSON 基準，
+之後再跑一次並比較，超過門檻的變慢項目會被標出 (結束碼 1)：
+
+    python bench.py run [--suite gen,fx,mix,tts] [--out bench_baseline.json]
+                        [--tts-latency 0.2] [--tts-jitter 0.1] [--tts-error-rate 0.05]
+    python bench.py compare bench_baseline.json bench_current.json [--threshold 0.15]
+
+mix 需要 ffmpeg (PATH 上、環境變數 DONGSHAN_FFMPEG 或 --ffmpeg 指定)；tts 透過本機的假 TTS 服務 (fake_tts.FakeTTSServer)，不需連網。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import ffmpeg_tool
+
+if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+BENCH_VERSION = 1
+DEFAULT_OUT = "bench_baseline.json"
+DEFAULT_THRESHOLD = 0.15   # 中位數變慢超過 15% 視為退步
+SUITES = ('gen', 'fx', 'mix', 'tts')
+
+GEN_DURATIONS = (60, 600, 3600)   # 秒
+FX_SECONDS = 10
+MIX_SCENES = 8
+MIX_SCENE_SEC = 20
+TTS_SETTINGS = {'latency': 0.2, 'jitter': 0.1, 'error_rate': 0.05}   # 假 TTS 服務的預設行為
+
+
+def measure(fn, repeat, setup=None):
+    # 回傳每次執行的秒數；setup 不計入時間
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _result(times, **extra):
+    return {'median': statistics.median(times), 'min': min(times), 'runs': len(times), **extra}
+
+
+def bench_gen(repeat):
+    import generate_bgm
+
+    results = {}
+    theme = generate_bgm.THEMES[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        midi_path = os.path.join(tmp, "bench.mid")
+        for sec in GEN_DURATIONS:
+            events = generate_bgm.gen_note_events(theme, sec)
+            times = measure(lambda: generate_bgm.gen_note_events(theme, sec), repeat)
+            results[f"gen_note_events:{sec}s"] = _result(times, notes=len(events[0]))
+            times = measure(lambda: generate_bgm.events_to_midi(events, theme, midi_path), repeat)
+            results[f"events_to_midi:{sec}s"] = _result(times, bytes=os.path.getsize(midi_path))
+    return results
+
+
+def bench_fx(repeat, sample_rate=44100):
+    import soundfile as sf
+    from apply_pedalboard import PRESETS, apply_fx
+
+    results = {}
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal((FX_SECONDS * sample_rate, 2)) * 0.1).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "in.wav")
+        sf.write(src, audio, sample_rate)
+        for theme in PRESETS:
+            outputs = {}
+            for name, stream in (('apply_fx', True), ('apply_fx_oneshot', False)):
+                dst = outputs[name] = os.path.join(tmp, f"{name}.wav")
+                # apply_fx 會印出進度，量測時略過
+                def run():
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        if not apply_fx(theme, src, dst, stream=stream):
+                            raise RuntimeError(f"apply_fx failed for {theme}")
+                times = measure(run, repeat)
+                results[f"{name}:{theme}"] = _result(times, audio_sec=FX_SECONDS,
+                                                     realtime=FX_SECONDS / statistics.median(times))
+            # 串流處理必須與一次處理逐位元相同
+            with open(outputs['apply_fx'], 'rb') as a, open(outputs['apply_fx_oneshot'], 'rb') as b:
+                if a.read() != b.read():
+                    raise RuntimeError(f"streamed apply_fx differs from one-shot for {theme}")
+    return results
+
+
+def bench_mix(repeat):
+    # 在暫存目錄中產生靜音 TTS 與 BGM，兩種混音引擎各跑一次 mix_story：
+    # mix_story:<引擎> 每次都清掉所有快取 (冷啟動)，mix_story_warm:<引擎> 保留 PCM、長度與響度快取
+    from fake_tts import silent_mp3
+
+    if shutil.which(ffmpeg_tool.ffmpeg()) is None:
+        raise RuntimeError(f"找不到 ffmpeg ({ffmpeg_tool.ffmpeg()})；請加入 PATH 或以 --ffmpeg 指定")
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            import hash_cache
+            import loudness
+            import mix_audio
+            import mp3_info
+            import pcm_cache
+
+            os.makedirs(mix_audio.TTS_DIR, exist_ok=True)
+            os.makedirs(mix_audio.BGM_DIR, exist_ok=True)
+            os.makedirs(mix_audio.OUTPUT_DIR, exist_ok=True)
+            for i in range(1, MIX_SCENES + 1):
+                with open(os.path.join(mix_audio.TTS_DIR, f"{i:05d}.mp3"), 'wb') as f:
+                    f.write(silent_mp3(MIX_SCENE_SEC))
+            with open(os.path.join(mix_audio.BGM_DIR, "bgm_bench.mp3"), 'wb') as f:
+                f.write(silent_mp3(60))
+            item = ('bench', os.path.join(mix_audio.OUTPUT_DIR, "bench.mp3"),
+                    os.path.join(mix_audio.BGM_DIR, "bgm_bench.mp3"),
+                    [os.path.join(mix_audio.TTS_DIR, f"{i:05d}.mp3") for i in range(1, MIX_SCENES + 1)])
+
+            def reset(cold=True):
+                # 清掉產物快取，每次都真的重新混音；cold 時連 PCM、長度與響度快取
+                # (檔案與記憶體中的) 一起清掉，從 MP3 解碼開始
+                shutil.rmtree("artifacts", ignore_errors=True)
+                shutil.rmtree(mix_audio.OUTPUT_DIR, ignore_errors=True)
+                os.makedirs(mix_audio.OUTPUT_DIR, exist_ok=True)
+                if not cold:
+                    return
+                shutil.rmtree(pcm_cache.CACHE_DIR, ignore_errors=True)
+                for path in (mp3_info.CACHE_PATH, loudness.CACHE_PATH):
+                    if os.path.exists(path):
+                        os.remove(path)
+                mix_audio._durations = mix_audio._loudness = None
+                pcm_cache._hashes = hash_cache.HashCache()
+
+            engine = mix_audio.MIX_ENGINE
+            try:
+                for name in ('ffmpeg', 'numpy'):
+                    mix_audio.set_engine(name)
+                    def run():
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            if not mix_audio.mix_story(*item):
+                                raise RuntimeError(f"mix_story failed ({name})")
+                    times = measure(run, repeat, setup=reset)
+                    results[f"mix_story:{name}"] = _result(times, scenes=MIX_SCENES)
+                    # 冷啟動的最後一次已把快取填好
+                    times = measure(run, repeat, setup=lambda: reset(cold=False))
+                    results[f"mix_story_warm:{name}"] = _result(times, scenes=MIX_SCENES)
+            finally:
+                mix_audio.set_engine(engine)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def bench_tts(repeat, jobs=65, latency=TTS_SETTINGS['latency'], jitter=TTS_SETTINGS['jitter'],
+              error_rate=TTS_SETTINGS['error_rate'], hang_rate=0.0, timeout=2.0):
+    from fake_tts import FakeTTSClient, FakeTTSServer
+    from tts_queue import TTSScheduler, summarize
+
+    async def once():
+        async with FakeTTSServer(latency=latency, jitter=jitter, error_rate=error_rate,
+                                 hang_rate=hang_rate, seed=0) as server:
+            # 不限速率：量的是排程器與連線本身的吞吐量，而不是 REQUESTS_PER_SEC 上限
+            scheduler = TTSScheduler(FakeTTSClient(server.host, server.port), rate=0,
+                                     timeout=timeout, backoff=0.05)
+            with tempfile.TemporaryDirectory() as tmp:
+                work = [("測試語音" * 40, os.path.join(tmp, f"{i:05d}.mp3")) for i in range(jobs)]
+                ok, failed, _ = summarize(await scheduler.run(work))
+        if failed:
+            raise RuntimeError(f"{failed} fake TTS requests failed")
+
+    times = measure(lambda: asyncio.run(once()), repeat)
+    return {'tts_scheduler': _result(times, jobs=jobs, latency=latency, jitter=jitter,
+                                     error_rate=error_rate,
+                                     req_per_sec=jobs / statistics.median(times))}
+
+
+def run_suites(suites, repeat, tts=None):
+    # tts 為假 TTS 服務的設定 (latency / jitter / error_rate)，未給的沿用 TTS_SETTINGS
+    tts = {**TTS_SETTINGS, **(tts or {})}
+    results = {}
+    runners = {'gen': bench_gen, 'fx': bench_fx, 'mix': bench_mix,
+               'tts': lambda repeat: bench_tts(repeat, **tts)}
+    for suite in suites:
+        print(f"  ▶ {suite} ...")
+        # 單一項目失敗 (缺少 ffmpeg、套件或結果不符) 時記下原因，其他項目照跑
+        try:
+            suite_results = runners[suite](repeat)
+        except Exception as e:
+            print(f"    [!] {suite} 失敗: {type(e).__name__}: {e}")
+            results[suite] = {'error': f"{type(e).__name__}: {e}"}
+            continue
+        for name, r in suite_results.items():
+            print(f"    {name:<28} {r['median'] * 1000:9.1f} ms (min {r['min'] * 1000:.1f})")
+            results[name] = dict(r, suite=suite)
+    return {
+        'version': BENCH_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'ffmpeg': ffmpeg_tool.ffmpeg(),
+        'repeat': repeat,
+        'suites': list(suites),
+        'tts': tts,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # 回傳 [(名稱, 基準秒數, 目前秒數, 比例, 是否退步), ...]
+    # 基準有量到、這次卻沒有結果 (該項目執行失敗，記錄為 {'error': ...}) 時目前秒數與比例為 None，
+    # 一律算退步；這次沒有選到的項目 (--suite) 不比較
+    ran = current.get('suites')
+    rows = []
+    for name, base in sorted(baseline['results'].items()):
+        if 'median' not in base:
+            continue
+        if ran is not None and 'suite' in base and base['suite'] not in ran:
+            continue
+        cur = current['results'].get(name)
+        if cur is None or 'median' not in cur:
+            rows.append((name, base['median'], None, None, True))
+            continue
+        ratio = cur['median'] / base['median'] if base['median'] else float('inf')
+        rows.append((name, base['median'], cur['median'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != BENCH_VERSION:
+        raise SystemExit(f"{path}: 不支援的基準版本 {data.get('version')}")
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冬山音訊管線效能基準")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    r = sub.add_parser('run', help="執行基準並存成 JSON")
+    r.add_argument('--suite', default=",".join(SUITES),
+                   help=f"要跑的項目，逗號分隔 ({', '.join(SUITES)})")
+    r.add_argument('--repeat', type=int, default=5)
+    r.add_argument('--out', default=DEFAULT_OUT)
+    ffmpeg_tool.add_args(r)
+    r.add_argument('--tts-latency', type=float, default=TTS_SETTINGS['latency'],
+                   help="假 TTS 服務每個請求的延遲 (秒)")
+    r.add_argument('--tts-jitter', type=float, default=TTS_SETTINGS['jitter'],
+                   help="延遲的隨機抖動 (秒)")
+    r.add_argument('--tts-error-rate', type=float, default=TTS_SETTINGS['error_rate'],
+                   help="請求失敗 (需重試) 的比例")
+    c = sub.add_parser('compare', help="比較兩份基準，變慢超過門檻時結束碼為 1")
+    c.add_argument('baseline')
+    c.add_argument('current')
+    c.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                   help="容許的變慢比例 (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    if args.cmd == 'run':
+        ffmpeg_tool.apply_args(args)
+        suites = [s for s in args.suite.split(',') if s]
+        unknown = [s for s in suites if s not in SUITES]
+        if unknown:
+            parser.error(f"未知的項目: {', '.join(unknown)}")
+        print(f"⏱️ 效能基準 (每項 {args.repeat} 次，取中位數)")
+        tts = {'latency': args.tts_latency, 'jitter': args.tts_jitter,
+               'error_rate': args.tts_error_rate}
+        data = run_suites(suites, args.repeat, tts)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        failed = [name for name, r in data['results'].items() if 'error' in r]
+        if failed:
+            print(f"⚠️ 已寫入 {args.out}，但 {', '.join(failed)} 執行失敗")
+            return 1
+        print(f"✅ 已寫入 {args.out}")
+        return 0
+
+    current = _load(args.current)
+    for name, r in current['results'].items():
+        if 'error' in r:
+            print(f"⚠️ {name} 執行失敗: {r['error']}")
+    rows = compare(_load(args.baseline), current, args.threshold)
+    slower = 0
+    for name, base, cur, ratio, regressed in rows:
+        mark = "❌" if regressed else "  "
+        if cur is None:
+            print(f"{mark} {name:<28} {base * 1000:9.1f} → {'沒有結果':>7}")
+        else:
+            print(f"{mark} {name:<28} {base * 1000:9.1f} → {cur * 1000:9.1f} ms  ({ratio - 1:+.0%})")
+        slower += regressed
+    if slower:
+        print(f"\n{slower} 項變慢超過 {args.threshold:.0%} 或沒有結果")
+        return 1
+    print(f"\n✅ 沒有變慢超過 {args.threshold:.0%} 的項目")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+catalog.py — 冬山鄉探險隊：導覽目錄
+
+所有階段共用的場景資料 (catalog.json)：每個導覽 (tour) 有開場語 (intro)
+與多個主題，主題包含配樂參數與依序播放的場景。
+
+輸出位置依導覽的 layout 而定：
+- flat    冬山鄉原本的平面目錄 (tts_audio/00002.mp3)，網頁直接讀取
+- sharded 場景多的導覽依編號分桶 (tts_audio/<tour>/000/00002.mp3)，單一資料夾不會塞上萬個檔案
+
+選擇器 --tour / --theme / --scene 只挑出受影響的場景與主題，
+各階段據此只重建相關的 TTS、配樂與混音。
+"""
+
+import json
+import os
+from functools import lru_cache
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json")
+CATALOG_VERSION = 1
+SHARD_SIZE = 1000   # sharded 佈局每個資料夾的場景數
+
+TTS_DIR = "tts_audio"
+MIDI_DIR = "bgm_midi"
+BGM_DIR = "bgm_mp3"
+MIX_DIR = "final_output"
+
+
+class CatalogError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def load(path=CATALOG_PATH):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != CATALOG_VERSION:
+        raise CatalogError(f"{path}: 不支援的目錄版本 {data.get('version')}")
+    for name, tour in data['tours'].items():
+        seen = set()
+        for scene in tour_scenes(tour):
+            if scene['id'] in seen:
+                raise CatalogError(f"{name}: 場景編號重複 {scene['id']}")
+            seen.add(scene['id'])
+    return data
+
+
+def get_tour(name=None):
+    data = load()
+    name = name or data['default_tour']
+    if name not in data['tours']:
+        raise CatalogError(f"未知的導覽: {name}")
+    return name, data['tours'][name]
+
+
+def tour_scenes(tour):
+    # 開場語與各主題的全部場景，依目錄順序
+    scenes = list(tour.get('intro', ()))
+    for theme in tour['themes']:
+        scenes += theme['scenes']
+    return scenes
+
+
+def bgm_theme(theme):
+    # generate_bgm 使用的主題 dict (與原本 generate_bgm.THEMES 的欄位相同)
+    return {'id': theme['id'], 'name': theme['name'], 'emoji': theme['emoji'], **theme['bgm']}
+
+
+# ── 輸出位置 ────────────────────────────────────────────────
+
+def _flat(tour):
+    return get_tour(tour)[1].get('layout', 'sharded') == 'flat'
+
+
+def tts_path(tour, scene_id, voice=None):
+    # voice 為預設以外的語音設定檔時放在 tts_audio/voices/<voice>/ 底下，其餘結構相同
+    root = os.path.join(TTS_DIR, "voices", voice) if voice else TTS_DIR
+    name = f"{scene_id:05d}.mp3"
+    if _flat(tour):
+        return os.path.join(root, name)
+    return os.path.join(root, get_tour(tour)[0], f"{scene_id // SHARD_SIZE:03d}", name)
+
+
+def theme_dir(root, tour):
+    return root if _flat(tour) else os.path.join(root, get_tour(tour)[0])
+
+
+def bgm_path(tour, theme_id):
+    return os.path.join(theme_dir(BGM_DIR, tour), f"bgm_{theme_id}.mp3")
+
+
+def midi_path(tour, theme_id):
+    return os.path.join(theme_dir(MIDI_DIR, tour), f"bgm_{theme_id}.mid")
+
+
+def mix_path(tour, theme):
+    return os.path.join(theme_dir(MIX_DIR, tour), f"{theme['output']}.mp3")
+
+
+# ── 選擇器 ──────────────────────────────────────────────────
+
+def parse_ids(spec):
+    # "2-9,15" → {2, ..., 9, 15}
+    ids = set()
+    for part in filter(None, (p.strip() for p in (spec or "").split(','))):
+        lo, _, hi = part.partition('-')
+        try:
+            ids.update(range(int(lo), int(hi or lo) + 1))
+        except ValueError:
+            raise CatalogError(f"無效的場景編號: {part}") from None
+    return ids
+
+
+def add_selector_args(parser):
+    parser.add_argument('--tour', default=None, help="導覽名稱 (預設為 catalog.json 的 default_tour)")
+    parser.add_argument('--theme', default=None, help="只處理這些主題，逗號分隔")
+    parser.add_argument('--scene', default=None, help="只處理這些場景，例如 2-9,15")
+
+
+class Selection:
+    """一次建置選到的範圍：tour、要合成的場景、要重建配樂與混音的主題"""
+
+    def __init__(self, tour=None, themes=None, scenes=None):
+        self.tour, data = get_tour(tour)
+        theme_ids = set(filter(None, (themes or "").split(',')))
+        scene_ids = parse_ids(scenes)
+        known = {t['id'] for t in data['themes']}
+        if theme_ids - known:
+            raise CatalogError(f"{self.tour} 沒有主題: {', '.join(sorted(theme_ids - known))}")
+        unrestricted = not theme_ids and not scene_ids
+
+        def picked(theme_id, scene_id):
+            return unrestricted or theme_id in theme_ids or scene_id in scene_ids
+
+        self.full_mix = True
+        self.intro = [s for s in data.get('intro', ()) if picked(None, s['id'])]
+        # [(主題, 要合成的場景)]；只選到個別場景時，主題的配樂不必重新渲染
+        self.themes = []
+        self.bgm_themes = set()
+        for theme in data['themes']:
+            scenes = [s for s in theme['scenes'] if picked(theme['id'], s['id'])]
+            if scenes:
+                self.themes.append((theme, scenes))
+            if unrestricted or theme['id'] in theme_ids:
+                self.bgm_themes.add(theme['id'])
+        found = {s['id'] for s in self.scenes()}
+        if scene_ids - found:
+            raise CatalogError(f"{self.tour} 沒有場景: {', '.join(map(str, sorted(scene_ids - found)))}")
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.tour, args.theme, args.scene)
+
+    def scenes(self):
+        return self.intro + [s for _, scenes in self.themes for s in scenes]
+
+    def mix_scenes(self, theme):
+        # 混音一律用主題的全部場景 (未選到的場景沿用既有的 TTS)，預覽模式除外
+        if self.full_mix:
+            return theme['scenes']
+        return next(scenes for t, scenes in self.themes if t is theme)
+
+    def preview(self):
+        # 預覽模式：每個主題只取第一幕，混音也只用這一幕
+        self.themes = [(theme, scenes[:1]) for theme, scenes in self.themes]
+        self.full_mix = False
+        return self
@@ -0,0 +1,188 @@
+"""
+encode_profiles.py — 冬山鄉探險隊：多格式編碼
+
+依具名設定檔把 TTS、配樂與混音成品轉成各種播放格式：
+- 每個來源只啟動一個 ffmpeg，解碼一次後同時寫出所有設定檔的輸出
+- 多個來源檔以執行緒池平行編碼
+- 輸出收進 artifact_store，來源與設定都沒變時略過
+
+輸出位置為 encoded/<設定檔>/<來源資料夾>/<檔名>.<副檔名>：
+
+    python encode_profiles.py [--sources tts,bgm,mix] [--profiles speech,archive] [--jobs N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import artifact_store
+import ffmpeg_tool
+import tracing
+
+if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+ENCODED_DIR = "encoded"
+ENCODE_VERSION = 1  # 編碼邏輯改變時遞增，使舊的快取產物失效
+
+# 具名設定檔：編碼器、位元率、聲道、取樣率、副檔名與額外參數
+PROFILES = {
+    # 導覽語音：單聲道 Opus，鄉間行動網路也能秒開
+    'speech': dict(codec='libopus', bitrate='32k', channels=1, sample_rate=48000,
+                   ext='.opus', args=('-application', 'voip')),
+    # 不支援 Opus 的舊瀏覽器改用單聲道 MP3
+    'speech_mp3': dict(codec='libmp3lame', bitrate='48k', channels=1, sample_rate=44100,
+                       ext='.mp3', args=()),
+    # 配樂與混音成品：立體聲 Opus
+    'music': dict(codec='libopus', bitrate='64k', channels=2, sample_rate=48000,
+                  ext='.opus', args=('-application', 'audio')),
+    'music_mp3': dict(codec='libmp3lame', bitrate='128k', channels=2, sample_rate=44100,
+                      ext='.mp3', args=()),
+    # 高位元率存檔
+    'archive': dict(codec='libmp3lame', bitrate='320k', channels=2, sample_rate=44100,
+                    ext='.mp3', args=()),
+}
+
+# 來源種類：(資料夾, 預設輸出的設定檔)
+SOURCES = {
+    'tts': ("tts_audio", ('speech', 'speech_mp3')),
+    'bgm': ("bgm_mp3", ('music', 'music_mp3')),
+    'mix': ("final_output", ('music', 'music_mp3', 'archive')),
+}
+
+
+def set_preview():
+    # 預覽模式每種來源只輸出第一個設定檔
+    for kind, (folder, profiles) in list(SOURCES.items()):
+        SOURCES[kind] = (folder, profiles[:1])
+
+
+def _source_rel(path):
+    # 相對於目前目錄的路徑，例如 tts_audio/dongshan/000/00002.mp3
+    return os.path.relpath(os.path.abspath(path))
+
+
+def output_path(src_path, profile):
+    # 保留來源資料夾底下的子目錄 (分桶佈局的導覽)，不同導覽的同名檔案不會互相覆蓋
+    rel = os.path.splitext(_source_rel(src_path))[0]
+    return os.path.join(ENCODED_DIR, profile, rel + PROFILES[profile]['ext'])
+
+
+def encode_key(src_hash, profile):
+    settings = dict(PROFILES[profile], args=list(PROFILES[profile]['args']))
+    return artifact_store.make_key('encode', {
+        'profile': profile, 'source': src_hash, 'version': ENCODE_VERSION, **settings})
+
+
+def _output_args(profile, out_path):
+    p = PROFILES[profile]
+    return ['-map', '0:a', '-c:a', p['codec'], '-b:a', p['bitrate'],
+            '-ac', str(p['channels']), '-ar', str(p['sample_rate']), *p['args'], out_path]
+
+
+def encode_file(src_path, profiles, force=False):
+    # 回傳 {設定檔: 'fresh' | 'restore' | 'built' | 'failed'}
+    src_hash = artifact_store.file_hash(src_path)
+    states, pending = {}, []
+    for profile in profiles:
+        out = output_path(src_path, profile)
+        key = encode_key(src_hash, profile)
+        state = 'build' if force else artifact_store.status(out, key)
+        if state == 'restore':
+            artifact_store.restore(out, key, 'encode')
+        if state == 'build':
+            pending.append((profile, out, key))
+        else:
+            states[profile] = state
+    if not pending:
+        return states
+
+    # 一次解碼，同一個 ffmpeg 寫出所有需要重建的設定檔
+    cmd = [ffmpeg_tool.ffmpeg(), '-y', '-v', 'error', '-i', src_path]
+    for profile, out, _ in pending:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        cmd += _output_args(profile, out)
+    try:
+        tracing.run(cmd, outputs=[out for _, out, _ in pending], check=True,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"    [!] 編碼失敗 {src_path}: {e}")
+        states.update({profile: 'failed' for profile, _, _ in pending})
+        return states
+    for profile, out, key in pending:
+        artifact_store.commit(out, key, 'encode')
+        states[profile] = 'built'
+    return states
+
+
+def encode_files(items, jobs=0, force=False):
+    # items 為 [(來源路徑, 設定檔清單), ...]；回傳 [(來源路徑, {設定檔: 狀態}), ...]
+    items = [(src, profiles) for src, profiles in items if os.path.exists(src)]
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(items)))) as pool:
+        results = pool.map(lambda item: encode_file(item[0], item[1], force), items)
+        return list(zip((src for src, _ in items), results))
+
+
+def source_items(kinds=None, profiles=None, paths=None):
+    # 依來源種類列出要編碼的檔案；profiles 指定時取代各種類的預設設定檔
+    # paths 指定時只編碼這些檔案 (須位於某個來源資料夾內)
+    items = []
+    for kind in kinds or SOURCES:
+        folder, default_profiles = SOURCES[kind]
+        chosen = tuple(profiles) if profiles else default_profiles
+        if paths is None:
+            files = []
+            for root, dirs, names in os.walk(folder):
+                dirs.sort()
+                files += [os.path.join(root, n) for n in sorted(names) if n.endswith('.mp3')]
+        else:
+            files = [p for p in paths
+                     if _source_rel(p).split(os.sep)[0] == folder]
+        items += [(f, chosen) for f in files]
+    return items
+
+
+def summarize(results):
+    counts = {}
+    for _, states in results:
+        for state in states.values():
+            counts[state] = counts.get(state, 0) + 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冬山故事音訊多格式編碼")
+    parser.add_argument('--sources', default=",".join(SOURCES),
+                        help=f"來源種類，逗號分隔 ({', '.join(SOURCES)})")
+    parser.add_argument('--profiles', default=None,
+                        help=f"只輸出這些設定檔，逗號分隔 ({', '.join(PROFILES)})；預設依來源種類")
+    parser.add_argument('--jobs', type=int, default=0,
+                        help="同時編碼的檔案數，0 = 依核心數自動決定")
+    parser.add_argument('--force', action='store_true',
+                        help="忽略產物快取，全部重新編碼")
+    ffmpeg_tool.add_args(parser)
+    args = parser.parse_args()
+    ffmpeg_tool.apply_args(args)
+
+    kinds = [k for k in args.sources.split(',') if k]
+    profiles = [p for p in args.profiles.split(',') if p] if args.profiles else None
+    unknown = [k for k in kinds if k not in SOURCES] + [p for p in profiles or () if p not in PROFILES]
+    if unknown:
+        parser.error(f"未知的來源或設定檔: {', '.join(unknown)}")
+
+    items = source_items(kinds, profiles)
+    print(f"📦 多格式編碼：{len(items)} 個來源檔")
+    results = encode_files(items, args.jobs, args.force)
+    counts = summarize(results)
+    print(f"✅ 完成！新編碼 {counts.get('built', 0)}，取回 {counts.get('restore', 0)}，"
+          f"已是最新 {counts.get('fresh', 0)}，失敗 {counts.get('failed', 0)}；"
+          f"輸出位於 {ENCODED_DIR}/")
+    return 1 if counts.get('failed') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+fake_tts.py — 冬山鄉探險隊：離線 TTS 替身
+
+模擬 edge-tts 的延遲、錯誤與卡住的連線，輸出靜音 MP3，
+用於排程器壓測與不連網的管線測試。
+
+FakeTTSBackend 在行程內模擬；FakeTTSServer / FakeTTSClient 則經由本機 TCP 連線，
+連同連線建立與資料傳輸的開銷一起量測。
+"""
+
+import asyncio
+import json
+import random
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono — 全零 side info 解碼為靜音
+FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC4])
+FRAME_SIZE = 417
+FRAME_SEC = 1152 / 44100
+
+# 中文朗讀約每秒 4 字
+CHARS_PER_SEC = 4.0
+
+
+class FakeTTSError(Exception):
+    pass
+
+
+def silent_mp3(duration_sec):
+    frames = max(1, int(round(duration_sec / FRAME_SEC)))
+    frame = FRAME_HEADER + bytes(FRAME_SIZE - len(FRAME_HEADER))
+    return frame * frames
+
+
+class FakeTTSBackend:
+    """與 gen_tts 相同的介面：await backend(text, out_path, **profile)；語音設定不影響輸出"""
+
+    def __init__(self, latency=0.3, jitter=0.2, error_rate=0.0, hang_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    def roll(self):
+        # 決定一個請求的結果：('ok' | 'error' | 'hang', 延遲秒數)，並累計呼叫與失敗次數
+        self.calls += 1
+        roll = self.rng.random()
+        delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        if roll < self.hang_rate:
+            outcome = 'hang'
+        elif roll < self.hang_rate + self.error_rate:
+            outcome = 'error'
+        else:
+            return 'ok', delay
+        self.failures += 1
+        return outcome, delay
+
+    async def __call__(self, text, out_path, **profile):
+        outcome, delay = self.roll()
+        if outcome == 'hang':
+            # 模擬卡住的 websocket：永不回應，交給呼叫端逾時處理
+            await asyncio.Event().wait()
+        await asyncio.sleep(delay)
+        if outcome == 'error':
+            raise FakeTTSError("simulated edge-tts failure")
+        with open(out_path, 'wb') as f:
+            f.write(silent_mp3(len(text) / CHARS_PER_SEC))
+
+
+class FakeTTSServer:
+    """本機 TCP 假 TTS 服務：每個連線送一行 JSON {"text": ...}，
+    回應 "OK <位元組數>\n" 加上 MP3 內容，或 "ERR <原因>\n"；卡住的請求永不回應"""
+
+    def __init__(self, host='127.0.0.1', port=0, **behaviour):
+        self.host = host
+        self.port = port
+        self.backend = FakeTTSBackend(**behaviour)
+        self.server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = json.loads(await reader.readline())
+            text = request['text']
+            # 結果與延遲由 FakeTTSBackend 決定，兩種替身的行為一致
+            outcome, delay = self.backend.roll()
+            if outcome == 'hang':
+                await reader.read()  # 直到用戶端逾時斷線
+                return
+            await asyncio.sleep(delay)
+            if outcome == 'error':
+                writer.write(b"ERR simulated edge-tts failure\n")
+            else:
+                data = silent_mp3(len(text) / CHARS_PER_SEC)
+                writer.write(f"OK {len(data)}\n".encode() + data)
+            await writer.drain()
+        except (ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class FakeTTSClient:
+    """與 gen_tts 相同的介面，透過 TCP 向 FakeTTSServer 請求"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def __call__(self, text, out_path, **profile):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(json.dumps({'text': text}).encode('utf-8') + b"\n")
+            await writer.drain()
+            status = (await reader.readline()).decode('utf-8').strip()
+            if not status.startswith("OK "):
+                raise FakeTTSError(status[4:] or "connection closed")
+            data = await reader.readexactly(int(status[3:]))
+        finally:
+            writer.close()
+        with open(out_path, 'wb') as f:
+            f.write(data)
@@ -0,0 +1,31 @@
+"""
+ffmpeg_tool.py — 冬山鄉探險隊：ffmpeg 執行檔位置
+
+所有呼叫 ffmpeg 的階段 (配樂編碼、混音、PCM 快取、多格式編碼、基準) 都由這裡取得指令，
+依序採用：--ffmpeg 參數 (set_ffmpeg)、環境變數 DONGSHAN_FFMPEG、PATH 上的 ffmpeg。
+set_ffmpeg 同時寫入環境變數，平行渲染的子行程也會用同一個執行檔。
+"""
+
+import os
+import shutil
+
+ENV_VAR = "DONGSHAN_FFMPEG"
+
+
+def ffmpeg():
+    # 找不到時仍回傳 'ffmpeg'，讓呼叫端照常得到 FileNotFoundError 並回報失敗
+    return os.environ.get(ENV_VAR) or shutil.which('ffmpeg') or 'ffmpeg'
+
+
+def set_ffmpeg(path):
+    os.environ[ENV_VAR] = path
+
+
+def add_args(parser):
+    parser.add_argument('--ffmpeg', default=None,
+                        help=f"ffmpeg 執行檔；預設為環境變數 {ENV_VAR}，其次為 PATH 上的 ffmpeg")
+
+
+def apply_args(args):
+    if args.ffmpeg:
+        set_ffmpeg(args.ffmpeg)
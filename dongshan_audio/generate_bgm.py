@@ -3,12 +3,26 @@
 generate_bgm.py — 冬山鄉探險隊：主題配樂生成器
 """
 
+import argparse
 import os
 import sys
 import subprocess
 import random
+import tempfile
 import time
-from midiutil import MIDIFile
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import soundfile as sf
+
+import artifact_store
+import catalog
+import ffmpeg_tool
+import midi_events
+import numpy_mixer
+import soft_synth
+import tracing
+from apply_pedalboard import apply_fx, describe_preset, process, process_stream
 
 # 讓 Windows 終端機顯示 Emoji 正常
 sys.stdout.reconfigure(encoding='utf-8')
@@ -17,14 +31,26 @@ sys.stdout.reconfigure(encoding='utf-8')
 # 1. 設定 & 常數
 # ════════════════════════════════════════════════════════════
 
-MIDI_DIR = "bgm_midi"
-MP3_DIR  = "bgm_mp3"
+MIDI_DIR = catalog.MIDI_DIR
+MP3_DIR  = catalog.BGM_DIR
+VARIANT_DIR = "bgm_variants"  # 指定種子的變奏版本 (MIDI 與 MP3)
 DEFAULT_DURATION = 60  # 秒
+LOOP_BARS = None       # 設定後改為渲染 N 小節的無縫循環 (0 = 一輪和弦進行)，取代完整長度
+LOOP_FX_WARMUP_SEC = 8.0  # 循環模式先讓殘響、延遲跑到穩定狀態所需的秒數
 
 # FluidSynth 設定 (請依實際路徑修改)
 FLUIDSYNTH_CMD = r"C:\fluidsynth\bin\fluidsynth.exe"
 SOUNDFONT_PATH = r"C:\fluidsynth\FluidR3_GM.sf2"
 SAMPLE_RATE    = 44100
+SYNTH_BACKEND  = 'auto'  # 'fluidsynth' | 'numpy' | 'auto' (找不到 FluidSynth 時改用內建合成器)
+STREAM_BLOCK_FRAMES = 8192  # 串流模式每塊的取樣數
+BGM_BITRATE    = '192k'
+BGM_VERSION    = 1  # 生成邏輯改變時遞增，使舊的快取產物失效
+
+# 預覽模式 (run_all.py --test)：短、低取樣率、內建合成器
+PREVIEW_DURATION    = 10
+PREVIEW_SAMPLE_RATE = 22050
+PREVIEW_BITRATE     = '64k'
 
 # ════════════════════════════════════════════════════════════
 # 2. 音樂理論資料 (Scales & Chords)
@@ -50,67 +76,12 @@ CHORD_PROGRESSIONS = [
 ]
 
 # ════════════════════════════════════════════════════════════
-# 3. 主題定義 (冬山鄉 8 大景點)
+# 3. 主題定義 (catalog.json)
 # ════════════════════════════════════════════════════════════
 
-THEMES = [
-    {
-        'id': 'train', 'name': '瓜棚火車站', 'emoji': '🚂',
-        'bpm': 110, 'scale': 'major', 'key': 60, # C Major
-        'progression': [1, 5, 6, 4],
-        'instruments': [0, 11, 118], # Acoustic Grand, Vibraphone, Synth Drum
-        'style': 'rhythmic' # 模仿火車行進節奏
-    },
-    {
-        'id': 'river', 'name': '神秘河道', 'emoji': '🌊',
-        'bpm': 75, 'scale': 'dorian', 'key': 62, # D Dorian
-        'progression': [1, 4, 1, 5], 
-        'instruments': [46, 101, 91], # Harp, Goblins (Pad), Choir
-        'style': 'flowing' # 琶音流動
-    },
-    {
-        'id': 'lake', 'name': '梅花湖', 'emoji': '🌺',
-        'bpm': 65, 'scale': 'major', 'key': 65, # F Major
-        'progression': [1, 6, 2, 5],
-        'instruments': [73, 24, 48], # Flute, Acoustic Guitar, Strings
-        'style': 'peaceful' # 慢速分解和弦
-    },
-    {
-        'id': 'waterfall', 'name': '新寮瀑布', 'emoji': '💧',
-        'bpm': 90, 'scale': 'mixolydian', 'key': 67, # G Mixolydian
-        'progression': [1, 5, 1, 4],
-        'instruments': [127, 47, 56], # Gunshot (Impact), Timpani, Trumpet
-        'style': 'dynamic' # 強弱對比大
-    },
-    {
-        'id': 'rice_field', 'name': '三奇美徑', 'emoji': '🌾',
-        'bpm': 100, 'scale': 'pentatonic_major', 'key': 64, # E Pentatonic
-        'progression': [1, 4, 5, 1],
-        'instruments': [68, 75, 12], # Oboe, Pan Flute, Marimba
-        'style': 'bouncy' # 輕快跳躍
-    },
-    {
-        'id': 'farm', 'name': '宜農牧場', 'emoji': '🐑',
-        'bpm': 120, 'scale': 'major', 'key': 60, # C Major
-        'progression': [1, 4, 1, 5],
-        'instruments': [108, 113, 14], # Kalimba, Agogo, Tubular Bells
-        'style': 'playful' # 斷奏、可愛
-    },
-    {
-        'id': 'fire_water', 'name': '水火同源', 'emoji': '🔥',
-        'bpm': 60, 'scale': 'minor', 'key': 59, # B Minor (神秘)
-        'progression': [6, 4, 1, 5],
-        'instruments': [53, 95, 89], # Voice Oohs, Sweep Pad, Warm Pad
-        'style': 'drone' # 長音鋪底
-    },
-    {
-        'id': 'forest', 'name': '仁山植物園', 'emoji': '🌿',
-        'bpm': 70, 'scale': 'lydian', 'key': 69, # A Lydian (夢幻)
-        'progression': [1, 2, 1, 5],
-        'instruments': [46, 73, 49], # Harp, Flute, Slow Strings
-        'style': 'magical' # 豎琴琶音 + 長笛旋律
-    }
-]
+# 各主題的配樂參數 (seed, bpm, scale, key, progression, instruments, style)
+# 來自 catalog.json；THEMES 為預設導覽的主題
+THEMES = [catalog.bgm_theme(t) for t in catalog.get_tour()[1]['themes']]
 
 # ════════════════════════════════════════════════════════════
 # 4. MIDI 生成邏輯
@@ -139,99 +110,96 @@ def get_chord_notes(root, scale_type, degree):
         
     return [n1, n3, n5]
 
-def gen_note_events(theme, duration_sec):
-    events = []
-    bpm = theme['bpm']
-    beat_dur = 60.0 / bpm
-    total_beats = int(duration_sec / beat_dur)
+# 各風格的伴奏型：每小節的 (拍位置, 和弦音索引, 長度, 力度)，依加入順序排列
+HARMONY_PATTERNS = {
+    'rhythmic': [(b, i, 0.5, 70) for b in range(4) for i in range(3)],  # 每拍一下
+    'flowing': [(b, i, 1, 75) for b, i in enumerate([0, 1, 2, 1])],     # 琶音 根-三-五-三
+    'drone': [(0, i, 4, 60) for i in range(3)],                         # 長和弦
+    'default': [(b, i, 2, 70) for i in range(3) for b in (0, 2)],       # 柱狀和弦每兩拍
+}
+
+@lru_cache(maxsize=None)
+def chord_table(root, scale_type, progression):
+    # 和弦進行每個級數的三和弦，只算一次
+    return tuple(tuple(get_chord_notes(root, scale_type, d)) for d in progression)
+
+@lru_cache(maxsize=None)
+def scale_table(root, scale_type):
+    # 旋律可用的兩個八度音階音
+    intervals = SCALES[scale_type]
+    return tuple([root + i for i in intervals] + [root + i + 12 for i in intervals])
+
+def gen_note_events(theme, duration_sec, rng=None, bars=None):
+    # 回傳 (notes, programs)：notes 為 midi_events.NOTE_DTYPE 陣列，
+    # 各聲部內依生成順序排列；programs 為 [(ch, 樂器編號), ...]
+    # rng 為 random.Random，未指定時以主題的種子建立，同一種子必定得到同一首曲子
+    # 指定 bars 時改為剛好產生 bars 小節 (忽略 duration_sec)
+    rng = rng or random.Random(theme['seed'])
+    if bars is None:
+        beat_dur = 60.0 / theme['bpm']
+        total_beats = int(duration_sec / beat_dur)
+        n_bars = -(-total_beats // 4)
+    else:
+        n_bars = bars
     
     scale_type = theme['scale']
     root_key = theme['key']
-    progression = theme['progression']
     style = theme.get('style', 'chord')
+    chords = chord_table(root_key, scale_type, tuple(theme['progression']))
+    scale_notes = scale_table(root_key, scale_type)
     
-    # 配器
-    instr_melody = theme['instruments'][0]
-    instr_harmony = theme['instruments'][1]
-    instr_bass = theme['instruments'][2]
-
-    # 設定樂器 (Program Change)
-    events.append({'t': 0, 'type': 'program', 'ch': 0, 'val': instr_melody})
-    events.append({'t': 0, 'type': 'program', 'ch': 1, 'val': instr_harmony})
-    events.append({'t': 0, 'type': 'program', 'ch': 2, 'val': instr_bass})
-
-    # 生成循環
-    current_beat = 0
-    prog_idx = 0
+    # 配器 (Program Change)：ch 0 旋律、ch 1 和聲、ch 2 低音
+    programs = [(ch, theme['instruments'][ch]) for ch in range(3)]
+
+    bar_start = np.arange(n_bars) * 4.0
+    bar_chords = np.array(chords)[np.arange(n_bars) % len(chords)]
     
-    while current_beat < total_beats:
-        degree = progression[prog_idx % len(progression)]
-        chord_notes = get_chord_notes(root_key, scale_type, degree)
-        
-        # Bass (Channel 2) - 根音長音
-        bass_note = chord_notes[0] - 12 # 低八度
-        events.append({'t': current_beat, 'dur': 4, 'note': bass_note, 'vel': 90, 'ch': 2})
-
-        # Harmony (Channel 1) - 根據風格
-        if style == 'rhythmic':
-            # 每拍一下
-            for b in range(4):
-                for n in chord_notes:
-                    events.append({'t': current_beat + b, 'dur': 0.5, 'note': n, 'vel': 70, 'ch': 1})
-        elif style == 'flowing':
-            # 琶音
-            pat = [0, 1, 2, 1] # 根-三-五-三
-            for b in range(4):
-                n = chord_notes[pat[b]]
-                events.append({'t': current_beat + b, 'dur': 1, 'note': n, 'vel': 75, 'ch': 1})
-        elif style == 'drone':
-             # 長和弦
-             for n in chord_notes:
-                 events.append({'t': current_beat, 'dur': 4, 'note': n, 'vel': 60, 'ch': 1})
-        else:
-             # Default: 柱狀和弦每兩拍
-             for n in chord_notes:
-                 events.append({'t': current_beat, 'dur': 2, 'note': n, 'vel': 70, 'ch': 1})
-                 events.append({'t': current_beat + 2, 'dur': 2, 'note': n, 'vel': 70, 'ch': 1})
-
-        # Melody (Channel 0) - 隨機漫步
-        # 在和弦音與音階音中隨機
-        scale_intervals = SCALES[scale_type]
-        scale_notes = [root_key + i for i in scale_intervals] + [root_key + i + 12 for i in scale_intervals]
-        
-        # 簡單旋律生成邏輯
-        num_notes = 4 if style in ['rhythmic', 'bouncy'] else 2
+    # Bass (Channel 2) - 根音長音，低八度
+    bass = midi_events.empty_notes(n_bars)
+    bass['t'] = bar_start
+    bass['dur'] = 4
+    bass['note'] = bar_chords[:, 0] - 12
+    bass['vel'] = 90
+    bass['ch'] = 2
+
+    # Harmony (Channel 1) - 根據風格的伴奏型鋪滿每一小節
+    pattern = HARMONY_PATTERNS.get(style, HARMONY_PATTERNS['default'])
+    beat, idx, dur, vel = (np.array(col) for col in zip(*pattern))
+    harmony = midi_events.empty_notes(n_bars * len(pattern))
+    harmony['t'] = (bar_start[:, None] + beat).ravel()
+    harmony['dur'] = np.tile(dur, n_bars)
+    harmony['note'] = bar_chords[:, idx].ravel()
+    harmony['vel'] = np.tile(vel, n_bars)
+    harmony['ch'] = 1
+
+    # Melody (Channel 0) - 隨機漫步，在和弦音與音階音中隨機
+    # 亂數的取用順序與逐小節生成時相同，同一個種子得到同樣的旋律
+    num_notes = 4 if style in ['rhythmic', 'bouncy'] else 2
+    step = 4 / num_notes
+    melody = midi_events.empty_notes(n_bars * num_notes)
+    count = 0
+    for bar in range(n_bars):
+        chord_notes = chords[bar % len(chords)]
         for i in range(num_notes):
-            step = 4 / num_notes
-            if random.random() > 0.3: # 70% 機率有音符
-                note = random.choice(scale_notes)
+            if rng.random() > 0.3: # 70% 機率有音符
+                note = rng.choice(scale_notes)
                 # 傾向選和弦內音
-                if random.random() > 0.5:
-                    note = random.choice(chord_notes) + (12 if random.random()>0.5 else 0)
+                if rng.random() > 0.5:
+                    note = rng.choice(chord_notes) + (12 if rng.random()>0.5 else 0)
                 
-                dur = step * (random.choice([0.5, 1.0]))
-                vel = random.randint(80, 110)
-                events.append({'t': current_beat + (i*step), 'dur': dur, 'note': note, 'vel': vel, 'ch': 0})
-
-        current_beat += 4
-        prog_idx += 1
-        
-    return events
+                dur = step * (rng.choice([0.5, 1.0]))
+                vel = rng.randint(80, 110)
+                melody[count] = (bar * 4 + i * step, dur, note, vel, 0)
+                count += 1
+    
+    notes = np.concatenate([melody[:count], harmony, bass])
+    return notes, programs
 
 def events_to_midi(events, theme, filename):
-    mid = MIDIFile(3) # 3 tracks
-    bpm = theme['bpm']
-    
-    mid.addTempo(0, 0, bpm)
-    
-    for e in events:
-        if e['type'] == 'program':
-            mid.addProgramChange(e['ch'], e['ch'], e['t'], e['val'])
-        else:
-            mid.addNote(e['ch'], e['ch'], e['note'], e['t'], e['dur'], e['vel'])
-            
-    with open(filename, "wb") as output_file:
-        mid.writeFile(output_file)
+    # 直接寫出 SMF，內容與 midiutil 逐一 addNote 的結果相同
+    notes, programs = events
+    with tracing.span('write_smf', 'midi', notes=len(notes)):
+        midi_events.write_smf(filename, notes, programs, theme['bpm'], num_tracks=3)
 
 # ════════════════════════════════════════════════════════════
 # 5. 渲染與轉檔
@@ -246,71 +214,377 @@ def midi_to_wav_fluidsynth(midi_path, wav_path):
         '-F', wav_path, '-r', str(SAMPLE_RATE), '-g', '1.0'
     ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        tracing.run(cmd, outputs=(wav_path,), check=True,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return True
     except:
         return False
 
-def call_pedalboard_script(theme_id, input_wav, output_wav):
-    # 呼叫外部 script: apply_pedalboard.py <theme> <in> <out>
-    cmd = [sys.executable, "apply_pedalboard.py", theme_id, input_wav, output_wav]
+def apply_theme_fx(theme_id, input_wav, output_wav):
+    # 在同一行程內套用效果，效果鏈由 apply_pedalboard 快取重複使用
     try:
-        subprocess.run(cmd, check=True)
+        with tracing.span(theme_id, 'pedalboard', bytes_read=os.path.getsize(input_wav)) as sp:
+            ok = apply_fx(theme_id, input_wav, output_wav)
+            if ok:
+                sp.set(bytes_written=os.path.getsize(output_wav))
+        return ok
+    except Exception as e:
+        print(f"    [!] Pedalboard 失敗: {e}")
+        return False
+
+def _read_blocks(stream, channels=2, block_frames=STREAM_BLOCK_FRAMES):
+    # 從管線讀取交錯的 float32 PCM，每次回傳 (frames, channels) 陣列
+    frame_bytes = 4 * channels
+    while True:
+        data = stream.read(block_frames * frame_bytes)
+        usable = len(data) - len(data) % frame_bytes
+        if usable:
+            yield np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, channels)
+        if len(data) < block_frames * frame_bytes:
+            return
+
+def mp3_tags(theme, seed):
+    # 寫入 MP3 的 ID3 標籤；種子記在檔案裡，之後可據此重新生成同一首
+    return ['-metadata', f"title={theme['name']}", '-metadata', f"seed={seed}"]
+
+def midi_to_mp3_stream(theme_id, midi_path, mp3_path, tags=()):
+    # FluidSynth → Pedalboard (逐塊) → ffmpeg，全程走管線不落地 WAV；
+    # 合成仍在進行時編碼器就已開始工作
+    if not os.path.exists(FLUIDSYNTH_CMD):
+        return False
+    if not os.path.exists(SOUNDFONT_PATH):
+        print(f"    [!] 找不到音色庫: {SOUNDFONT_PATH}")
+        return False
+    
+    synth_cmd = [
+        FLUIDSYNTH_CMD, '-ni', '-q', '-T', 'raw', '-O', 'float',
+        '-F', '-', '-r', str(SAMPLE_RATE), '-g', '1.0',
+        SOUNDFONT_PATH, midi_path
+    ]
+    encode_cmd = [
+        ffmpeg_tool.ffmpeg(), '-y', '-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ac', '2',
+        '-i', 'pipe:0', '-b:a', BGM_BITRATE, *tags, mp3_path
+    ]
+    try:
+        synth = subprocess.Popen(synth_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return False
+    try:
+        encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        synth.kill()
+        synth.wait()
+        return False
+    
+    # 三者同時進行，整段記為一個區段
+    with tracing.span(theme_id, 'stream', bytes_read=os.path.getsize(SOUNDFONT_PATH)) as sp:
+        piped, ok = 0, False
+        try:
+            blocks = _read_blocks(synth.stdout)
+            for block in process_stream(theme_id, blocks, SAMPLE_RATE):
+                data = np.ascontiguousarray(block, dtype=np.float32).tobytes()
+                encoder.stdin.write(data)
+                piped += len(data)
+            encoder.stdin.close()
+            ok = True
+        except Exception as e:
+            print(f"    [!] 串流渲染失敗: {e}")
+        finally:
+            # 任何錯誤都先終止兩個行程並關閉管線，否則 ffmpeg 等不到 EOF，wait() 永遠不會回傳
+            if not ok:
+                synth.kill()
+                encoder.kill()
+            for pipe in (encoder.stdin, synth.stdout):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+            synth_rc = synth.wait()
+            encode_rc = encoder.wait()
+        written = os.path.getsize(mp3_path) if os.path.exists(mp3_path) else 0
+        sp.set(bytes_piped=piped, bytes_written=written)
+    return ok and synth_rc == 0 and encode_rc == 0
+
+def pcm_to_mp3(audio, mp3_path, tags=()):
+    try:
+        numpy_mixer.encode(audio, mp3_path, sample_rate=SAMPLE_RATE,
+                           extra_args=['-b:a', BGM_BITRATE, *tags])
         return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"    [!] MP3 編碼失敗: {e}")
+        return False
+
+def synth_to_mp3_numpy(theme, events, mp3_path, tags=()):
+    # 內建合成器 → Pedalboard → ffmpeg，音訊全程留在記憶體中
+    notes, programs = events
+    try:
+        with tracing.span(theme['id'], 'soft_synth', notes=len(notes)):
+            audio = soft_synth.render(notes, programs, theme['bpm'], SAMPLE_RATE)
+        with tracing.span(theme['id'], 'pedalboard'):
+            audio = process(theme['id'], audio, SAMPLE_RATE)
+    except Exception as e:
+        print(f"    [!] 內建合成 / Pedalboard 失敗: {e}")
+        return False
+    return pcm_to_mp3(audio, mp3_path, tags)
+
+def loop_bars_for(theme, loop_bars):
+    # 0 表示剛好一輪和弦進行
+    return loop_bars or len(theme['progression'])
+
+def make_seamless(theme_id, dry, loop_len, sample_rate):
+    # 1. 合成器超出循環長度的釋音尾巴折回開頭
+    loop = np.zeros((loop_len, dry.shape[1]), dtype=np.float32)
+    for start in range(0, len(dry), loop_len):
+        seg = dry[start:start + loop_len]
+        loop[:len(seg)] += seg
+    # 2. 效果鏈連續處理數輪，取最後一輪：此時前一輪的殘響、延遲已疊進開頭，
+    #    首尾相接時與連續播放完全相同
+    reps = 1 + max(1, -(-int(LOOP_FX_WARMUP_SEC * sample_rate) // loop_len))
+    wet = process(theme_id, np.tile(loop, (reps, 1)), sample_rate)
+    return np.ascontiguousarray(wet[-loop_len:], dtype=np.float32)
+
+def render_loop(theme, events, synth, midi_path, mp3_path, bars, tags=()):
+    # 只渲染 bars 小節，輸出可無縫循環的 MP3
+    tid = theme['id']
+    loop_len = int(round(bars * 4 * 60.0 / theme['bpm'] * SAMPLE_RATE))
+    if synth == 'numpy':
+        notes, programs = events
+        with tracing.span(tid, 'soft_synth', notes=len(notes)):
+            dry = soft_synth.render(notes, programs, theme['bpm'], SAMPLE_RATE)
+    else:
+        with tempfile.TemporaryDirectory(prefix=f"bgm_{tid}_") as tmp_dir:
+            raw_wav = os.path.join(tmp_dir, f"raw_{tid}.wav")
+            if not midi_to_wav_fluidsynth(midi_path, raw_wav):
+                print("    [!] FluidSynth not found, skipping synthesis.")
+                return False
+            dry, _ = sf.read(raw_wav, dtype='float32', always_2d=True)
+    try:
+        with tracing.span(tid, 'pedalboard', loop=True):
+            audio = make_seamless(tid, dry, loop_len, SAMPLE_RATE)
     except Exception as e:
         print(f"    [!] Pedalboard 失敗: {e}")
         return False
+    print(f"    循環長度: {bars} 小節 ({loop_len / SAMPLE_RATE:.2f}s)")
+    return pcm_to_mp3(audio, mp3_path, tags)
 
-def wav_to_mp3(wav_path, mp3_path):
-    # FFMPEG is assumed in path or we just use wav
+def wav_to_mp3(wav_path, mp3_path, tags=()):
     # For this task, let's keep it as wav if ffmpeg fails, or simple copy
     # But user wants mp3 usually.
-    cmd = ['ffmpeg', '-y', '-i', wav_path, '-b:a', '192k', mp3_path]
+    cmd = [ffmpeg_tool.ffmpeg(), '-y', '-i', wav_path, '-b:a', BGM_BITRATE, *tags, mp3_path]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        tracing.run(cmd, outputs=(mp3_path,), check=True,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return True
     except:
         return False
 
+def resolve_synth(synth=None):
+    synth = synth or SYNTH_BACKEND
+    if synth == 'auto':
+        return 'fluidsynth' if os.path.exists(FLUIDSYNTH_CMD) else 'numpy'
+    return synth
+
+def bgm_key(theme, synth=None, seed=None, loop_bars=LOOP_BARS):
+    params = {
+        'theme': theme,
+        'seed': theme['seed'] if seed is None else seed,
+        'duration': DEFAULT_DURATION,
+        'loop_bars': None if loop_bars is None else loop_bars_for(theme, loop_bars),
+        'sample_rate': SAMPLE_RATE,
+        'synth': resolve_synth(synth),
+        'soundfont': os.path.basename(SOUNDFONT_PATH),
+        'fx': describe_preset(theme['id']),
+        'bitrate': BGM_BITRATE,
+        'version': BGM_VERSION,
+    }
+    return artifact_store.make_key('bgm', params)
+
+def bgm_path(theme, seed=None, tour=None):
+    # seed 為 None 是主題的正式配樂；指定種子時為變奏版本，檔名帶上種子
+    # 位置依導覽的佈局而定 (見 catalog.py)
+    if seed is None:
+        return catalog.bgm_path(tour, theme['id'])
+    return os.path.join(catalog.theme_dir(VARIANT_DIR, tour), f"bgm_{theme['id']}_s{seed}.mp3")
+
+def midi_path_for(theme, seed=None, tour=None):
+    if seed is None:
+        return catalog.midi_path(tour, theme['id'])
+    return os.path.join(catalog.theme_dir(VARIANT_DIR, tour), f"bgm_{theme['id']}_s{seed}.mid")
+
+def variant_seeds(theme, count, base_seed=None):
+    # 每個主題 count 個變奏，種子由 base_seed (預設為主題種子) 起連續編號
+    start = theme['seed'] if base_seed is None else base_seed
+    return [start + i for i in range(count)]
+
+def plan(themes, synth=None, loop_bars=LOOP_BARS, tour=None):
+    # {tid: 'fresh' | 'restore' | 'build'}
+    return {t['id']: artifact_store.status(bgm_path(t, None, tour), bgm_key(t, synth, None, loop_bars))
+            for t in themes}
+
+def render_theme(theme, stream=False, force=False, synth=None, seed=None, loop_bars=LOOP_BARS,
+                 tour=None):
+    # MIDI → FluidSynth (或內建合成器) → Pedalboard → MP3；成功產出 MP3 時回傳 True
+    # seed 為 None 時以主題種子產生正式配樂，否則產生該種子的變奏版本
+    # loop_bars 不為 None 時只渲染一段可無縫循環的配樂
+    synth = resolve_synth(synth)
+    tid = theme['id']
+    name = theme['name']
+    mp3_path = bgm_path(theme, seed, tour)
+    midi_path = midi_path_for(theme, seed, tour)
+    seed = theme['seed'] if seed is None else seed
+    print(f"\n  [{tid}] {name} {theme['emoji']} (seed {seed})")
+    
+    # 0. 參數與設定都沒變時沿用快取的產物
+    key = bgm_key(theme, synth, seed, loop_bars)
+    state = artifact_store.status(mp3_path, key)
+    if not force and state == 'fresh':
+        print(f"    已是最新，略過: {mp3_path}")
+        return True
+    if not force and state == 'restore':
+        artifact_store.restore(mp3_path, key, 'bgm')
+        print(f"    由快取取回: {mp3_path}")
+        return True
+    
+    # 1. MIDI
+    os.makedirs(os.path.dirname(mp3_path), exist_ok=True)
+    os.makedirs(os.path.dirname(midi_path), exist_ok=True)
+    bars = None if loop_bars is None else loop_bars_for(theme, loop_bars)
+    events = gen_note_events(theme, DEFAULT_DURATION, random.Random(seed), bars)
+    events_to_midi(events, theme, midi_path)
+    print(f"    MIDI Created: {midi_path}")
+    tags = mp3_tags(theme, seed)
+    
+    if bars is not None:
+        ok = render_loop(theme, events, synth, midi_path, mp3_path, bars, tags)
+        if ok:
+            artifact_store.commit(mp3_path, key, 'bgm')
+            print(f"    MP3 Final (loop): {mp3_path}")
+        return ok
+    
+    if synth == 'numpy':
+        ok = synth_to_mp3_numpy(theme, events, mp3_path, tags)
+        if ok:
+            artifact_store.commit(mp3_path, key, 'bgm')
+            print(f"    MP3 Final (內建合成器): {mp3_path}")
+        return ok
+    
+    if stream:
+        ok = midi_to_mp3_stream(tid, midi_path, mp3_path, tags)
+        if ok:
+            artifact_store.commit(mp3_path, key, 'bgm')
+            print(f"    MP3 Final (stream): {mp3_path}")
+        else:
+            print("    [!] 串流渲染失敗 (FluidSynth / ffmpeg 無法使用)")
+        return ok
+    
+    # 2~3. 中間 WAV 放在各自的暫存目錄，平行渲染時互不干擾
+    with tempfile.TemporaryDirectory(prefix=f"bgm_{tid}_") as tmp_dir:
+        raw_wav = os.path.join(tmp_dir, f"raw_{tid}.wav")
+        if not midi_to_wav_fluidsynth(midi_path, raw_wav):
+            print("    [!] FluidSynth not found, skipping synthesis.")
+            return False
+
+        # 3. Apply Pedalboard FX -> Final Wav
+        fx_wav = os.path.join(tmp_dir, f"fx_{tid}.wav")
+        if not apply_theme_fx(tid, raw_wav, fx_wav):
+            return False
+        
+        # 4. MP3
+        ok = wav_to_mp3(fx_wav, mp3_path, tags)
+        print(f"    MP3 Final: {mp3_path}")
+    if ok:
+        artifact_store.commit(mp3_path, key, 'bgm')
+    return ok
+
+def _render_timed(theme, stream=False, force=False, synth=None, seed=None, loop_bars=LOOP_BARS,
+                  tour=None):
+    start = time.perf_counter()
+    ok = render_theme(theme, stream, force, synth, seed, loop_bars, tour)
+    label = theme['id'] if seed is None else f"{theme['id']}_s{seed}"
+    return label, ok, time.perf_counter() - start
+
+def render_all(themes, workers=1, stream=False, force=False, synth=None,
+               variants=0, base_seed=None, loop_bars=LOOP_BARS, tour=None):
+    # workers > 1 時以多個行程同時渲染；回傳 [(名稱, ok, 秒數), ...]
+    # variants > 0 時改為每個主題產生 variants 個指定種子的變奏
+    if variants:
+        jobs = [(theme, seed) for theme in themes
+                for seed in variant_seeds(theme, variants, base_seed)]
+    else:
+        jobs = [(theme, None) for theme in themes]
+    if workers <= 1:
+        return [_render_timed(theme, stream, force, synth, seed, loop_bars, tour) for theme, seed in jobs]
+    
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for theme, seed in jobs:
+            label = theme['id'] if seed is None else f"{theme['id']}_s{seed}"
+            futures[pool.submit(_render_timed, theme, stream, force, synth, seed, loop_bars, tour)] = label
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"    [!] {futures[future]} 渲染失敗: {e}")
+                results.append((futures[future], False, 0.0))
+    order = list(futures.values())
+    return sorted(results, key=lambda r: order.index(r[0]))
+
+def set_preview():
+    global DEFAULT_DURATION, SAMPLE_RATE, BGM_BITRATE, SYNTH_BACKEND
+    DEFAULT_DURATION = PREVIEW_DURATION
+    SAMPLE_RATE = PREVIEW_SAMPLE_RATE
+    BGM_BITRATE = PREVIEW_BITRATE
+    SYNTH_BACKEND = 'numpy'
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="冬山主題配樂生成")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="同時渲染的行程數，0 = 使用全部 CPU 核心")
+    parser.add_argument('--stream', action='store_true',
+                        help="以管線串流渲染，不寫中間 WAV 檔 (FluidSynth)")
+    parser.add_argument('--force', action='store_true',
+                        help="忽略產物快取，全部重新渲染")
+    parser.add_argument('--synth', choices=['auto', 'fluidsynth', 'numpy'], default=SYNTH_BACKEND,
+                        help="合成方式；auto 在找不到 FluidSynth 時改用內建 NumPy 合成器")
+    parser.add_argument('--loop', type=int, nargs='?', const=0, default=LOOP_BARS, metavar='BARS',
+                        help="只渲染 BARS 小節的無縫循環配樂；不指定 BARS 時為一輪和弦進行")
+    parser.add_argument('--variants', type=int, default=0,
+                        help=f"每個主題產生 N 個變奏，輸出到 {VARIANT_DIR}/ (檔名帶種子)")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="變奏的起始種子，預設為各主題的種子")
+    ffmpeg_tool.add_args(parser)
+    catalog.add_selector_args(parser)
+    args = parser.parse_args(argv)
+    ffmpeg_tool.apply_args(args)
+    if args.workers <= 0:
+        args.workers = os.cpu_count() or 1
+    return args
+
 def main():
+    args = parse_args()
     os.makedirs(MIDI_DIR, exist_ok=True)
     os.makedirs(MP3_DIR, exist_ok=True)
     
-    print("🎵 開始生成冬山主題配樂...")
+    # 只選到個別場景時配樂不受影響，沒有要渲染的主題
+    selection = catalog.Selection.from_args(args)
+    themes = [catalog.bgm_theme(t) for t, _ in selection.themes if t['id'] in selection.bgm_themes]
+    jobs = len(themes) * (args.variants or 1)
+    workers = max(1, min(args.workers, jobs))
+    synth = resolve_synth(args.synth)
+    print(f"🎵 開始生成冬山主題配樂... ({workers} 個行程, 合成: {synth})")
     
-    import tempfile
+    start = time.perf_counter()
+    results = render_all(themes, workers, args.stream, args.force, synth,
+                         args.variants, args.seed, args.loop, selection.tour)
+    wall = time.perf_counter() - start
     
-    for theme in THEMES:
-        tid = theme['id']
-        name = theme['name']
-        print(f"\n  [{tid}] {name} {theme['emoji']}")
-        
-        # 1. MIDI
-        midi_path = os.path.join(MIDI_DIR, f"bgm_{tid}.mid")
-        events = gen_note_events(theme, DEFAULT_DURATION)
-        events_to_midi(events, theme, midi_path)
-        print(f"    MIDI Created: {midi_path}")
-        
-        # 2. Wav (Raw)
-        raw_wav = os.path.join(MIDI_DIR, f"raw_{tid}.wav") # Temp
-        if midi_to_wav_fluidsynth(midi_path, raw_wav):
-            # 3. Apply Pedalboard FX -> Final Wav
-            fx_wav = os.path.join(MIDI_DIR, f"fx_{tid}.wav") # Temp
-            call_pedalboard_script(tid, raw_wav, fx_wav)
-            
-            # 4. MP3
-            mp3_path = os.path.join(MP3_DIR, f"bgm_{tid}.mp3")
-            wav_to_mp3(fx_wav, mp3_path)
-            print(f"    MP3 Final: {mp3_path}")
-            
-            # Cleanup
-            try:
-                os.remove(raw_wav)
-                os.remove(fx_wav)
-            except: pass
-            
-        else:
-            print("    [!] FluidSynth not found, skipping synthesis.")
+    print("\n  ⏱️ 各主題耗時:")
+    for tid, ok, elapsed in results:
+        mark = "✓" if ok else "✗"
+        print(f"    {mark} {tid:<18} {elapsed:6.1f}s")
+    print(f"    總計 {wall:.1f}s (各主題加總 {sum(r[2] for r in results):.1f}s)")
             
     print("\n✅ BGM 生成完成！")
 
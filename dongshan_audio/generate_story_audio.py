@@ -1,413 +1,236 @@
+import argparse
 import asyncio
 import os
 import sys
 from edge_tts import Communicate
 
+import catalog
+import tts_cache
+import tts_chunks
+from tts_queue import TTSScheduler, summarize
+
 # 讓 Windows 終端機顯示 Emoji 正常
 if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
     sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 
-# 輸出目錄
-OUTPUT_DIR = "tts_audio"
+# 輸出目錄 (腳本資料在 catalog.json，各導覽的檔案位置見 catalog.tts_path)
+OUTPUT_DIR = catalog.TTS_DIR
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# 語音設定
-VOICE = "zh-TW-HsiaoChenNeural"
-
-# 腳本資料 (來自使用者提供)
-FILES = {
-    # ══ 歡迎語 ══════════════════════════════════════════════════
-    1: ("welcome",
-        "歡迎來到冬山鄉探險隊！宜蘭縣冬山鄉是一個充滿驚喜的地方。"
-        "這裡有全台最美麗的火車站、神秘的水上森林、四季如畫的梅花湖、"
-        "壯觀的雙層瀑布、彩色的稻田熱氣球、可愛的山羊牧場，"
-        "還有大自然的奇蹟水火同源，以及俯瞰蘭陽平原的精靈森林！"
-        "第一個，瓜棚火車站奇幻之旅。"
-        "第二個，神秘河道的水上冒險。"
-        "第三個，梅花湖的四季守護者。"
-        "第四個，追瀑布的小探險家。"
-        "第五個，彩稻田的熱氣球夢。"
-        "第六個，牧場小羊找媽媽。"
-        "第七個，水火同源的奇幻傳說。"
-        "第八個，仁山精靈森林的秘密。"
-        "你想去哪裡探險呢？"),
-
-    # ══ 🚂 主題0: 瓜棚火車站奇幻之旅 (00002~00009) ══════════════
-    2: ("train",
-        "第一幕，抵達神奇火車站。"
-        "從台北搭上火車，穿越雪山隧道，來到宜蘭冬山！"
-        "火車站好特別，有一個用白色鋼構搭成的巨大瓜棚屋頂，"
-        "像一顆巨大的冬瓜罩在上面，陽光透過薄膜灑下來，亮晶晶的！"),
-    3: ("train",
-        "第二幕，瓜棚的傳說。"
-        "冬山舊名叫做冬瓜山，因為鄉裡有一座形狀像冬瓜的小山。"
-        "火車站設計師為了紀念這個名字，把整個站設計成大瓜棚的形狀。"
-        "小智仰起頭，看著拱形的鋼樑，覺得自己進入了一個魔法世界。"),
-    4: ("train",
-        "第三幕，站長的邀請。"
-        "一位和藹的老站長走過來說：小朋友，你知道嗎？"
-        "每天有好多好多列車穿梭在宜蘭的山海之間。"
-        "晚上的瓜棚火車站，燈光亮起來，就像一個發光的大燈籠，漂亮極了！"),
-    5: ("train",
-        "第四幕，火車站下面的遊樂場。"
-        "火車站下方有一個超厲害的兒童遊戲場！"
-        "有磨石子溜滑梯、人工草皮、可以遮風避雨，"
-        "不管颳風下雨大太陽都能玩！小智和妹妹立刻衝下去玩！"),
-    6: ("train",
-        "第五幕，生態綠舟就在旁邊。"
-        "走出火車站，步行十分鐘就到了冬山河生態綠舟。"
-        "這裡是一個佔地十八公頃的大森林公園，冬山河就在旁邊靜靜流過。"
-        "小智深吸一口氣，好清新的空氣啊！"),
-    7: ("train",
-        "第六幕，等火車的時光。"
-        "傍晚，小智一家人在月台上等回程的火車。"
-        "夕陽把整個瓜棚染成金色，太美了！"
-        "路上有好多美食小攤，炸雞排、蔥油餅，香氣四溢，肚子餓了！"),
-    8: ("train",
-        "第七幕，夜晚的瓜棚燈光。"
-        "天漸漸黑了，火車站的燈光亮起來！"
-        "白色薄膜從裡面透出溫暖的光，整座火車站像一個巨大的冬瓜燈籠。"
-        "小智說：這是全台灣最美麗的火車站！"),
-    9: ("train",
-        "第八幕，帶著回憶回家。"
-        "火車緩緩進站，嗚嗚地鳴笛。小智跳上車，回頭看那個發光的瓜棚。"
-        "今天的冬山探險太棒了！他決定每年都要來這裡。"
-        "冬山火車站，下次再見！瓜棚火車站的故事說完了。"),
-
-    # ══ 🌊 主題1: 神秘河道的水上冒險 (00010~00017) ══════════════
-    10: ("river",
-         "第一幕，森林公園的入口。"
-         "冬山河生態綠舟是一個魔法森林公園！"
-         "走進去，大樹遮天，鳥聲四起，感覺像進入了叢林秘境。"
-         "公園裡保留了原始的植被，也是候鳥的重要棲息地。"),
-    11: ("river",
-         "第二幕，搭船出發！"
-         "哇！可以搭船遊冬山河！小花和媽媽坐上小船，划進河道。"
-         "河水清澈，可以看到水草搖晃。岸邊的大樹倒映在水面，好美！"
-         "船夫伯伯說：前方有一個神秘的地方要帶你們去！"),
-    12: ("river",
-         "第三幕，發現神秘河道。"
-         "船轉進一條窄窄的水道，兩邊是高聳的岩壁，光線變暗了。"
-         "這就是傳說中的神秘河道！岩縫裡有好多縫隙，"
-         "太陽光從縫隙間灑落下來，形成夢幻的光柱！小花驚叫：好漂亮！"),
-    13: ("river",
-         "第四幕，光影魔法。"
-         "光柱照在水面上，波光粼粼，像是有人在水裡撒了金粉。"
-         "洞穴的頂端有幾隻燕子，嗖嗖地飛過，蝙蝠也在深處躲著。"
-         "這裡是動物的秘密基地！小花屏住呼吸，生怕驚動牠們。"),
-    14: ("river",
-         "第五幕，候鳥大集合。"
-         "划出洞穴，前方是一大片濕地。"
-         "秋冬時節，好多候鳥從北方飛來冬山河度假，白鷺鷥、小水鴨一群群。"
-         "小花看到這些遠道而來的鳥兒，覺得冬山河真是個溫暖的地方！"),
-    15: ("river",
-         "第六幕，大地遊戲區。"
-         "上岸以後，有一個超大的大地遊戲區等著他們！"
-         "可以爬網、跑跑跳跳、踩高蹺，還有木橋和冬山河鐵路橋可以拍照。"
-         "小花和哥哥在橋上大喊：宜蘭，我愛你！"),
-    16: ("river",
-         "第七幕，濕地教室。"
-         "公園裡有個戶外濕地教室，老師帶大家認識各種水草和小生物。"
-         "水黽在水面上滑行，孑孓在水中翻轉，青蛙跳進水裡撲通一聲。"
-         "小花說：城市裡看不到這些東西，太珍貴了！"),
-    17: ("river",
-         "第八幕，冬山河的承諾。"
-         "夕陽西下，冬山河染成橘紅色。小花站在河邊許願。"
-         "她希望這條美麗的河，永遠保持清澈，永遠是候鳥的家。"
-         "只要我們保護環境，冬山河就會一直這麼美！神秘河道的故事說完了。"),
-
-    # ══ 🌺 主題2: 梅花湖的四季守護者 (00018~00025) ══════════════
-    18: ("lake",
-         "第一幕，三面環山的梅花湖。"
-         "梅花湖是一個天然蓄水池，三面環山，湖面的形狀看起來像一朵梅花，"
-         "所以才叫梅花湖。今天阿公帶小偉來騎自行車環湖！"),
-    19: ("lake",
-         "第二幕，環湖步道出發！"
-         "租了一台特別的木造自行車，小偉騎著它在湖邊小路上慢慢前行。"
-         "路旁有高大的樹，葉子在微風中搖晃，沙沙作響。"
-         "湖面上有幾隻白鷺鷥，悠悠地飛過去。好愜意啊！"),
-    20: ("lake",
-         "第三幕，吊橋上俯瞰全湖。"
-         "湖中間有一座吊橋，連接著湖中的小浮島！"
-         "小偉踩在吊橋上，腳下的橋板輕輕晃動，有點刺激又好玩。"
-         "從浮島上看整個梅花湖，哇，真的好像一朵梅花！"),
-    21: ("lake",
-         "第四幕，三清宮的傳說。"
-         "湖畔有一座宏偉的三清宮，是台灣的道教總廟！"
-         "宮殿依著山勢建造，金碧輝煌，氣勢非凡。"
-         "阿公說，從宮前可以俯瞰整個梅花湖，天氣好的時候還能看到龜山島！"),
-    22: ("lake",
-         "第五幕，湖畔美食大發現。"
-         "環湖步道旁邊有好多特色小吃！"
-         "有花生捲冰淇淋，軟軟甜甜、還有水煮玉米熱騰騰，"
-         "還有石花凍、大腸包小腸。小偉每樣都想吃，肚子撐爆了！"),
-    23: ("lake",
-         "第六幕，四季的梅花湖。"
-         "阿公說，梅花湖每個季節都不一樣。"
-         "春天花開，夏天碧綠，秋天楓紅，冬天霧氣繚繞像仙境。"
-         "小偉覺得，要來四次才能看完整個梅花湖的美！"),
-    24: ("lake",
-         "第七幕，夕陽映湖光。"
-         "黃昏時分，夕陽把整個湖面染成金紅色。"
-         "湖面上倒映著天空和山的影子，一動一靜，美得像一幅畫。"
-         "阿公說：這是冬山鄉最讓我驕傲的地方。小偉用力點點頭！"),
-    25: ("lake",
-         "第八幕，帶著梅花湖的記憶回家。"
-         "回程時，小偉買了一瓶石花凍當伴手禮。"
-         "他說，下次要帶同學一起來，讓大家都認識這個美麗的地方。"
-         "梅花湖，是藏在冬山鄉心臟裡的寶石！梅花湖的故事說完了。"),
-
-    # ══ 💧 主題3: 追瀑布的小探險家 (00026~00033) ══════════════
-    26: ("waterfall",
-         "第一幕，冬山河的源頭。"
-         "你知道冬山河從哪裡來嗎？就是從大山裡的新寮溪！"
-         "新寮瀑布步道就沿著新寮溪而建，是宜蘭最美麗的步道之一。"
-         "小安背起水壺，今天要去追瀑布！"),
-    27: ("waterfall",
-         "第二幕，走進森林秘境。"
-         "步道入口一進去，就是濃密的森林。"
-         "光線透過樹葉灑落，像是綠色的光幕。"
-         "小溪在步道旁邊流淌，水聲叮叮咚咚，涼爽的空氣讓人直呼舒服！"),
-    28: ("waterfall",
-         "第三幕，第一層瀑布出現了！"
-         "走了十分鐘，轟隆的水聲越來越大。"
-         "轉過一個彎，第一層瀑布出現了！白色的水從高處傾瀉而下，"
-         "水花濺起來，涼涼的落在臉上。小安張開雙臂：太棒了！"),
-    29: ("waterfall",
-         "第四幕，負離子森林浴。"
-         "在瀑布旁邊深深地呼吸。老師說，瀑布旁邊有很多負離子，"
-         "吸入人體以後，讓人感覺心情特別好、特別清醒！"
-         "小安吸了一大口空氣，整個人神清氣爽，腳步也輕盈了起來！"),
-    30: ("waterfall",
-         "第五幕，挑戰第二層瀑布。"
-         "繼續往上走，步道開始有點陡，但小安不怕！"
-         "爸爸說加油，媽媽遞上水壺，全家人一起往上爬。"
-         "沿途可以看到更多岩壁、苔蘚和小蕨類，每一步都是驚喜！"),
-    31: ("waterfall",
-         "第六幕，壯觀的雙層瀑布！"
-         "哇！第二層瀑布高達三十公尺！比六層樓還高！"
-         "水柱猛力衝落，發出轟隆隆的巨大聲響，"
-         "水霧瀰漫，小安感覺自己被大自然的力量完全包圍了！"),
-    32: ("waterfall",
-         "第七幕，大自然的教室。"
-         "步道全長只有一點五公里，但沿途可以學到好多東西。"
-         "台灣藍鵲在樹間飛過，蝴蝶在花叢裡跳舞，"
-         "小安掏出筆記本，把看到的每種生物都畫下來！"),
-    33: ("waterfall",
-         "第八幕，瀑布的心意。"
-         "下山的時候，小安回頭看了瀑布最後一眼。"
-         "他想到，這麼美的瀑布，是大山和雨水的禮物。"
-         "我們要好好愛護大自然，這樣冬山的山林才能永遠美麗。"
-         "追瀑布的故事說完了。"),
-
-    # ══ 🌾 主題4: 彩稻田的熱氣球夢 (00034~00041) ══════════════
-    34: ("riceField",
-         "第一幕，三奇美徑的稻田。"
-         "冬山鄉有一條隱藏版的伯朗大道，就是三奇美徑！"
-         "金黃色的稻穗在微風中輕輕搖曳，整片稻田就像一塊黃色的大地毯，好壯觀！"
-         "小晴踩著自行車，迫不及待地想進去！"),
-    35: ("riceField",
-         "第二幕，彩色稻田的藝術。"
-         "每年五月到七月，農夫叔叔們用三種不同顏色的稻米，"
-         "在稻田裡畫出一幅巨大的地景畫！"
-         "今年的圖案是一隻快樂的青蛙帶著小朋友在稻田裡玩耍，好可愛！"),
-    36: ("riceField",
-         "第三幕，登上觀景台。"
-         "稻田旁邊有一座六公尺高的觀景台！"
-         "小晴爬上去，整片彩色稻田盡收眼底，"
-         "從上面看，青蛙圖案非常清晰，她興奮地拍了好多照片！"),
-    37: ("riceField",
-         "第四幕，熱氣球升空囉！"
-         "忽然，遠方傳來巨大的火焰聲！"
-         "一個彩色的大氣球慢慢升起來，越升越高，越升越高，"
-         "像一顆彩色的大泡泡飄在藍天上！小晴高興地跳了起來：是熱氣球！"),
-    38: ("riceField",
-         "第五幕，空中俯瞰宜蘭。"
-         "小晴跟著爸媽也坐進熱氣球的吊籃裡！"
-         "氣球緩緩升空，地面越來越小，冬山鄉的稻田像一塊塊拼圖。"
-         "遠遠的可以看到海和龜山島，風輕輕吹過來，好像在飛翔！"),
-    39: ("riceField",
-         "第六幕，風箏節的天空。"
-         "除了熱氣球，還有風箏節！"
-         "各種形狀的風箏在天上飛，有龍形、魚形、還有獨角獸形。"
-         "小晴也放起了她的彩虹風箏，細線在手裡輕輕抖動，風箏越飛越高！"),
-    40: ("riceField",
-         "第七幕，農村音樂會。"
-         "夜幕降臨，稻田旁邊舉行了一場稻浪音樂會！"
-         "舞台就搭在稻田中間，四周是金色的稻穗，星光閃閃。"
-         "音樂輕柔地飄散在空氣中，這是只有冬山才有的浪漫！"),
-    41: ("riceField",
-         "第八幕，一粒米的感謝。"
-         "回家前，農夫叔叔送了小晴一小袋新米。"
-         "他說：這些稻米從插秧到收成，要四個月！每一粒都是我們的心血。"
-         "小晴輕輕握住那袋米，決定以後絕對不浪費每一粒飯。"
-         "彩稻田的故事說完了。"),
-
-    # ══ 🐑 主題5: 牧場小羊找媽媽 (00042~00049) ══════════════
-    42: ("farm",
-         "第一幕，宜農牧場的早晨。"
-         "宜農牧場在冬山鄉的柯林村，這裡三十年前是一片長滿柯仔樹的安靜村落。"
-         "清晨，陽光照進牧場，小羊們在草地上喝露水，好悠閒的一天開始了！"),
-    43: ("farm",
-         "第二幕，小羊媽媽不見了！"
-         "其中有一隻小白羊，牠叫做棉花。今天早上，棉花找不到媽媽了！"
-         "牠在牧場裡跑來跑去，叫著：媽媽！媽媽！小朋友也跟著一起幫忙找！"),
-    44: ("farm",
-         "第三幕，餵羊的時間。"
-         "小朋友排隊拿飼料，小羊們圍過來，濕濕的小鼻子直頂著手心！"
-         "棉花也過來了，把一整把飼料全部吃光，還用尾巴搖了又搖，表示很開心！"
-         "小朋友笑得合不攏嘴。"),
-    45: ("farm",
-         "第四幕，擠羊奶體驗！"
-         "牧場阿姨說：要學擠羊奶嗎？大家舉手！"
-         "小手輕輕握住羊奶頭，一擠，一道白色的羊奶噴出來，涼涼的！"
-         "牧場剛擠出來的羊奶，趁鮮喝一口，香醇又甜，比超市買的好喝一百倍！"),
-    46: ("farm",
-         "第五幕，找到棉花媽媽了！"
-         "在牧場的角落，大家找到了棉花媽媽！"
-         "原來她剛生了兩隻小小小羊，正在幫小寶貝舔毛呢！"
-         "棉花跑過去，和媽媽還有兩個小弟弟妹妹靠在一起，一家人團圓了！"),
-    47: ("farm",
-         "第六幕，兔子和孔雀的朋友。"
-         "牧場裡除了羊，還有兔子、麝香豬、天竺鼠和孔雀！"
-         "孔雀突然開屏，展開像彩虹一樣漂亮的大尾巴。"
-         "所有人都驚呼：哇！太美了！孔雀驕傲地走來走去，像個小明星。"),
-    48: ("farm",
-         "第七幕，羊奶冰淇淋真好吃！"
-         "DIY時間！大家一起做羊奶冰淇淋！"
-         "把羊奶、糖、香草攪拌在一起，裝進冰盒冷凍。"
-         "等了一下，挖出一球，冰涼香甜！是世界上最美味的冰淇淋！"),
-    49: ("farm",
-         "第八幕，帶著溫暖回家。"
-         "離開牧場前，棉花跑到柵欄邊，用大眼睛看著小朋友，好像在說謝謝。"
-         "農場的生活教會我們，動物和人是好朋友，大自然的食物都得來不易。"
-         "謝謝宜農牧場！牧場小羊的故事說完了。"),
-
-    # ══ 🔥 主題6: 水火同源的奇幻傳說 (00050~00057) ══════════════
-    50: ("firewire",
-         "第一幕，武淵的神秘地點。"
-         "在冬山鄉武淵，有一個全台灣最神奇的地方，叫做武淵水火同源。"
-         "天然瓦斯從地底下的水中冒出來，在水面上燃燒！"
-         "水和火共存，這在科學上叫天然氣湧泉，但對小朋友來說，這是魔法！"),
-    51: ("firewire",
-         "第二幕，火苗在水上跳舞。"
-         "小宇第一次看到水面上有火焰，嚇了一跳！"
-         "一圈一圈的小火苗，就在冒泡的水面上跳舞，藍色的、橘色的，忽大忽小。"
-         "他好想伸手去碰，媽媽趕緊抓住他：那很燙的！"),
-    52: ("firewire",
-         "第三幕，科學大解密。"
-         "工作人員叔叔解釋說：地底下有天然瓦斯，"
-         "它從地層的縫隙，從水底下冒出來，遇到空氣就燃燒了！"
-         "小宇說：所以火是從水裡長出來的！叔叔哈哈大笑：說得對極了！"),
-    53: ("firewire",
-         "第四幕，大碗公滑水道！"
-         "武淵這裡還有全宜蘭最大的碗公溜滑梯！"
-         "利用國道五號高架橋下的空間，鋪上人工草皮，"
-         "超大的碗公滑道，一坐進去就嗖的一聲衝下去，刺激到尖叫！"),
-    54: ("firewire",
-         "第五幕，天然湧泉泡腳。"
-         "碗公溜滑梯旁邊，有一個天然湧泉池！"
-         "把鞋子脫掉，把腳放進泉水裡，涼涼的、滑滑的。"
-         "爺爺坐在旁邊泡腳，閉上眼睛，臉上露出好幸福的笑容。"),
-    55: ("firewire",
-         "第六幕，水火同源的傳說。"
-         "老奶奶說，以前村裡的人看到水面上起火，都以為是妖怪！"
-         "後來才知道是天然氣，把它當作珍貴的自然奇景來保護。"
-         "小宇說：以前的人好有想像力！老奶奶笑著說：你也是！"),
-    56: ("firewire",
-         "第七幕，晚上更壯觀。"
-         "夜幕降臨，周圍變暗了，水面上的火焰更加明亮！"
-         "橘紅色的火光在黑暗中閃爍，映照在水面上，"
-         "小宇覺得自己站在一個神話故事的場景裡，真是太奇妙了！"),
-    57: ("firewire",
-         "第八幕，大自然的神奇禮物。"
-         "小宇回家後，向同學介紹水火同源。同學們都不相信水和火能共存！"
-         "他說：冬山鄉就有這樣的神奇地方，宜蘭真的好厲害。"
-         "歡迎大家親自去武淵看看，眼見為憑！水火同源的故事說完了。"),
-
-    # ══ 🌿 主題7: 仁山精靈森林的秘密 (00058~00065) ══════════════
-    58: ("forest",
-         "第一幕，歐風庭園登場。"
-         "仁山植物園就在冬山的山丘上，一進去，眼前出現了一個歐洲風格的美麗庭園！"
-         "修剪整齊的草坪、彩色的花圃、石頭鋪成的小徑，讓人以為飛到了歐洲。"),
-    59: ("forest",
-         "第二幕，追尋精靈的腳步。"
-         "相傳仁山植物園住著一群植物精靈，牠們負責照顧每一棵樹和每一朵花。"
-         "小草跟著媽媽走進步道，每走一步，都感覺有小精靈在葉子間躲躲藏藏。"
-         "你有看到了嗎？"),
-    60: ("forest",
-         "第三幕，金萱茶的故鄉。"
-         "仁山植物園位於中山村，這裡的氣候溫潤多霧，"
-         "孕育出全台灣聞名的金萱茶！"
-         "小草的奶奶說：金萱茶有一股淡淡的奶香味，是宜蘭最特別的味道。"),
-    61: ("forest",
-         "第四幕，俯瞰蘭陽平原。"
-         "沿著步道登到高點，哇！整個蘭陽平原盡收眼底！"
-         "綠色的稻田、蜿蜒的溪流、遠方的龜山島，還有藍色的太平洋。"
-         "小草張開雙臂：我是蘭陽平原的主人！"),
-    62: ("forest",
-         "第五幕，森林浴的療癒。"
-         "步道在樹林間穿行，腳踩著鬆軟的落葉，空氣裡有樹木的芬芳。"
-         "媽媽說：這種氣味叫做芬多精，樹木釋放出來保護自己，對人體也很有益處。"
-         "小草深吸一口氣，感覺整個人都放鬆了！"),
-    63: ("forest",
-         "第六幕，推車也能走的步道。"
-         "仁山植物園很貼心，步道坡度平緩，連推車和輪椅都能通行。"
-         "小草的爺爺坐在輪椅上，也能輕鬆欣賞美景！"
-         "小草牽著爺爺的手說：爺爺，這裡很漂亮吧？爺爺笑著點頭。"),
-    64: ("forest",
-         "第七幕，精靈出沒！"
-         "走著走著，忽然在樹梢間發現了一隻台灣藍鵲！"
-         "長長的藍色尾巴、鮮紅的嘴巴，就像童話裡的精靈鳥！"
-         "牠停在樹枝上，轉過頭看了小草一眼，然後展翅飛走，留下一片驚嘆。"),
-    65: ("forest",
-         "第八幕，植物園的秘密。"
-         "離開前，小草在留言本上寫下：仁山植物園是精靈住的地方，請大家輕聲走路，"
-         "不要破壞任何一草一木。它的秘密就是：每一棵植物，都是大地的寶貝。"
-         "帶著滿滿的感動，冬山探險隊的故事，圓滿結束了！"),
+# 語音設定檔：名稱 → 聲音、語速、音調
+# 預設設定檔輸出到 tts_audio/，其他各自輸出到 tts_audio/voices/<名稱>/，播放器切換時不必重建
+VOICE_PROFILES = {
+    'default': dict(voice="zh-TW-HsiaoChenNeural", rate="+0%", pitch="+0Hz"),
+    'male': dict(voice="zh-TW-YunJheNeural", rate="+0%", pitch="+0Hz"),
+    'kids': dict(voice="zh-TW-HsiaoYuNeural", rate="-20%", pitch="+2Hz"),   # 給幼兒聽的慢速版
 }
-
-
-async def gen_tts(text, out_path):
-    communicate = Communicate(text, VOICE)
-    await communicate.save(out_path)
+DEFAULT_VOICE = 'default'
+
+# 工作佇列設定 (Edge-TTS 允許一定程度併發，過快會被鎖)
+MAX_CONCURRENCY = 5
+REQUESTS_PER_SEC = 2.0
+REQUEST_TIMEOUT = 60.0
+MAX_RETRIES = 3
+
+
+def _communicate(text, voice, rate, pitch):
+    # edge-tts 7 起預設只回報句子邊界，需指定 WordBoundary；舊版沒有這個參數
+    try:
+        return Communicate(text, voice, rate=rate, pitch=pitch, boundary="WordBoundary")
+    except TypeError:
+        return Communicate(text, voice, rate=rate, pitch=pitch)
+
+
+async def gen_tts(text, out_path, **profile):
+    # 邊收邊寫：音訊片段一到就寫入 out_path (排程器給的暫存檔，成功後才改名)；
+    # profile 為 VOICE_PROFILES 的設定 (省略時用預設設定檔)；回傳字詞時間 [{'text', 'start', 'end'}] (秒)
+    profile = profile or VOICE_PROFILES[DEFAULT_VOICE]
+    words = []
+    with open(out_path, 'wb') as f:
+        async for chunk in _communicate(text, **profile).stream():
+            if chunk['type'] == 'audio':
+                f.write(chunk['data'])
+            elif chunk['type'] in ('WordBoundary', 'SentenceBoundary'):
+                start = chunk['offset'] / 1e7   # 100 ns 為單位
+                words.append({'text': chunk['text'], 'start': start,
+                              'end': start + chunk['duration'] / 1e7})
+    return words
+
+
+def _reporter(names):
+    def report(result):
+        name = names.get(result['path'], os.path.basename(result['path']))
+        if result['ok']:
+            print(f"  ✓ {name} ({result['elapsed']:.1f}s, 第 {result['attempts']} 次)")
+        else:
+            print(f"  [!] {name} 失敗: {result['error']}")
+    return report
+
+
+def parse_voices(spec):
+    # "default,kids" → ['default', 'kids']；"all" 為全部設定檔，空白時只有預設語音
+    # (每多一個設定檔，edge-tts 請求數就多一倍，需明確指定)
+    if spec == 'all':
+        return list(VOICE_PROFILES)
+    voices = [v for v in (spec or "").split(',') if v] or [DEFAULT_VOICE]
+    unknown = [v for v in voices if v not in VOICE_PROFILES]
+    if unknown:
+        raise ValueError(f"未知的語音設定檔: {', '.join(unknown)} (可用: {', '.join(VOICE_PROFILES)})")
+    return voices
+
+
+def scene_jobs(scenes, tour=None, voices=(DEFAULT_VOICE,)):
+    # catalog 的場景 × 語音設定檔 → [(text, out_path, 設定檔名稱), ...]
+    return [(s['text'], catalog.tts_path(tour, s['id'], None if v == DEFAULT_VOICE else v), v)
+            for v in voices for s in scenes]
+
+
+def _key(text, voice):
+    p = VOICE_PROFILES[voice]
+    return tts_cache.cache_key(text, p['voice'], p['rate'], p['pitch'])
+
+
+def make_scheduler(synth=gen_tts, rate=REQUESTS_PER_SEC):
+    # synth 可換成 fake_tts 的替身 (例如預覽模式)
+    return TTSScheduler(synth, concurrency=MAX_CONCURRENCY,
+                        rate=rate, timeout=REQUEST_TIMEOUT,
+                        retries=MAX_RETRIES)
+
+
+def chunk_keys(text, voice=DEFAULT_VOICE):
+    # [(段落文字, 快取鍵), ...]；短文只有一段，即整段文字
+    return [(chunk, _key(chunk, voice)) for chunk in tts_chunks.split_text(text)]
+
+
+def _chunks_cached(chunks):
+    return len(chunks) > 1 and all(tts_cache.has_blob(k) for _, k in chunks)
+
+
+def _join_chunks(key, chunks):
+    # 各段快取都在時串接成整段的快取檔 (各段都有字詞時間時一併合併)；回傳是否成功
+    tmp = tts_cache.blob_path(key) + ".part"
+    try:
+        durations = tts_chunks.concat_mp3([tts_cache.blob_path(k) for _, k in chunks], tmp)
+    except (OSError, ValueError) as e:
+        print(f"  [!] 串接分段失敗: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    parts = [tts_cache.load_words(k) for _, k in chunks]
+    if all(p is not None for p in parts):
+        tts_cache.save_words(key, tts_chunks.join_words(parts, durations))
+    os.replace(tmp, tts_cache.blob_path(key))
+    return True
+
+
+def _adoptable(manifest, fpath):
+    # 快取上線前合成的輸出 (manifest 沒有紀錄)：視為目前文字的結果收進快取，不重新合成
+    return not tts_cache.is_tracked(manifest, fpath) and os.path.exists(fpath)
+
+
+def plan_tts(jobs, manifest=None):
+    # 每個場景的狀態：'fresh' 已是最新 / 'restore' 由快取取回 / 'build' 需合成
+    if manifest is None:
+        manifest = tts_cache.load_manifest()
+    states = []
+    for text, fpath, voice in jobs:
+        key = _key(text, voice)
+        if tts_cache.is_up_to_date(manifest, fpath, key) or _adoptable(manifest, fpath):
+            states.append('fresh')
+        elif tts_cache.has_blob(key) or _chunks_cached(chunk_keys(text, voice)):
+            states.append('restore')
+        else:
+            states.append('build')
+    return states
+
+
+async def build_tts(jobs, scheduler=None, manifest=None):
+    # 只合成快取中沒有的場景；回傳 (命中, 新合成, 失敗, 重試)
+    # 各語音設定檔共用同一個排程器 (同一份速率限制) 與 manifest
+    if scheduler is None:
+        scheduler = make_scheduler()
+    if manifest is None:
+        manifest = tts_cache.load_manifest()
+
+    # 查快取：內容未變的場景直接沿用，不再呼叫 edge-tts
+    # 長文以句子分段，只合成快取中沒有的段落
+    hits, misses = 0, []
+    for text, fpath, voice in jobs:
+        key = _key(text, voice)
+        if _adoptable(manifest, fpath):
+            p = VOICE_PROFILES[voice]
+            tts_cache.adopt(manifest, fpath, key, p['voice'], p['rate'], p['pitch'])
+            hits += 1
+            continue
+        if tts_cache.is_up_to_date(manifest, fpath, key) or tts_cache.has_blob(key):
+            hits += 1
+            continue
+        chunks = chunk_keys(text, voice)
+        name = os.path.basename(fpath)
+        if voice != DEFAULT_VOICE:
+            name += f" ({voice})"
+        for i, (chunk, ckey) in enumerate(chunks, 1):
+            if not tts_cache.has_blob(ckey):
+                label = f"{name} [{i}/{len(chunks)}]" if len(chunks) > 1 else name
+                misses.append((chunk, label, ckey, voice))
+
+    # 並行生成：工作佇列限制併發與請求速率，單一請求失敗會重試，不會中斷整批
+    os.makedirs(tts_cache.CACHE_DIR, exist_ok=True)
+    pending = {key: (text, voice) for text, _, key, voice in misses}
+    names = {tts_cache.blob_path(key): label for _, label, key, _ in misses}
+    results = await scheduler.run(
+        [(text, tts_cache.blob_path(key), VOICE_PROFILES[voice])
+         for key, (text, voice) in pending.items()],
+        on_done=_reporter(names))
+    ok, failed, retried = summarize(results)
+    keys = {tts_cache.blob_path(key): key for key in pending}
+    for r in results:
+        if r['ok'] and r['meta']:
+            tts_cache.save_words(keys[r['path']], r['meta'])
+
+    # 將快取檔放到 tts_audio/ 並更新 manifest (合成失敗的場景保留舊檔)
+    for text, fpath, voice in jobs:
+        key = _key(text, voice)
+        chunks = chunk_keys(text, voice)
+        if not tts_cache.has_blob(key) and _chunks_cached(chunks):
+            if not _join_chunks(key, chunks):
+                failed += 1
+        if not tts_cache.has_blob(key):
+            continue
+        if not tts_cache.is_up_to_date(manifest, fpath, key):
+            tts_cache.materialize(key, fpath)
+        p = VOICE_PROFILES[voice]
+        tts_cache.record(manifest, fpath, key, p['voice'], p['rate'], p['pitch'],
+                         chunks=[k for _, k in chunks] if len(chunks) > 1 else ())
+    tts_cache.save_manifest(manifest)
+    return hits, ok, failed, retried
 
 
 async def main():
-    print("🎙️ 冬山鄉探險隊語音生成中...")
-    
-    tasks = []
-    
-    # 歡迎語特別處理
-    w_text = FILES[1][1]
-    w_path = os.path.join(OUTPUT_DIR, "00001.mp3")
-    print(f"  生成歡迎語 -> {w_path}")
-    tasks.append(gen_tts(w_text, w_path))
-    
-    # 處理其他場景 (2~65)
-    for i in range(2, 66):
-        if i not in FILES:
-            continue
-            
-        theme_key, text = FILES[i]
-        fname = f"{i:05d}.mp3"
-        fpath = os.path.join(OUTPUT_DIR, fname)
-        
-        # 簡單進度顯示
-        if (i - 2) % 8 == 0:
-             print(f"  正在處理主題 ({theme_key}) 起始編號 {i} ...")
-             
-        tasks.append(gen_tts(text, fpath))
-
-    # 並行生成 (Edge-TTS 允許一定程度併發)
-    # 分批執行以免請求過快被鎖
-    BATCH_SIZE = 5
-    for i in range(0, len(tasks), BATCH_SIZE):
-        batch = tasks[i:i+BATCH_SIZE]
-        await asyncio.gather(*batch)
-        print(f"  批次 {i//BATCH_SIZE + 1} 完成")
-
-    print(f"✅ 全數語音生成完畢！檔案位於 {OUTPUT_DIR}/")
+    parser = argparse.ArgumentParser(description="冬山導覽語音生成")
+    catalog.add_selector_args(parser)
+    parser.add_argument('--voice', default=None,
+                        help=f"語音設定檔，逗號分隔 ({', '.join(VOICE_PROFILES)})，"
+                             f"all 為全部；預設只有 {DEFAULT_VOICE}")
+    args = parser.parse_args()
+    selection = catalog.Selection.from_args(args)
+    voices = parse_voices(args.voice)
+
+    print(f"🎙️ {selection.tour} 導覽語音生成中... (語音: {', '.join(voices)})")
+    for scene in selection.intro:
+        print(f"  生成開場語 -> {catalog.tts_path(selection.tour, scene['id'])}")
+    for theme, scenes in selection.themes:
+        print(f"  正在處理主題 ({theme['id']}) {len(scenes)} 幕，起始編號 {scenes[0]['id']} ...")
+
+    hits, ok, failed, retried = await build_tts(
+        scene_jobs(selection.scenes(), selection.tour, voices))
+
+    if failed:
+        print(f"❌ {failed} 個語音合成失敗 (命中 {hits}，新合成 {ok}，重試 {retried})")
+        return 1
+    print(f"✅ 全數語音生成完畢！檔案位於 {OUTPUT_DIR}/ "
+          f"(命中 {hits}，新合成 {ok}，重試 {retried})")
+    return 0
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    sys.exit(asyncio.run(main()))
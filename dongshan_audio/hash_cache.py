@@ -0,0 +1,73 @@
+"""
+hash_cache.py — 冬山鄉探險隊：以內容雜湊為鍵的計算結果快取
+
+長度、響度、PCM 快取檔名都以來源檔的內容雜湊為鍵；
+path 另記錄 (mtime, size, hash)，檔案未變時連雜湊都不必重算。
+指定 path 時結果存成 JSON (寫入暫存檔後替換)，version 不符時整份捨棄。
+"""
+
+import json
+import os
+import threading
+
+import artifact_store
+
+
+class HashCache:
+    """path 為 None 時只在行程內記憶雜湊與結果，不寫檔"""
+
+    def __init__(self, path=None, field='values', version=None):
+        self.path = path
+        self.field = field
+        self.version = version
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.paths, self.values = {}, {}
+        if path is None:
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == version:
+                self.paths = data.get('paths', {})
+                self.values = data.get(field, {})
+        except (OSError, ValueError):
+            pass
+
+    def digest(self, path):
+        # 來源檔的內容雜湊；mtime 與大小未變時沿用上次的結果
+        st = os.stat(path)
+        stamp = [st.st_mtime_ns, st.st_size]
+        key = path.replace(os.sep, '/')
+        with self.lock:
+            entry = self.paths.get(key)
+            if entry and entry['stamp'] == stamp:
+                return entry['hash']
+        digest = artifact_store.file_hash(path)
+        with self.lock:
+            self.paths[key] = {'stamp': stamp, 'hash': digest}
+            self.dirty = True
+        return digest
+
+    def get(self, path, compute):
+        # compute(path) 只在這份內容還沒有結果時呼叫；結果需可轉為 JSON
+        digest = self.digest(path)
+        with self.lock:
+            if digest in self.values:
+                return self.values[digest]
+        value = compute(path)
+        with self.lock:
+            self.values[digest] = value
+            self.dirty = True
+        return value
+
+    def save(self):
+        with self.lock:
+            if not self.dirty or self.path is None:
+                return
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.version, 'paths': self.paths,
+                           self.field: self.values}, f, indent=1)
+            os.replace(tmp, self.path)
+            self.dirty = False
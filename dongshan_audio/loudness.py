@@ -0,0 +1,145 @@
+"""
+loudness.py — 冬山鄉探險隊：響度量測
+
+ITU-R BS.1770 integrated loudness (LUFS)：
+K-weighting 兩段濾波 (高架 + 高通) 以 FFT 頻域相乘一次完成，
+400 ms 區塊 (75% 重疊) 的均方值用累積和計算，再做 -70 LUFS 絕對閘與 -10 LU 相對閘。
+結果以檔案內容雜湊快取，同一檔案只需解碼、量測一次。
+
+檢查成品或素材的響度 (音訊由 pcm_cache 映射，與混音共用解碼結果)：
+
+    python loudness.py final_output/*.mp3 [--ffmpeg <路徑>]
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+
+import ffmpeg_tool
+import hash_cache
+import tracing
+
+CACHE_PATH = "loudness_cache.json"
+CACHE_VERSION = 2
+
+BLOCK_SEC = 0.4
+STEP_SEC = 0.1          # 75% 重疊
+ABS_GATE_LUFS = -70.0
+REL_GATE_LU = -10.0
+SILENCE_LUFS = -120.0   # 全部區塊都被閘掉時的回傳值
+
+# K-weighting 濾波器 (與 BS.1770 在 48 kHz 的係數相同，其他取樣率依類比原型換算)
+_SHELF = dict(gain_db=4.0, q=1 / np.sqrt(2), fc=1500.0)
+_HIGHPASS = dict(q=0.5, fc=38.0)
+
+
+def _biquads(sample_rate):
+    # 回傳 [(b, a), ...]
+    w0 = 2 * np.pi * _SHELF['fc'] / sample_rate
+    A = 10 ** (_SHELF['gain_db'] / 40)
+    alpha = np.sin(w0) / (2 * _SHELF['q'])
+    cos, sq = np.cos(w0), 2 * np.sqrt(A) * alpha
+    shelf = ([A * ((A + 1) + (A - 1) * cos + sq),
+              -2 * A * ((A - 1) + (A + 1) * cos),
+              A * ((A + 1) + (A - 1) * cos - sq)],
+             [(A + 1) - (A - 1) * cos + sq,
+              2 * ((A - 1) - (A + 1) * cos),
+              (A + 1) - (A - 1) * cos - sq])
+
+    w0 = 2 * np.pi * _HIGHPASS['fc'] / sample_rate
+    alpha = np.sin(w0) / (2 * _HIGHPASS['q'])
+    cos = np.cos(w0)
+    highpass = ([(1 + cos) / 2, -(1 + cos), (1 + cos) / 2],
+                [1 + alpha, -2 * cos, 1 - alpha])
+    return [shelf, highpass]
+
+
+def k_weighting_response(n_fft, sample_rate):
+    # rfft 各頻點上兩段濾波的複數頻率響應
+    z = np.exp(-1j * np.pi * np.arange(n_fft // 2 + 1) / (n_fft // 2))
+    h = np.ones_like(z)
+    for b, a in _biquads(sample_rate):
+        h *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return h
+
+
+def block_powers(audio, sample_rate):
+    # audio 為 (frames, channels)；回傳每個閘控區塊的 Σ 各聲道 K-weighted 均方值
+    audio = np.asarray(audio, dtype=np.float64)
+    if audio.ndim == 1:
+        audio = audio[:, None]
+    block = int(round(BLOCK_SEC * sample_rate))
+    step = int(round(STEP_SEC * sample_rate))
+    n = len(audio)
+    if n < block:
+        return np.zeros(0)
+
+    # 補零避免循環摺積把尾端的濾波響應疊回開頭 (兩段濾波在 1 秒內已衰減到可忽略)
+    n_fft = 1 << int(np.ceil(np.log2(n + sample_rate)))
+    spectrum = np.fft.rfft(audio, n_fft, axis=0)
+    spectrum *= k_weighting_response(n_fft, sample_rate)[:, None]
+    weighted = np.fft.irfft(spectrum, n_fft, axis=0)[:n]
+
+    # 累積和求每個區塊的平方和；左右聲道權重皆為 1
+    energy = np.concatenate([[0.0], np.cumsum((weighted ** 2).sum(axis=1))])
+    starts = np.arange(0, n - block + 1, step)
+    return (energy[starts + block] - energy[starts]) / block
+
+
+def _lufs(power):
+    return -0.691 + 10 * np.log10(np.maximum(power, 1e-20))
+
+
+def integrated_loudness(audio, sample_rate):
+    # 回傳 LUFS；沒有區塊通過閘控 (靜音或太短) 時回傳 SILENCE_LUFS
+    z = block_powers(audio, sample_rate)
+    z = z[_lufs(z) > ABS_GATE_LUFS]
+    if len(z) == 0:
+        return SILENCE_LUFS
+    z = z[_lufs(z) > _lufs(z.mean()) + REL_GATE_LU]
+    return float(_lufs(z.mean()))
+
+
+def db_to_gain(db):
+    return 10 ** (db / 20)
+
+
+class LoudnessCache(hash_cache.HashCache):
+    """以內容雜湊快取 LUFS"""
+
+    def __init__(self, path=CACHE_PATH):
+        super().__init__(path, 'loudness', CACHE_VERSION)
+
+    def get(self, path, load, sample_rate):
+        # load(path) 回傳 (frames, channels) float32，只有快取未命中時才呼叫
+        def measure(p):
+            with tracing.span(os.path.basename(p), 'loudness', bytes_read=os.path.getsize(p)):
+                return integrated_loudness(load(p), sample_rate)
+        return super().get(path, measure)
+
+
+def main():
+    import pcm_cache
+    from numpy_mixer import MIX_SAMPLE_RATE
+
+    if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    parser = argparse.ArgumentParser(description="量測整合響度 (LUFS)")
+    parser.add_argument('files', nargs='+', help="音訊檔，可用萬用字元")
+    ffmpeg_tool.add_args(parser)
+    args = parser.parse_args()
+    ffmpeg_tool.apply_args(args)
+
+    cache = LoudnessCache()
+    paths = sorted({p for pattern in args.files for p in glob.glob(pattern)})
+    for path in paths:
+        lufs = cache.get(path, pcm_cache.load, MIX_SAMPLE_RATE)
+        print(f"  {lufs:7.1f} LUFS  {path}")
+    cache.save()
+
+
+if __name__ == "__main__":
+    main()
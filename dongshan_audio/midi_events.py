@@ -0,0 +1,163 @@
+"""
+midi_events.py — 冬山鄉探險隊：欄位式 MIDI 事件與 SMF 寫出
+
+音符以 NumPy 結構陣列存放 (t, dur, note, vel, ch)，一小時的配樂也只是幾十萬列，
+不必為每個音符建立 dict 或 midiutil 物件。write_smf 直接把整個陣列編碼成
+Standard MIDI File，輸出與 midiutil.MIDIFile(n) 逐一 addNote 的結果逐位元組相同：
+- 格式 1，另有一條只放 tempo 的第 0 軌；每拍 960 ticks
+- 同一時間依 program change → note off → note on 排序，再依加入順序
+- 移除重複事件，並與 midiutil 一樣處理同音高重疊的音符 (deinterleave)
+
+同一聲部內，陣列中的順序即視為加入順序。
+"""
+
+import struct
+
+import numpy as np
+
+TICKS_PER_BEAT = 960  # 與 midiutil 預設相同
+
+NOTE_DTYPE = np.dtype([
+    ('t', 'f8'),     # 開始時間 (拍)
+    ('dur', 'f8'),   # 長度 (拍)
+    ('note', 'u1'),
+    ('vel', 'u1'),
+    ('ch', 'u1'),    # 聲道，同時也是軌道編號
+])
+
+# midiutil 同一 tick 內的次序
+_ORDER_PROGRAM, _ORDER_OFF, _ORDER_ON = 1, 2, 3
+
+
+def empty_notes(n=0):
+    return np.zeros(n, dtype=NOTE_DTYPE)
+
+
+def to_ticks(beats):
+    # 與 midiutil 的 int(beats * 960) 相同：無條件捨去
+    return (np.asarray(beats, dtype=np.float64) * TICKS_PER_BEAT).astype(np.int64)
+
+
+def _varlen(values):
+    # MIDI 可變長度數值，回傳右對齊的 (n, 5) 位元組矩陣與有效遮罩
+    v = values.astype(np.uint64)
+    shifts = np.arange(28, -1, -7, dtype=np.uint64)
+    groups = ((v[:, None] >> shifts) & 0x7F).astype(np.uint8)
+    groups[:, :-1] |= 0x80
+    nbytes = 1 + (v[:, None] >= (np.uint64(1) << shifts[:-1])).sum(axis=1)
+    mask = np.arange(5)[None, :] >= (5 - nbytes)[:, None]
+    return groups, mask
+
+
+def _first_unique(*columns):
+    # 相同鍵只保留最早加入的一筆 (midiutil 以 set 去重，先加入者留下)
+    keys = np.stack(columns, axis=1)
+    _, first = np.unique(keys, axis=0, return_index=True)
+    return np.sort(first)
+
+
+def _deinterleave(ticks, order, ins, pitch):
+    # 照搬 midiutil.deInterleaveNotes：同音高的 note on 尚未結束又再次出現時，
+    # 較早的 note off 改到最近一次 note on 的時間
+    ticks = ticks.copy()
+    stacks = {}
+    for i in range(len(ticks)):
+        if order[i] == _ORDER_ON:
+            stacks.setdefault(pitch[i], []).append(ticks[i])
+        elif order[i] == _ORDER_OFF:
+            stack = stacks.get(pitch[i])
+            if not stack:
+                raise ValueError(f"note off without note on (pitch {pitch[i]})")
+            if len(stack) > 1:
+                ticks[i] = stack.pop()
+            else:
+                stack.pop()
+    idx = np.lexsort((ins, order, ticks))
+    return ticks[idx], idx
+
+
+def _needs_deinterleave(order, pitch):
+    # 依排序後的順序，各音高的 note off 出現時應恰好只有一個未結束的 note on
+    notes = order != _ORDER_PROGRAM
+    if not notes.any():
+        return False
+    sign = np.where(order[notes] == _ORDER_ON, 1, -1)
+    p = pitch[notes]
+    by_pitch = np.argsort(p, kind='stable')
+    sign, p = sign[by_pitch], p[by_pitch]
+    depth = np.cumsum(sign)
+    starts = np.flatnonzero(np.r_[True, p[1:] != p[:-1]])
+    base = np.repeat(depth[starts] - sign[starts], np.diff(np.r_[starts, len(p)]))
+    depth -= base
+    return bool(np.any(depth[sign < 0] != 0))
+
+
+def _encode_events(ticks, body, body_len):
+    # ticks 已排序；body 為 (n, 6) 左對齊的事件內容
+    deltas = np.diff(ticks, prepend=0)
+    vlq, vlq_mask = _varlen(deltas)
+    body_mask = np.arange(body.shape[1])[None, :] < body_len[:, None]
+    rows = np.hstack([vlq, body])
+    mask = np.hstack([vlq_mask, body_mask])
+    return rows[mask].tobytes()
+
+
+def _track_chunk(data):
+    data += b'\x00\xFF\x2F\x00'
+    return b'MTrk' + struct.pack('>L', len(data)) + data
+
+
+def encode_track(notes, programs=()):
+    # notes 為同一軌的 NOTE_DTYPE 陣列；programs 為 [(ch, program), ...]，時間 0
+    ch = notes['ch'].astype(np.int64)
+    on_tick = to_ticks(notes['t'])
+    off_tick = on_tick + to_ticks(notes['dur'])
+    pitch = notes['note'].astype(np.int64)
+
+    prog = np.array(programs, dtype=np.int64).reshape(-1, 2)
+    prog = prog[_first_unique(prog[:, 0], prog[:, 1])] if len(prog) else prog
+    ons = _first_unique(on_tick, pitch, ch)
+    offs = _first_unique(off_tick, pitch, ch)
+
+    # program change 先於所有音符加入
+    n_prog = len(prog)
+    ticks = np.concatenate([np.zeros(n_prog, np.int64), off_tick[offs], on_tick[ons]])
+    order = np.concatenate([np.full(n_prog, _ORDER_PROGRAM), np.full(len(offs), _ORDER_OFF),
+                            np.full(len(ons), _ORDER_ON)])
+    ins = np.concatenate([np.arange(n_prog), n_prog + offs, n_prog + ons])
+    key = np.concatenate([prog[:, 0] * 128 + prog[:, 1], ch[offs] * 128 + pitch[offs],
+                          ch[ons] * 128 + pitch[ons]])
+
+    body = np.zeros((len(ticks), 6), dtype=np.uint8)
+    body[:n_prog, 0] = 0xC0 | prog[:, 0]
+    body[:n_prog, 1] = prog[:, 1]
+    body[n_prog:, 0] = np.concatenate([0x80 | ch[offs], 0x90 | ch[ons]])
+    body[n_prog:, 1] = np.concatenate([pitch[offs], pitch[ons]])
+    body[n_prog:, 2] = np.concatenate([notes['vel'][offs], notes['vel'][ons]])
+    body_len = np.where(order == _ORDER_PROGRAM, 2, 3)
+
+    idx = np.lexsort((ins, order, ticks))
+    ticks, order, ins, key = ticks[idx], order[idx], ins[idx], key[idx]
+    body, body_len = body[idx], body_len[idx]
+    if _needs_deinterleave(order, key):
+        ticks, idx = _deinterleave(ticks, order, ins, key)
+        body, body_len = body[idx], body_len[idx]
+    return _track_chunk(_encode_events(ticks, body, body_len))
+
+
+def tempo_track(bpm):
+    tempo = struct.pack('>L', int(60000000 / bpm))[1:]
+    return _track_chunk(b'\x00\xFF\x51\x03' + tempo)
+
+
+def write_smf(filename, notes, programs, bpm, num_tracks):
+    # 與 MIDIFile(num_tracks) + addTempo + addProgramChange/addNote(ch, ch, ...) 相同的輸出
+    chunks = [tempo_track(bpm)]
+    for track in range(num_tracks):
+        track_notes = notes[notes['ch'] == track]
+        track_programs = [(ch, prog) for ch, prog in programs if ch == track]
+        chunks.append(encode_track(track_notes, track_programs))
+    header = b'MThd' + struct.pack('>LHHH', 6, 1, num_tracks + 1, TICKS_PER_BEAT)
+    with open(filename, 'wb') as f:
+        f.write(header)
+        f.writelines(chunks)
@@ -3,128 +3,442 @@
 mix_audio.py — 冬山鄉探險隊：音訊混合
 """
 
+import argparse
+import asyncio
 import os
 import sys
 import subprocess
 import glob
+import math
+import time
+
+import numpy as np
+
+import artifact_store
+import catalog
+import ffmpeg_tool
+import loudness
+import mp3_info
+import numpy_mixer
+import pcm_cache
+import tracing
 
 # 設定
-TTS_DIR = "tts_audio"
-BGM_DIR = "bgm_mp3"
-OUTPUT_DIR = "final_output"
-FFMPEG_CMD = r"C:\ffmpeg\bin\ffmpeg.exe"
+TTS_DIR = catalog.TTS_DIR
+BGM_DIR = catalog.BGM_DIR
+OUTPUT_DIR = catalog.MIX_DIR
+
+# 混音參數
+START_DELAY_MS = 3000  # 起始延遲給特效
+SCENE_GAP_MS = 1000    # 每幕之間的間隔
+TAIL_SEC = 4           # 結尾多留的尾韻
+BGM_VOLUME = 0.25
+BGM_FADE_SEC = 2
+MIX_WEIGHTS = "1 3"    # BGM : 語音
+GAIN_MODE = "loudness" # "loudness" (依量測響度計算增益) 或 "fixed" (BGM_VOLUME 與 MIX_WEIGHTS)
+TARGET_LUFS = -16.0    # 響度模式下成品的目標整合響度
+BGM_DUCK_LU = 18.0     # 響度模式下 BGM 比語音低幾 LU
+MAX_BOOST_DB = 20.0    # 單一檔案最多放大幾 dB，避免把近乎靜音的檔案拉成噪音
+MIX_VERSION = 4        # 混音邏輯改變時遞增，使舊的快取產物失效
+MIX_ENGINE = "ffmpeg"  # "ffmpeg" (adelay/amix 濾鏡圖，預設且較快) 或 "numpy" (numpy_mixer，可選)
+ENCODE_ARGS = []       # 成品的額外編碼參數，空白為 ffmpeg 預設的 MP3 設定
+PREVIEW_ENCODE_ARGS = ['-ac', '1', '-ar', '22050', '-b:a', '48k', '-compression_level', '9']
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-THEMES = [
-    # (ID, Name, StartFileIndex, EndFileIndex)
-    ('train', '01_瓜棚火車站', 2, 9),
-    ('river', '02_神秘河道', 10, 17),
-    ('lake', '03_梅花湖', 18, 25),
-    ('waterfall', '04_新寮瀑布', 26, 33),
-    ('rice_field', '05_三奇美徑', 34, 41),
-    ('farm', '06_宜農牧場', 42, 49),
-    ('fire_water', '07_水火同源', 50, 57),
-    ('forest', '08_仁山植物園', 58, 65)
-]
+# 缺檔、解碼失敗 (ffmpeg 結束碼非 0) 或檔案內容無法解析時，只讓該主題失敗
+MIX_ERRORS = (OSError, ValueError, subprocess.CalledProcessError)
+
+_durations = None
+_loudness = None
 
 def get_audio_duration(file_path):
+    # 直接讀 MP3 標頭 (快取於 duration_cache.json)；無法解析時回傳 None
+    global _durations
+    if _durations is None:
+        _durations = mp3_info.DurationCache()
+    try:
+        return _durations.get(file_path)
+    except (OSError, mp3_info.MP3Error) as e:
+        print(f"    [!] 無法讀取長度 {file_path}: {e}")
+        return None
+
+def save_duration_cache():
+    if _durations is not None:
+        _durations.save()
+
+def get_loudness(file_path):
+    # 整合響度 (LUFS)，以內容雜湊快取於 loudness_cache.json；
+    # 需要量測時從 PCM 快取映射，與混音共用同一份解碼結果
+    global _loudness
+    if _loudness is None:
+        _loudness = loudness.LoudnessCache()
+    return _loudness.get(file_path, pcm_cache.load, numpy_mixer.MIX_SAMPLE_RATE)
+
+def save_loudness_cache():
+    if _loudness is not None:
+        _loudness.save()
+
+def plan_gains(bgm_path, clip_paths):
+    # 回傳 (BGM 增益, [各幕增益])：各幕語音拉到同一響度，BGM 比語音低 BGM_DUCK_LU，
+    # 兩者功率相加後約為 TARGET_LUFS；幕間空白與淡入淡出造成的偏差由 encode_normalized 補正
+    voice_lufs = TARGET_LUFS - 10 * math.log10(1 + 10 ** (-BGM_DUCK_LU / 10))
+    def gain(path, target):
+        return loudness.db_to_gain(min(target - get_loudness(path), MAX_BOOST_DB))
+    clip_gains = [gain(p, voice_lufs) for p in clip_paths]
+    bgm_gain = gain(bgm_path, voice_lufs - BGM_DUCK_LU)
+    save_loudness_cache()
+    return bgm_gain, clip_gains
+
+def encode_normalized(audio, output_path):
+    # 響度模式：成品整體再量一次，補上逐檔量測與實際混音之間的差距 (約 1 LU) 後編碼
+    measured = loudness.integrated_loudness(audio, numpy_mixer.MIX_SAMPLE_RATE)
+    gain = loudness.db_to_gain(min(TARGET_LUFS - measured, MAX_BOOST_DB))
+    numpy_mixer.encode(audio * np.float32(gain), output_path, extra_args=ENCODE_ARGS)
+
+def encode_raw(job):
+    # ffmpeg 引擎在響度模式下先輸出 raw PCM，補正響度後再編碼成 MP3
+    raw = job.get('raw')
+    if raw is None:
+        return
     try:
-        result = subprocess.run(
-            [FFMPEG_CMD, '-i', file_path], 
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
-        # ffmpeg output goes to stderr
-        for line in result.stderr.split('\n'):
-            if "Duration" in line:
-                # Duration: 00:00:05.12, ...
-                time_str = line.split("Duration:")[1].split(",")[0].strip()
-                h, m, s = time_str.split(':')
-                return float(h)*3600 + float(m)*60 + float(s)
-    except:
-        return 0
-    return 0
-
-def mix_story(theme_id, output_name, start_idx, end_idx):
-    print(f"  [{theme_id}] {output_name}")
+        with tracing.span(os.path.basename(job['output']), 'normalize'):
+            size = os.path.getsize(raw)
+            audio = (np.memmap(raw, dtype=np.float32, mode='r').reshape(-1, numpy_mixer.CHANNELS)
+                     if size else np.zeros((0, numpy_mixer.CHANNELS), dtype=np.float32))
+            encode_normalized(audio, job['output'])
+            del audio
+    finally:
+        remove_raw(job)
+
+def remove_raw(job):
+    if 'raw' in job:
+        try:
+            os.remove(job['raw'])
+        except OSError:
+            pass
+
+def analyze_clips(tts_paths):
+    # 主題的語音一完成就先量長度與響度 (寫入快取)，配樂就緒後混音不必再等這一步
+    for fpath in tts_paths:
+        if not os.path.exists(fpath):
+            continue
+        get_audio_duration(fpath)
+        if GAIN_MODE == "loudness":
+            get_loudness(fpath)
+    save_duration_cache()
+    save_loudness_cache()
+
+def mix_settings():
+    return {
+        'start_delay_ms': START_DELAY_MS,
+        'scene_gap_ms': SCENE_GAP_MS,
+        'tail_sec': TAIL_SEC,
+        'bgm_volume': BGM_VOLUME,
+        'bgm_fade_sec': BGM_FADE_SEC,
+        'weights': MIX_WEIGHTS,
+        'engine': MIX_ENGINE,
+        'encode_args': ENCODE_ARGS,
+        'gain_mode': GAIN_MODE,
+        'target_lufs': TARGET_LUFS,
+        'bgm_duck_lu': BGM_DUCK_LU,
+        'max_boost_db': MAX_BOOST_DB,
+        'version': MIX_VERSION,
+    }
+
+def mix_items(selection):
+    # 選到的主題 → [(主題 ID, 輸出路徑, BGM 路徑, [各幕 TTS 路徑]), ...]
+    tour = selection.tour
+    return [(theme['id'], catalog.mix_path(tour, theme), catalog.bgm_path(tour, theme['id']),
+             [catalog.tts_path(tour, s['id']) for s in selection.mix_scenes(theme)])
+            for theme, _ in selection.themes]
+
+def mix_key(theme_id, bgm_path, tts_paths):
+    # 鍵 = BGM 與各幕 TTS 的內容雜湊 + 混音參數
+    inputs = [bgm_path] + [p for p in tts_paths if os.path.exists(p)]
+    return artifact_store.make_key('mix', {'theme': theme_id, **mix_settings()}, inputs)
+
+def plan_theme(theme_id, output_path, bgm_path, tts_paths):
+    if not os.path.exists(bgm_path):
+        return 'build'
+    return artifact_store.status(output_path, mix_key(theme_id, bgm_path, tts_paths))
+
+def prepare_mix(theme_id, output_path, bgm_path, tts_paths, threads=None):
+    # 檢查快取並組出 ffmpeg 指令；回傳 (狀態, job)
+    # 狀態：'done' 已是最新或由快取取回 / 'failed' 缺少輸入 (job 為原因) / 'ready' 需執行 job['cmd']
+    print(f"  [{theme_id}] {os.path.splitext(os.path.basename(output_path))[0]}")
     
-    bgm_path = os.path.join(BGM_DIR, f"bgm_{theme_id}.mp3")
     if not os.path.exists(bgm_path):
         print(f"    [!] BGM not found: {bgm_path}")
-        return
+        return 'failed', f"BGM not found: {bgm_path}"
+
+    # 0. 輸入與參數都沒變時沿用快取的產物
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    key = mix_key(theme_id, bgm_path, tts_paths)
+    state = artifact_store.status(output_path, key)
+    if state == 'fresh':
+        print(f"    已是最新，略過: {output_path}")
+        return 'done', None
+    if state == 'restore':
+        artifact_store.restore(output_path, key, 'mix')
+        print(f"    由快取取回: {output_path}")
+        return 'done', None
 
     # 1. 收集 TTS 檔案與長度
     tts_files = []
-    for i in range(start_idx, end_idx + 1):
-        fpath = os.path.join(TTS_DIR, f"{i:05d}.mp3")
+    for i, fpath in enumerate(tts_paths, 1):
         if os.path.exists(fpath):
             dur = get_audio_duration(fpath)
+            if dur is None:
+                continue
             tts_files.append((fpath, dur))
-            print(f"    載入第 {i-start_idx+1} 幕: {os.path.basename(fpath)}")
+            print(f"    載入第 {i} 幕: {os.path.basename(fpath)}")
         else:
             print(f"    [!] TTS 缺失: {fpath}")
 
+    save_duration_cache()
     if not tts_files:
-        return
+        return 'failed', "沒有可用的 TTS 檔案"
 
     # 2. 建構 ffmpeg filter complex
-    
-    cmd_inputs = ['-i', bgm_path]
-    for f, _ in tts_files:
-        cmd_inputs.extend(['-i', f])
 
     # 串接 TTS (adelay)
     # 起始延遲 3000ms (3秒) 給特效
-    current_delay = 3000 
+    current_delay = START_DELAY_MS
     filter_parts = []
     
-    # 每個 TTS 檔案對應 input index 1, 2, 3...
+    # 各幕起始時間 (秒)；TTS 檔案對應 input index 1, 2, 3...
+    offsets = []
     for i, (fpath, dur) in enumerate(tts_files):
-        idx = i + 1
         delay_ms = int(current_delay)
-        # [1:a]adelay=3000|3000[s1]
-        filter_parts.append(f"[{idx}:a]adelay={delay_ms}|{delay_ms}[s{i}]")
+        offsets.append(delay_ms / 1000)
         
         # 下一句的延遲 = 當前延遲 + 語音長度 * 1000 + 1000ms 間隔
-        current_delay += (dur * 1000) + 1000
-
-    # 混合所有 TTS 軌道
-    input_tags = "".join([f"[s{i}]" for i in range(len(tts_files))])
-    filter_parts.append(f"{input_tags}amix=inputs={len(tts_files)}:duration=longest[voice]")
+        current_delay += (dur * 1000) + SCENE_GAP_MS
 
     # 混合 BGM (背景) 與 語音 (前景)
     # BGM 音量 0.25
-    total_len_sec = (current_delay / 1000) + 4 # 多留 4 秒尾韻
+    total_len_sec = (current_delay / 1000) + TAIL_SEC # 多留 4 秒尾韻
     
+    job = {
+        'output': output_path, 'key': key, 'length': total_len_sec,
+        'bgm': bgm_path, 'clips': [f for f, _ in tts_files], 'offsets': offsets,
+    }
+    if MIX_ENGINE == "numpy":
+        return 'ready', job
+
+    # 響度模式：各檔案增益事先由快取的量測值算出，混音時不再正規化
+    normalize = ""
+    if GAIN_MODE == "loudness":
+        try:
+            bgm_gain, clip_gains = plan_gains(bgm_path, job['clips'])
+        except MIX_ERRORS as e:
+            print(f"    [!] 響度量測失敗: {e}")
+            return 'failed', f"響度量測失敗: {e}"
+        normalize = ":normalize=0"
+    else:
+        bgm_gain, clip_gains = BGM_VOLUME, [None] * len(tts_files)
+
+    for i, (delay, gain) in enumerate(zip(offsets, clip_gains)):
+        delay_ms = int(round(delay * 1000))
+        volume = f"volume={gain:.6f}," if gain is not None else ""
+        # [1:a]adelay=3000|3000[s0]
+        filter_parts.append(f"[{i + 1}:a]{volume}adelay={delay_ms}|{delay_ms}[s{i}]")
+
+    # BGM 不論長短都重複播放到故事結束 (循環模式的配樂只有幾小節)
+    cmd_inputs = ['-stream_loop', '-1', '-t', f"{total_len_sec:.3f}", *pcm_input(bgm_path)]
+    for f, _ in tts_files:
+        cmd_inputs.extend(pcm_input(f))
+
+    # 混合所有 TTS 軌道
+    input_tags = "".join([f"[s{i}]" for i in range(len(tts_files))])
+    filter_parts.append(f"{input_tags}amix=inputs={len(tts_files)}:duration=longest{normalize}[voice]")
+
     # BGM 淡入淡出處理
-    filter_parts.append(f"[0:a]volume=0.25,afade=t=in:ss=0:d=2,afade=t=out:st={total_len_sec-2}:d=2[bgm_ready]")
-    filter_parts.append(f"[bgm_ready][voice]amix=inputs=2:duration=first:weights=1 3[out]")
+    fade = BGM_FADE_SEC
+    weights = "" if normalize else f":weights={MIX_WEIGHTS}"
+    filter_parts.append(f"[0:a]volume={bgm_gain:.6f},afade=t=in:ss=0:d={fade},afade=t=out:st={total_len_sec-fade}:d={fade}[bgm_ready]")
+    filter_parts.append(f"[bgm_ready][voice]amix=inputs=2:duration=first{weights}{normalize}[out]")
 
     filter_complex = ";".join(filter_parts)
 
-    output_path = os.path.join(OUTPUT_DIR, f"{output_name}.mp3")
-    
+    # 限制 ffmpeg 執行緒數，平行混音時才不會搶爆 CPU
+    thread_opts = []
+    if threads:
+        thread_opts = ['-filter_complex_threads', str(threads), '-threads', str(threads)]
+
+    # 響度模式先輸出 raw PCM，量測整體響度補正後才編碼 (encode_raw)
+    output_args = [*ENCODE_ARGS, output_path]
+    if GAIN_MODE == "loudness":
+        job['raw'] = output_path + ".mix.f32"
+        output_args = ['-f', 'f32le', '-ar', str(numpy_mixer.MIX_SAMPLE_RATE),
+                       '-ac', str(numpy_mixer.CHANNELS), job['raw']]
+
     cmd = [
-        FFMPEG_CMD, '-y',
+        ffmpeg_tool.ffmpeg(), '-y',
         *cmd_inputs,
         '-filter_complex', filter_complex,
+        *thread_opts,
         '-map', '[out]',
         '-t', str(total_len_sec), # 強制截斷
-        output_path
+        *output_args,
     ]
     
+    job['cmd'] = cmd
+    return 'ready', job
+
+def pcm_input(path):
+    # 已有解碼好的 PCM 快取時讓 ffmpeg 直接讀 raw 檔，否則讀原本的 MP3
+    cached = pcm_cache.lookup(path)
+    if cached is None:
+        return ['-i', path]
+    return ['-f', 'f32le', '-ar', str(numpy_mixer.MIX_SAMPLE_RATE),
+            '-ac', str(numpy_mixer.CHANNELS), '-i', cached]
+
+def mix_numpy(job):
+    # 各檔案由 PCM 快取映射 (未快取時解碼一次)，於記憶體中混音後編碼一次
+    # BGM 只取到總長為止，不足時重複銜接到總長
+    n_total = int(round(job['length'] * numpy_mixer.MIX_SAMPLE_RATE))
+    bgm = pcm_cache.load(job['bgm'])[:n_total]
+    bgm = numpy_mixer.loop_to(bgm, n_total)
+    clips = pcm_cache.load_many(job['clips'])
+    if GAIN_MODE == "loudness":
+        bgm_gain, clip_gains = plan_gains(job['bgm'], job['clips'])
+    with tracing.span(os.path.basename(job['output']), 'numpy_mix'):
+        if GAIN_MODE == "loudness":
+            out = numpy_mixer.mix_gained(bgm, clips, job['offsets'], job['length'],
+                                         bgm_gain, clip_gains, BGM_FADE_SEC)
+        else:
+            weights = [float(w) for w in MIX_WEIGHTS.split()]
+            out = numpy_mixer.mix(bgm, clips, job['offsets'], job['length'],
+                                  BGM_VOLUME, BGM_FADE_SEC, weights)
+    if GAIN_MODE == "loudness":
+        encode_normalized(out, job['output'])
+    else:
+        numpy_mixer.encode(out, job['output'], extra_args=ENCODE_ARGS)
+
+def finish_mix(job):
+    artifact_store.commit(job['output'], job['key'], 'mix')
+    print(f"    輸出: {job['output']} (約 {job['length']:.1f}s)")
+
+def mix_story(theme_id, output_path, bgm_path, tts_paths, threads=None):
+    job = None
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        print(f"    輸出: {output_path} (約 {total_len_sec:.1f}s)")
-    except subprocess.CalledProcessError as e:
+        state, job = prepare_mix(theme_id, output_path, bgm_path, tts_paths, threads)
+        if state != 'ready':
+            return state == 'done'
+        if 'cmd' in job:
+            tracing.run(job['cmd'], outputs=(job.get('raw', job['output']),), check=True,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            encode_raw(job)
+        else:
+            mix_numpy(job)
+        finish_mix(job)
+        return True
+    except MIX_ERRORS as e:
+        if job:
+            remove_raw(job)
         print(f"    [!] 混合失敗: {e}")
+        return False
+
+def plan_workers(n_jobs, jobs=0):
+    # 回傳 (同時混音數, 每個 ffmpeg 的執行緒數)，兩者相乘不超過核心數
+    cores = os.cpu_count() or 1
+    if jobs <= 0:
+        jobs = max(1, cores // 2)
+    jobs = max(1, min(jobs, n_jobs))
+    return jobs, max(1, cores // jobs)
+
+async def mix_all_async(items, jobs=0):
+    # 以 asyncio 子行程池同時執行多個混音；單一主題失敗不影響其他主題
+    # items 為 mix_items() 的結果
+    jobs, threads = plan_workers(len(items), jobs)
+    sem = asyncio.Semaphore(jobs)
+    print(f"  同時混音 {jobs} 個，每個 ffmpeg {threads} 執行緒")
+
+    async def run(theme_id, output_path, bgm_path, tts_paths):
+        async with sem:
+            start = time.perf_counter()
+            # 響度模式的 prepare_mix 會解碼並量測各檔案，放到執行緒中才能與其他主題同時進行
+            state, job = await asyncio.to_thread(
+                prepare_mix, theme_id, output_path, bgm_path, tts_paths, threads)
+            if state != 'ready':
+                error = job if state == 'failed' else None
+                return theme_id, state == 'done', time.perf_counter() - start, error
+            if 'cmd' not in job:
+                try:
+                    await asyncio.to_thread(mix_numpy, job)
+                except MIX_ERRORS as e:
+                    return theme_id, False, time.perf_counter() - start, str(e)
+                finish_mix(job)
+                return theme_id, True, time.perf_counter() - start, None
+            try:
+                with tracing.span(theme_id, 'ffmpeg', is_async=True) as sp:
+                    proc = await asyncio.create_subprocess_exec(
+                        *job['cmd'], stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+                    _, err = await proc.communicate()
+                    sp.set(returncode=proc.returncode)
+            except OSError as e:
+                return theme_id, False, time.perf_counter() - start, str(e)
+            if proc.returncode != 0:
+                remove_raw(job)
+                lines = err.decode('utf-8', 'replace').strip().splitlines()
+                reason = lines[-1] if lines else f"exit code {proc.returncode}"
+                return theme_id, False, time.perf_counter() - start, reason
+            try:
+                await asyncio.to_thread(encode_raw, job)
+            except MIX_ERRORS as e:
+                return theme_id, False, time.perf_counter() - start, str(e)
+            finish_mix(job)
+            return theme_id, True, time.perf_counter() - start, None
+
+    # 未預期的例外也只算該主題失敗，不中斷其他主題
+    results = await asyncio.gather(*(run(*item) for item in items), return_exceptions=True)
+    return [(item[0], False, 0.0, f"{type(r).__name__}: {r}") if isinstance(r, Exception) else r
+            for item, r in zip(items, results)]
+
+def set_engine(engine):
+    global MIX_ENGINE
+    MIX_ENGINE = engine
+
+def set_gain_mode(mode):
+    global GAIN_MODE
+    GAIN_MODE = mode
+
+def set_preview():
+    # 預覽模式：單聲道低位元率，LAME 最快的演算法
+    global ENCODE_ARGS
+    ENCODE_ARGS = PREVIEW_ENCODE_ARGS
 
 def main():
+    parser = argparse.ArgumentParser(description="冬山故事音訊混合")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="同時執行的混音數，0 = 依核心數自動決定")
+    parser.add_argument('--engine', choices=['ffmpeg', 'numpy'], default=MIX_ENGINE,
+                        help="混音引擎；預設 ffmpeg 濾鏡圖，numpy 為可選引擎 (不會比較快)")
+    parser.add_argument('--gain', choices=['loudness', 'fixed'], default=GAIN_MODE,
+                        help=f"增益方式；loudness 依 BS.1770 響度把成品調到 {TARGET_LUFS} LUFS")
+    ffmpeg_tool.add_args(parser)
+    catalog.add_selector_args(parser)
+    args = parser.parse_args()
+    ffmpeg_tool.apply_args(args)
+    set_engine(args.engine)
+    set_gain_mode(args.gain)
+    items = mix_items(catalog.Selection.from_args(args))
+
     print("🎧 開始混合冬山故事音訊...")
-    for item in THEMES:
-        mix_story(item[0], item[1], item[2], item[3])
+    if args.jobs == 1:
+        for item in items:
+            mix_story(*item)
+    else:
+        results = asyncio.run(mix_all_async(items, args.jobs))
+        print("\n  ⏱️ 各主題耗時:")
+        for tid, ok, elapsed, error in results:
+            mark = "✓" if ok else "✗"
+            note = f"  {error}" if error else ""
+            print(f"    {mark} {tid:<12} {elapsed:6.1f}s{note}")
     
-    print(f"\n✅ 完成！8 個故事檔案位於 {OUTPUT_DIR}/")
+    print(f"\n✅ 完成！{len(items)} 個故事檔案位於 {OUTPUT_DIR}/")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,156 @@
+"""
+mp3_info.py — 冬山鄉探險隊：MP3 長度讀取
+
+直接解析 MP3 標頭取得長度，不需啟動 ffmpeg：
+優先讀 Xing/Info 或 VBRI 標頭中的總 frame 數，沒有時逐 frame 走訪加總。
+結果以檔案內容雜湊快取，mtime 與大小未變時連雜湊都不必重算。
+"""
+
+import struct
+
+import hash_cache
+
+CACHE_PATH = "duration_cache.json"
+CACHE_VERSION = 2
+
+# 位元率表 (kbps)，索引 [MPEG1?][layer]
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+class MP3Error(ValueError):
+    pass
+
+
+def parse_header(b):
+    # 解析 4 bytes frame 標頭；無效時回傳 None
+    if len(b) < 4 or b[0] != 0xFF or (b[1] & 0xE0) != 0xE0:
+        return None
+    version = (b[1] >> 3) & 0x03   # 3=MPEG1, 2=MPEG2, 0=MPEG2.5
+    layer = 4 - ((b[1] >> 1) & 0x03)
+    br_idx = (b[2] >> 4) & 0x0F
+    sr_idx = (b[2] >> 2) & 0x03
+    if version == 1 or layer == 4 or br_idx in (0, 15) or sr_idx == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][br_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version][sr_idx]
+    padding = (b[2] >> 1) & 0x01
+    mono = ((b[3] >> 6) & 0x03) == 3
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = (samples // 8) * bitrate // sample_rate + padding
+    return {
+        'mpeg1': mpeg1, 'layer': layer, 'sample_rate': sample_rate,
+        'samples': samples, 'length': length, 'mono': mono,
+    }
+
+
+def skip_id3v2(data):
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _find_frame(data, pos):
+    # 找到連續兩個有效標頭才算真正的 frame 起點，避免誤判
+    end = len(data) - 4
+    while pos <= end:
+        pos = data.find(b'\xFF', pos)
+        if pos < 0 or pos > end:
+            return -1, None
+        hdr = parse_header(data[pos:pos + 4])
+        if hdr and hdr['length'] > 0:
+            nxt = pos + hdr['length']
+            if nxt + 4 > len(data) or parse_header(data[nxt:nxt + 4]):
+                return pos, hdr
+        pos += 1
+    return -1, None
+
+
+def header_tag(data, pos, hdr):
+    # 第一個 frame 若是不含音訊的 Xing/Info/VBRI 標頭 frame，回傳 (標籤, 位置)，否則 (None, 0)
+    # Xing/Info 位於 side info 之後；VBRI 固定在標頭後 32 bytes
+    if hdr['layer'] == 3:
+        if hdr['mpeg1']:
+            side = 17 if hdr['mono'] else 32
+        else:
+            side = 9 if hdr['mono'] else 17
+        off = pos + 4 + side
+        if data[off:off + 4] in (b'Xing', b'Info'):
+            return data[off:off + 4], off
+    if data[pos + 36:pos + 40] == b'VBRI':
+        return b'VBRI', pos + 36
+    return None, 0
+
+
+def _vbr_frames(data, pos, hdr):
+    tag, off = header_tag(data, pos, hdr)
+    if tag in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[off + 4:off + 8])[0]
+        if not flags & 0x01:
+            return None, 0
+        frames = struct.unpack('>I', data[off + 8:off + 12])[0]
+        # LAME/Lavc 延伸標頭記錄編碼器前後補的靜音 (各 12 bits)
+        lame = off + 8 + 4 * bin(flags & 0x0B).count('1') + (100 if flags & 0x04 else 0)
+        trim = 0
+        if data[lame:lame + 4] in (b'LAME', b'Lavc', b'Lavf'):
+            b = data[lame + 21:lame + 24]
+            if len(b) == 3:
+                trim = ((b[0] << 4) | (b[1] >> 4)) + (((b[1] & 0x0F) << 8) | b[2])
+        return frames, trim
+    if tag == b'VBRI':
+        return struct.unpack('>I', data[off + 14:off + 18])[0], 0
+    return None, 0
+
+
+def duration_from_bytes(data):
+    pos, hdr = _find_frame(data, skip_id3v2(data))
+    if pos < 0:
+        raise MP3Error("no MPEG audio frame found")
+
+    frames, trim = _vbr_frames(data, pos, hdr)
+    if frames is not None:
+        # Xing/Info frame 本身不含音訊，frame 數不包含它；扣掉編碼器補的靜音
+        samples = frames * hdr['samples'] - trim
+        return max(samples, 0) / hdr['sample_rate']
+
+    # 逐 frame 走訪 (遇到損毀資料時重新同步)
+    total_samples = 0
+    sample_rate = hdr['sample_rate']
+    while pos >= 0:
+        total_samples += hdr['samples']
+        nxt = pos + hdr['length']
+        hdr = parse_header(data[nxt:nxt + 4])
+        if hdr:
+            pos = nxt
+        else:
+            pos, hdr = _find_frame(data, nxt)
+    return total_samples / sample_rate
+
+
+def duration(path):
+    with open(path, 'rb') as f:
+        return duration_from_bytes(f.read())
+
+
+class DurationCache(hash_cache.HashCache):
+    """以內容雜湊快取長度 (秒)"""
+
+    def __init__(self, path=CACHE_PATH):
+        super().__init__(path, 'durations', CACHE_VERSION)
+
+    def get(self, path):
+        return super().get(path, duration)
@@ -0,0 +1,144 @@
+"""
+pcm_cache.py — 冬山鄉探險隊：解碼後 PCM 快取
+
+MP3 解碼成 float32 後存成 raw 檔 (f32le，交錯雙聲道)，以「來源內容雜湊 + 取樣率 + 聲道數」為鍵：
+- 響度分析、NumPy 混音與檢查工具以 np.memmap 唯讀映射，不複製也不重新解碼
+- ffmpeg 混音引擎直接以 -f f32le 讀取同一個檔案，省掉每次的 MP3 解碼
+
+快取總大小超過 MAX_BYTES 時，依最後使用時間 (命中時更新檔案 mtime) 淘汰最舊的檔案：
+
+    python pcm_cache.py prune [--max-mb 2048] [--dry-run]
+"""
+
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import hash_cache
+import numpy_mixer
+
+if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+CACHE_DIR = "pcm_cache"
+MAX_BYTES = 2 << 30     # 約 2 GB；一小時的 44.1 kHz 雙聲道 float32 約 1.3 GB
+PCM_VERSION = 1         # 解碼方式改變時遞增，使舊的快取失效
+CHANNELS = numpy_mixer.CHANNELS
+
+_hashes = hash_cache.HashCache()   # 只記憶來源雜湊，同一行程內不必重算
+
+
+def _source_hash(path):
+    return _hashes.digest(path)
+
+
+def pcm_path(path, sample_rate=numpy_mixer.MIX_SAMPLE_RATE):
+    # 快取檔位置 (不論是否已存在)
+    name = f"{_source_hash(path)[:40]}_{sample_rate}_{CHANNELS}_v{PCM_VERSION}.f32"
+    return os.path.join(CACHE_DIR, name)
+
+
+def lookup(path, sample_rate=numpy_mixer.MIX_SAMPLE_RATE):
+    # 已快取時回傳快取檔路徑 (並標記為剛使用)，否則 None
+    cached = pcm_path(path, sample_rate)
+    if not os.path.exists(cached):
+        return None
+    _touch(cached)
+    return cached
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _map(cached):
+    if os.path.getsize(cached) == 0:
+        return np.zeros((0, CHANNELS), dtype=np.float32)
+    return np.memmap(cached, dtype=np.float32, mode='r').reshape(-1, CHANNELS)
+
+
+def load(path, sample_rate=numpy_mixer.MIX_SAMPLE_RATE, ffmpeg=None):
+    # 回傳 (frames, 2) float32 的唯讀 memmap；未快取時解碼一次並寫入快取
+    cached = lookup(path, sample_rate)
+    if cached is None:
+        pcm = numpy_mixer.decode(path, ffmpeg, sample_rate)
+        cached = pcm_path(path, sample_rate)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pcm.tofile(tmp)
+        os.replace(tmp, cached)
+        prune(keep=cached)
+    return _map(cached)
+
+
+def load_many(paths, sample_rate=numpy_mixer.MIX_SAMPLE_RATE, ffmpeg=None):
+    with ThreadPoolExecutor(max_workers=min(8, len(paths)) or 1) as pool:
+        return list(pool.map(lambda p: load(p, sample_rate, ffmpeg), paths))
+
+
+def _entries():
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    out = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith('.f32'):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        out.append((st.st_mtime, st.st_size, path))
+    return sorted(out)
+
+
+def prune(max_bytes=None, keep=None, dry_run=False):
+    # 由最久未使用的開始刪除，直到總大小不超過 max_bytes；回傳 (刪除數, 釋放位元組)
+    # 仍被映射中的檔案在 Windows 上無法刪除，略過即可
+    limit = MAX_BYTES if max_bytes is None else max_bytes
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    removed, freed = 0, 0
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        if path == keep:
+            continue
+        if not dry_run:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+def set_max_bytes(max_bytes):
+    global MAX_BYTES
+    MAX_BYTES = max_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解碼後 PCM 快取")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('prune', help="依最後使用時間淘汰，直到總大小不超過上限")
+    p.add_argument('--max-mb', type=float, default=MAX_BYTES / (1 << 20))
+    p.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    removed, freed = prune(int(args.max_mb * (1 << 20)), dry_run=args.dry_run)
+    verb = "可清除" if args.dry_run else "已清除"
+    print(f"🧹 {verb} {removed} 個 PCM 快取檔 ({freed / (1 << 20):.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+pipeline.py — 冬山鄉探險隊：管線任務圖
+
+把 TTS、BGM、混音拆成以主題為單位的任務，依相依關係在同一個行程內執行：
+TTS (網路) 與 BGM (CPU) 互不等待。每個主題的語音全部完成即視為該主題的完成事件，
+立刻量測長度與響度 (ana)，後面的主題仍在合成時，配樂一就緒就能開始混音。
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import catalog
+import tracing
+
+
+class Task:
+    def __init__(self, name, fn, deps=(), blocking=False):
+        # fn 為 async 函式，或 blocking=True 時放進執行緒池的一般函式
+        # 回傳 False 或拋出例外視為失敗
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.blocking = blocking
+
+
+class TaskGraph:
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, fn, deps=(), blocking=False):
+        if name in self.tasks:
+            raise ValueError(f"duplicate task: {name}")
+        self.tasks[name] = Task(name, fn, deps, blocking)
+        return name
+
+    def validate(self):
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"{task.name} depends on unknown task {dep}")
+        # 拓撲排序檢查循環相依
+        order, state = [], {}
+
+        def visit(name):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"dependency cycle at {name}")
+            state[name] = 'visiting'
+            for dep in self.tasks[name].deps:
+                visit(dep)
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.tasks:
+            visit(name)
+        return order
+
+    async def run(self, max_workers=None):
+        # 回傳 {name: {'status': ok|failed|skipped, 'elapsed': 秒, 'error': str|None}}
+        self.validate()
+        loop = asyncio.get_running_loop()
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {name: loop.create_future() for name in self.tasks}
+        results = {}
+
+        async def run_task(task):
+            dep_ok = True
+            for dep in task.deps:
+                dep_ok = await futures[dep] and dep_ok
+            if not dep_ok:
+                results[task.name] = {'status': 'skipped', 'elapsed': 0.0, 'error': None}
+                futures[task.name].set_result(False)
+                return
+            start = time.monotonic()
+            error = None
+            try:
+                # 任務在事件迴圈上互相重疊，以 async 區段記錄；分類為階段前綴 (tts、bgm …)
+                with tracing.span(task.name, task.name.split(':')[0], is_async=True):
+                    if task.blocking:
+                        ok = await loop.run_in_executor(pool, task.fn)
+                    else:
+                        ok = await task.fn()
+            except Exception as e:
+                ok, error = False, f"{type(e).__name__}: {e}"
+            ok = ok is not False and error is None
+            results[task.name] = {
+                'status': 'ok' if ok else 'failed',
+                'elapsed': time.monotonic() - start,
+                'error': error,
+            }
+            futures[task.name].set_result(ok)
+
+        try:
+            await asyncio.gather(*(run_task(t) for t in self.tasks.values()))
+        finally:
+            pool.shutdown(wait=True)
+        return results
+
+
+def set_preview():
+    # 預覽模式 (run_all.py --test)：10 秒低取樣率配樂、快速編碼、每種來源一種格式
+    import generate_bgm
+    import mix_audio
+    import encode_profiles
+
+    generate_bgm.set_preview()
+    mix_audio.set_preview()
+    encode_profiles.set_preview()
+
+
+def _selection(selection, preview):
+    # 未指定範圍時建置預設導覽全部主題；預覽模式每個主題只取第一幕
+    selection = selection or catalog.Selection()
+    return selection.preview() if preview else selection
+
+
+def _voices(voices):
+    # 未指定時只建置預設語音；其他設定檔需以 --voice (或 --voice all) 明確要求
+    import generate_story_audio
+
+    return voices or [generate_story_audio.DEFAULT_VOICE]
+
+
+def build_graph(force=False, preview=False, selection=None, voices=None):
+    # 延後匯入：各模組在匯入時會以目前目錄建立輸出資料夾
+    import generate_story_audio
+    import generate_bgm
+    import mix_audio
+    import encode_profiles
+
+    selection = _selection(selection, preview)
+    tour = selection.tour
+    voices = _voices(voices)
+    os.makedirs(generate_bgm.MIDI_DIR, exist_ok=True)
+    os.makedirs(generate_bgm.MP3_DIR, exist_ok=True)
+
+    graph = TaskGraph()
+    if preview:
+        # 本機替身：不連網、不限速，輸出靜音 MP3
+        from fake_tts import FakeTTSBackend
+        scheduler = generate_story_audio.make_scheduler(FakeTTSBackend(latency=0.0, jitter=0.0), rate=0)
+    else:
+        scheduler = generate_story_audio.make_scheduler()
+    manifest = generate_story_audio.tts_cache.load_manifest()
+
+    def tts_task(jobs):
+        async def run():
+            hits, ok, failed, retried = await generate_story_audio.build_tts(
+                jobs, scheduler, manifest)
+            return failed == 0
+        return run
+
+    def enc_task(paths):
+        # 各主題的編碼任務已同時進行，每個任務內逐檔編碼
+        def run():
+            results = encode_profiles.encode_files(encode_profiles.source_items(paths=paths), jobs=1)
+            return 'failed' not in encode_profiles.summarize(results)
+        return run
+
+    # 混音只用預設語音：只有預設語音的 TTS 任務擋在分析、混音與編碼之前；
+    # 其他語音設定檔各自是獨立的 tts:<主題>:<語音> 任務，失敗時照樣回報但不影響混音
+    default = generate_story_audio.DEFAULT_VOICE
+    extra_voices = [v for v in voices if v != default]
+    groups = ([('welcome', selection.intro)] if selection.intro else []) + \
+             [(theme['id'], scenes) for theme, scenes in selection.themes]
+
+    def default_tts(name, scenes):
+        # 回傳 (相依任務, 預設語音的輸出路徑)；沒有建置預設語音時沿用既有檔案
+        if default not in voices:
+            return [], []
+        jobs = generate_story_audio.scene_jobs(scenes, tour, [default])
+        return [graph.add(f'tts:{name}', tts_task(jobs))], [job[1] for job in jobs]
+
+    if selection.intro:
+        deps, paths = default_tts('welcome', selection.intro)
+        if paths:
+            graph.add('enc:welcome', enc_task(paths), deps=deps, blocking=True)
+
+    # 只選到個別場景時，配樂沿用既有檔案 (仍依快取檢查)，不強制重新渲染
+    for (theme, scenes), item in zip(selection.themes, mix_audio.mix_items(selection)):
+        tid = theme['id']
+        tts, tts_paths = default_tts(tid, scenes)
+        ana = graph.add(f'ana:{tid}', lambda paths=item[3]: mix_audio.analyze_clips(paths),
+                        deps=tts, blocking=True)
+        bgm = graph.add(f'bgm:{tid}',
+                        lambda theme=catalog.bgm_theme(theme), rebuild=force and tid in selection.bgm_themes:
+                            generate_bgm.render_theme(theme, force=rebuild, tour=tour),
+                        blocking=True)
+        mix = graph.add(f'mix:{tid}', lambda item=item: mix_audio.mix_story(*item),
+                        deps=[ana, bgm], blocking=True)
+        _, mix_path, bgm_path, _ = item
+        graph.add(f'enc:{tid}', enc_task([*tts_paths, bgm_path, mix_path]),
+                  deps=[mix], blocking=True)
+
+    # 其他語音最後才加入：任務依加入順序排進共用的排程器，預設語音先合成
+    for voice in extra_voices:
+        for name, scenes in groups:
+            jobs = generate_story_audio.scene_jobs(scenes, tour, [voice])
+            tts = graph.add(f'tts:{name}:{voice}', tts_task(jobs))
+            graph.add(f'enc:{name}:{voice}', enc_task([job[1] for job in jobs]),
+                      deps=[tts], blocking=True)
+    return graph
+
+
+
+def plan(preview=False, selection=None, voices=None):
+    # 不執行任何任務，只回報各主題哪些產物會重建：
+    # [(tid, {'fresh': n, 'restore': n, 'build': n}, bgm 狀態, mix 狀態), ...]
+    import generate_story_audio
+    import generate_bgm
+    import mix_audio
+
+    selection = _selection(selection, preview)
+    tour = selection.tour
+    voices = _voices(voices)
+    manifest = generate_story_audio.tts_cache.load_manifest()
+    bgm_states = generate_bgm.plan([catalog.bgm_theme(t) for t, _ in selection.themes], tour=tour)
+    rows = []
+    if selection.intro:
+        welcome = generate_story_audio.plan_tts(
+            generate_story_audio.scene_jobs(selection.intro, tour, voices), manifest)
+        rows.append(('welcome', _count(welcome), None, None))
+    for (theme, scenes), item in zip(selection.themes, mix_audio.mix_items(selection)):
+        tid = theme['id']
+        tts_states = generate_story_audio.plan_tts(
+            generate_story_audio.scene_jobs(scenes, tour, voices), manifest)
+        bgm_state = bgm_states.get(tid, 'build')
+        # 上游任何產物會變動時，混音必定重建
+        if bgm_state != 'fresh' or any(st != 'fresh' for st in tts_states):
+            mix_state = 'build'
+        else:
+            mix_state = mix_audio.plan_theme(*item)
+        rows.append((tid, _count(tts_states), bgm_state, mix_state))
+    return rows
+
+
+def _count(states):
+    return {st: states.count(st) for st in ('fresh', 'restore', 'build')}
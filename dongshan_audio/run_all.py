@@ -2,50 +2,129 @@
 run_all.py — 冬山鄉探險隊：一鍵生成
 """
 
-import subprocess
+import argparse
+import asyncio
 import sys
 import os
+import unicodedata
 
 # Windows 終端機 UTF-8 支援
 if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
     sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 
 
-SCRIPTS = [
-    ("🎙️ 步驟 1/3：生成探險隊導覽語音 (TTS)", "generate_story_audio.py"),
-    ("🎵 步驟 2/3：生成景點主題配樂 (BGM)", "generate_bgm.py"),
-    ("🎧 步驟 3/3：混合最終音訊 (Mix)", "mix_audio.py"),
+STAGES = [
+    ("🎙️ 導覽語音 (TTS)", "tts"),
+    ("🔎 語音分析 (Analyze)", "ana"),
+    ("🎵 主題配樂 (BGM)", "bgm"),
+    ("🎧 最終混音 (Mix)", "mix"),
+    ("📦 多格式編碼 (Encode)", "enc"),
 ]
 
 
+TRACE_PATH = "pipeline_trace.json"
+PREVIEW_DIR = "preview"   # --test 的輸出全部放在這裡，不動到正式產物
+
+
+PLAN_LABELS = {'fresh': "最新", 'restore': "取回", 'build': "重建", None: "--"}
+
+
+def _pad(text, width):
+    # 中文字佔兩格寬，以顯示寬度補空白對齊
+    shown = sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text)
+    return text + " " * max(0, width - shown)
+
+
+def print_plan(rows):
+    print("\n📋 建置計畫 (TTS 欄位：需合成 / 由快取取回 / 共幾幕)")
+    print(f"  {_pad('主題', 12)}{'TTS':<12}{'BGM':<8}{'混音'}")
+    for tid, tts, bgm, mix in rows:
+        total = sum(tts.values())
+        tts_col = f"{tts['build']}/{tts['restore']}/{total}"
+        print(f"  {tid:<12}{tts_col:<12}{_pad(PLAN_LABELS[bgm], 8)}{PLAN_LABELS[mix]}")
+
+
+def parse_args():
+    import catalog
+    import ffmpeg_tool
+
+    parser = argparse.ArgumentParser(description="冬山音訊生成管線")
+    parser.add_argument('--force', action='store_true', help="強制重新渲染配樂")
+    parser.add_argument('--plan', action='store_true', help="只列出建置計畫，不執行")
+    parser.add_argument('--profile', action='store_true', help=f"記錄追蹤並寫入 {TRACE_PATH}")
+    parser.add_argument('--test', action='store_true', help=f"快速預覽，輸出於 {PREVIEW_DIR}/")
+    parser.add_argument('--voice', default=None,
+                        help="語音設定檔，逗號分隔，all 為全部；預設只有 default")
+    ffmpeg_tool.add_args(parser)
+    catalog.add_selector_args(parser)
+    args = parser.parse_args()
+    ffmpeg_tool.apply_args(args)
+    return args, catalog.Selection.from_args(args)
+
+
 def main():
-    test_flag = ["--test"] if "--test" in sys.argv else []
+    args, selection = parse_args()
+    force, profile, preview = args.force, args.profile, args.test
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
+    # 各階段模組以相對路徑讀寫輸出資料夾
+    out_dir = os.path.join(script_dir, PREVIEW_DIR) if preview else script_dir
+    os.makedirs(out_dir, exist_ok=True)
+    os.chdir(out_dir)
+    sys.path.insert(0, script_dir)
+    import generate_story_audio
+    import pipeline
+    import tracing
+
+    voices = generate_story_audio.parse_voices(args.voice) if args.voice else None
+
+    if preview:
+        pipeline.set_preview()
 
     print("=" * 50)
-    print("🏡 冬山鄉探險隊 — 音訊生成管線")
+    print(f"🏡 冬山鄉探險隊 — 音訊生成管線 ({selection.tour})")
+    if preview:
+        print(f"⚡ 預覽模式：每主題一幕、10 秒配樂、替身 TTS，輸出於 {PREVIEW_DIR}/")
     print("=" * 50)
 
-    for title, script in SCRIPTS:
-        print(f"\n{'─' * 50}")
-        print(f"{title}")
-        print(f"{'─' * 50}")
+    print_plan(pipeline.plan(preview, selection, voices))
+    if args.plan:
+        return
+
+    if profile:
+        tracing.enable()
+    print("\n  TTS 與 BGM 同時進行，各主題語音完成即先分析，素材齊全後立即混音並編碼")
+    graph = pipeline.build_graph(force=force, preview=preview, selection=selection, voices=voices)
+    with tracing.span("run_all", "pipeline"):
+        results = asyncio.run(graph.run())
+    if profile:
+        tracing.export(TRACE_PATH)
+        tracing.print_summary()
+        print(f"\n  🔍 追蹤檔: {TRACE_PATH} (以 chrome://tracing 或 ui.perfetto.dev 開啟)")
 
-        result = subprocess.run(
-            [sys.executable, os.path.join(script_dir, script)] + test_flag,
-            cwd=script_dir,
-        )
+    print(f"\n{'─' * 50}")
+    failed = []
+    for title, prefix in STAGES:
+        stage = {n: r for n, r in results.items() if n.split(':')[0] == prefix}
+        done = sum(1 for r in stage.values() if r['status'] == 'ok')
+        slowest = max((r['elapsed'] for r in stage.values()), default=0.0)
+        print(f"{title}: {done}/{len(stage)} 完成 (最長 {slowest:.1f}s)")
+        failed += [(n, r) for n, r in stage.items() if r['status'] != 'ok']
 
-        if result.returncode != 0:
-            print(f"\n❌ {script} 執行失敗 (exit code: {result.returncode})")
-            sys.exit(1)
+    if failed:
+        for name, r in failed:
+            reason = r['error'] or ("相依任務失敗" if r['status'] == 'skipped' else "回報失敗")
+            print(f"  ❌ {name}: {reason}")
+        sys.exit(1)
 
     print(f"\n{'=' * 50}")
     print("🎉 全部完成！")
-    print(f"   📁 TTS 語音:    tts_audio/")
-    print(f"   📁 MIDI 檔案:   bgm_midi/")
-    print(f"   📁 BGM 音訊:    bgm_mp3/")
-    print(f"   📁 最終輸出:    final_output/")
+    prefix = f"{PREVIEW_DIR}/" if preview else ""
+    print(f"   📁 TTS 語音:    {prefix}tts_audio/")
+    print(f"   📁 MIDI 檔案:   {prefix}bgm_midi/")
+    print(f"   📁 BGM 音訊:    {prefix}bgm_mp3/")
+    print(f"   📁 最終輸出:    {prefix}final_output/")
+    print(f"   📁 多格式輸出:  {prefix}encoded/")
     print(f"{'=' * 50}")
 
 
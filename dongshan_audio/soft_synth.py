@@ -0,0 +1,136 @@
+"""
+soft_synth.py — 冬山鄉探險隊：內建 NumPy 軟體合成器
+
+沒有 FluidSynth 的機器 (例如 Linux 建置機) 用這個把 gen_note_events 的音符
+直接合成為 (frames, 2) float32 緩衝區，再交給 Pedalboard 效果鏈，不經過 MIDI 檔。
+
+每個 GM 樂器依家族對應到一組聲音：加法合成的單週期波表 + ADSR 包絡。
+同一聲道、同樣長度的音符共用一條包絡，整批一起查表、相乘，
+再逐音符以向量加法疊回輸出，不做逐取樣的迴圈。
+"""
+
+import numpy as np
+
+TABLE_SIZE = 4096
+BATCH_SAMPLES = 1 << 21   # 每批最多處理的取樣數，限制暫存陣列大小
+MASTER_GAIN = 0.3
+PEAK_LIMIT = 0.89         # 約 -1 dBFS
+
+# 聲音設定：harmonics 為各泛音的振幅；adsr 為 (attack 秒, decay 秒, sustain, release 秒)
+# decay 為指數衰減的時間常數，sustain = 0 即為敲擊、撥弦類
+VOICES = {
+    'piano':   dict(harmonics=[1, 0.5, 0.3, 0.15, 0.1, 0.05], adsr=(0.005, 0.8, 0.2, 0.3)),
+    'mallet':  dict(harmonics=[1, 0, 0.25, 0, 0.08], adsr=(0.002, 0.5, 0.0, 0.4)),
+    'organ':   dict(harmonics=[1, 1, 0.5, 0.5, 0.25], adsr=(0.02, 0.1, 0.9, 0.1)),
+    'pluck':   dict(harmonics=[1, 0.6, 0.4, 0.25, 0.15, 0.1], adsr=(0.003, 0.4, 0.0, 0.3)),
+    'strings': dict(harmonics=[1 / k for k in range(1, 9)], adsr=(0.15, 0.3, 0.8, 0.5), detune=1.004),
+    'voice':   dict(harmonics=[1, 0.35, 0.2, 0.08], adsr=(0.25, 0.4, 0.8, 0.6), detune=1.003),
+    'brass':   dict(harmonics=[1, 0.8, 0.6, 0.5, 0.4, 0.3], adsr=(0.05, 0.2, 0.7, 0.2)),
+    'reed':    dict(harmonics=[1, 0, 0.5, 0, 0.3, 0, 0.2], adsr=(0.05, 0.2, 0.8, 0.2)),
+    'pipe':    dict(harmonics=[1, 0.2, 0.05], adsr=(0.08, 0.2, 0.8, 0.25), noise=0.02),
+    'pad':     dict(harmonics=[1, 0.5, 0.33, 0.25], adsr=(0.6, 0.5, 0.8, 1.0), detune=1.006),
+    'drum':    dict(harmonics=[1, 0.3], adsr=(0.001, 0.15, 0.0, 0.1), noise=0.6),
+}
+
+# GM 樂器編號 // 8 → 家族
+FAMILIES = [
+    'piano', 'mallet', 'organ', 'pluck', 'pluck', 'strings', 'strings', 'brass',
+    'reed', 'pipe', 'brass', 'pad', 'pad', 'pluck', 'drum', 'drum',
+]
+# 家族內聲音差異大的樂器
+PROGRAM_VOICES = {46: 'pluck', 47: 'drum', 52: 'voice', 53: 'voice', 54: 'voice', 91: 'voice'}
+
+# 各聲道的左右位置 (-1 左 ~ 1 右)
+CHANNEL_PAN = {0: 0.15, 1: -0.25, 2: 0.0}
+
+_INDEX_SHIFT = np.uint32(32 - 12)  # TABLE_SIZE = 2 ** 12
+_tables = {}
+_noise = np.random.default_rng(0).uniform(-1.0, 1.0, 1 << 16).astype(np.float32)
+
+
+def voice_for(program):
+    return PROGRAM_VOICES.get(program, FAMILIES[program // 8])
+
+
+def wavetable(voice):
+    if voice not in _tables:
+        x = np.arange(TABLE_SIZE) / TABLE_SIZE
+        table = sum(a * np.sin(2 * np.pi * (k + 1) * x)
+                    for k, a in enumerate(VOICES[voice]['harmonics']) if a)
+        _tables[voice] = (table / np.abs(table).max()).astype(np.float32)
+    return _tables[voice]
+
+
+def envelope(n_on, n_total, sample_rate, attack, decay, sustain, release):
+    # 前 n_on 個取樣為按住的階段，之後依 release 線性收尾
+    t = np.arange(n_total) / sample_rate
+    env = np.where(t < attack, t / attack,
+                   sustain + (1 - sustain) * np.exp(-(t - attack) / decay))
+    if n_total > n_on:
+        level = env[max(n_on - 1, 0)]
+        env[n_on:] = level * np.clip(1 - (t[n_on:] - t[n_on]) / release, 0, None)
+    return env.astype(np.float32)
+
+
+def _render_batch(voice, freqs, gains, n_on, sample_rate):
+    # 同一聲音、同樣長度的一批音符 → (音符數, 取樣數)
+    cfg = VOICES[voice]
+    attack, decay, sustain, release = cfg['adsr']
+    n_total = n_on + int(release * sample_rate)
+    env = envelope(n_on, n_total, sample_rate, max(attack, 1 / sample_rate), decay, sustain, release)
+
+    # 32 位元相位累加器：溢位即自然繞回一個週期，高位元直接當波表索引
+    table = wavetable(voice)
+    n = np.arange(n_total, dtype=np.uint32)
+    step = np.round(freqs / sample_rate * 2.0 ** 32).astype(np.uint32)
+    wave = table[(step[:, None] * n[None, :]) >> _INDEX_SHIFT]
+    if 'detune' in cfg:
+        step = np.round(freqs * cfg['detune'] / sample_rate * 2.0 ** 32).astype(np.uint32)
+        wave += table[(step[:, None] * n[None, :]) >> _INDEX_SHIFT]
+        wave *= 0.5
+    if 'noise' in cfg:
+        wave *= 1 - cfg['noise']
+        wave += np.resize(_noise, n_total) * cfg['noise']
+    wave *= env
+    wave *= gains[:, None]
+    return wave
+
+
+def render(notes, programs, bpm, sample_rate=44100):
+    # notes 為 midi_events.NOTE_DTYPE 陣列 (時間以拍為單位)；回傳 (frames, 2) float32
+    sec_per_beat = 60.0 / bpm
+    program_of = dict(programs)
+    starts = np.round(notes['t'] * sec_per_beat * sample_rate).astype(np.int64)
+    lengths = np.maximum(np.round(notes['dur'] * sec_per_beat * sample_rate).astype(np.int64), 1)
+    freqs = 440.0 * 2.0 ** ((notes['note'].astype(np.float64) - 69) / 12)
+    gains = (notes['vel'].astype(np.float32) / 127) ** 2
+
+    max_release = max(cfg['adsr'][3] for cfg in VOICES.values())
+    n_frames = int((starts + lengths).max() + max_release * sample_rate) + 1 if len(notes) else 0
+    out = np.zeros((n_frames, 2), dtype=np.float32)
+    bus = np.zeros(n_frames, dtype=np.float32)
+
+    groups = np.stack([notes['ch'].astype(np.int64), lengths], axis=1)
+    for ch in np.unique(groups[:, 0]):
+        # 每個聲道先疊在單聲道匯流排上，最後一次定位到左右聲道
+        bus[:] = 0
+        voice = voice_for(program_of.get(ch, 0))
+        n_release = int(VOICES[voice]['adsr'][3] * sample_rate)
+        for n_on in np.unique(groups[groups[:, 0] == ch, 1]):
+            idx = np.flatnonzero((groups[:, 0] == ch) & (groups[:, 1] == n_on))
+            per_batch = max(1, BATCH_SAMPLES // (n_on + n_release))
+            for i in range(0, len(idx), per_batch):
+                batch = idx[i:i + per_batch]
+                samples = _render_batch(voice, freqs[batch], gains[batch], n_on, sample_rate)
+                # 整批合成後逐一疊加到各自的位移 (每個音符一次向量加法)
+                for start, row in zip(starts[batch], samples):
+                    bus[start:start + len(row)] += row
+        pan = CHANNEL_PAN.get(ch, 0.0)
+        out[:, 0] += bus * np.float32(np.cos((pan + 1) * np.pi / 4))
+        out[:, 1] += bus * np.float32(np.sin((pan + 1) * np.pi / 4))
+
+    out *= MASTER_GAIN
+    peak = np.abs(out).max() if n_frames else 0.0
+    if peak > PEAK_LIMIT:
+        out *= PEAK_LIMIT / peak
+    return out
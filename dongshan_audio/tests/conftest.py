@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# 各模組以平面方式互相匯入 (import mix_audio)，與直接執行腳本時相同
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # 模組以相對路徑讀寫輸出與快取，測試一律在暫存目錄中執行
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
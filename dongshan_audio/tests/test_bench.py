@@ -0,0 +1,26 @@
+import bench
+
+
+def _run(suites, results):
+    return {'version': bench.BENCH_VERSION, 'suites': suites, 'results': results}
+
+
+BASELINE = _run(['mix', 'tts'], {
+    'mix_story:ffmpeg': {'median': 1.0, 'suite': 'mix'},
+    'tts_scheduler': {'median': 1.0, 'suite': 'tts'},
+})
+
+
+def test_crashed_suite_counts_as_regression():
+    current = _run(['mix', 'tts'], {
+        'mix': {'error': "RuntimeError: mix_story failed (ffmpeg)"},
+        'tts_scheduler': {'median': 1.05, 'suite': 'tts'},
+    })
+    rows = {name: (cur, regressed) for name, _, cur, _, regressed in bench.compare(BASELINE, current)}
+    assert rows == {'mix_story:ffmpeg': (None, True), 'tts_scheduler': (1.05, False)}
+
+
+def test_suites_not_run_are_skipped():
+    current = _run(['tts'], {'tts_scheduler': {'median': 1.5, 'suite': 'tts'}})
+    rows = bench.compare(BASELINE, current)
+    assert [(name, regressed) for name, _, _, _, regressed in rows] == [('tts_scheduler', True)]
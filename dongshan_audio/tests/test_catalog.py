@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import catalog
+from catalog import CatalogError, Selection
+
+
+def _ids(scenes):
+    return [s['id'] for s in scenes]
+
+
+def test_parse_ids():
+    assert catalog.parse_ids("2-4, 15,,") == {2, 3, 4, 15}
+    assert catalog.parse_ids(None) == set()
+    with pytest.raises(CatalogError):
+        catalog.parse_ids("2-x")
+
+
+def test_unrestricted_selects_everything():
+    sel = Selection()
+    assert sel.tour == "dongshan"
+    assert _ids(sel.intro) == [1]
+    assert len(sel.themes) == 8 and len(sel.scenes()) == 65
+    assert len(sel.bgm_themes) == 8
+
+
+def test_theme_selects_its_scenes_and_bgm():
+    sel = Selection(themes="river,lake")
+    assert sel.intro == []
+    assert [t['id'] for t, _ in sel.themes] == ["river", "lake"]
+    assert _ids(sel.scenes()) == list(range(10, 26))
+    assert sel.bgm_themes == {"river", "lake"}
+
+
+def test_scene_only_selection_keeps_bgm_and_full_mix():
+    sel = Selection(scenes="1,9-10")
+    assert _ids(sel.scenes()) == [1, 9, 10]
+    # 只改了個別場景：配樂不重新渲染，混音仍用主題的全部場景
+    assert sel.bgm_themes == set()
+    theme, scenes = sel.themes[0]
+    assert theme['id'] == "train" and _ids(scenes) == [9]
+    assert _ids(sel.mix_scenes(theme)) == list(range(2, 10))
+
+
+def test_theme_and_scene_are_combined():
+    sel = Selection(themes="forest", scenes="2")
+    assert _ids(sel.scenes()) == [2] + list(range(58, 66))
+    assert sel.bgm_themes == {"forest"}
+
+
+def test_preview_keeps_first_scene_of_each_theme():
+    sel = Selection(themes="train,farm").preview()
+    assert _ids(sel.scenes()) == [2, 42]
+    theme = sel.themes[0][0]
+    assert _ids(sel.mix_scenes(theme)) == [2]
+
+
+@pytest.mark.parametrize('kwargs', [{'tour': "nowhere"}, {'themes': "moon"}, {'scenes': "999"}])
+def test_unknown_selection_raises(kwargs):
+    with pytest.raises(CatalogError):
+        Selection(**kwargs)
+
+
+def test_output_paths_flat_and_sharded(monkeypatch):
+    data = catalog.load()
+    sharded = {'themes': [{'id': "t", 'scenes': [{'id': 1234}]}]}
+    monkeypatch.setattr(catalog, 'load', lambda: {**data, 'tours': {**data['tours'], 'big': sharded}})
+
+    assert catalog.tts_path("dongshan", 2) == os.path.join("tts_audio", "00002.mp3")
+    assert catalog.tts_path(None, 2, "male") == os.path.join("tts_audio", "voices", "male", "00002.mp3")
+    assert catalog.bgm_path("dongshan", "train") == os.path.join("bgm_mp3", "bgm_train.mp3")
+    assert catalog.tts_path("big", 1234) == os.path.join("tts_audio", "big", "001", "01234.mp3")
+    assert catalog.mix_path("big", {'output': "t_story"}) == os.path.join("final_output", "big",
+                                                                        "t_story.mp3")
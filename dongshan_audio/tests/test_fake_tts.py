@@ -0,0 +1,27 @@
+import asyncio
+
+from fake_tts import FakeTTSBackend, FakeTTSClient, FakeTTSError, FakeTTSServer
+
+
+def test_server_outcomes_match_backend(tmp_path):
+    # 同一個種子下，TCP 服務與行程內替身依序得到相同的結果
+    behaviour = dict(latency=0.0, jitter=0.0, error_rate=0.5, seed=3)
+    backend = FakeTTSBackend(**behaviour)
+    expected = [backend.roll()[0] for _ in range(8)]
+    assert set(expected) == {'ok', 'error'}
+
+    async def run():
+        outcomes = []
+        async with FakeTTSServer(**behaviour) as server:
+            client = FakeTTSClient(server.host, server.port)
+            for i in range(8):
+                try:
+                    await client("測試", str(tmp_path / f"{i}.mp3"))
+                    outcomes.append('ok')
+                except FakeTTSError:
+                    outcomes.append('error')
+            return outcomes, server.backend
+
+    outcomes, served = asyncio.run(run())
+    assert outcomes == expected
+    assert (served.calls, served.failures) == (8, expected.count('error'))
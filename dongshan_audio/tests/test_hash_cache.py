@@ -0,0 +1,31 @@
+import os
+
+from hash_cache import HashCache
+
+
+def test_same_content_computed_once_and_persisted(workdir):
+    for name in ("a.bin", "b.bin"):
+        with open(name, 'wb') as f:
+            f.write(b"same")
+    calls = []
+    cache = HashCache("cache.json", 'values', 1)
+    assert cache.get("a.bin", lambda p: calls.append(p) or 1.5) == 1.5
+    assert cache.get("b.bin", lambda p: calls.append(p) or 2.5) == 1.5
+    assert calls == ["a.bin"]
+    cache.save()
+
+    reloaded = HashCache("cache.json", 'values', 1)
+    assert reloaded.get("a.bin", lambda p: 9.0) == 1.5
+    # 版本不符時整份捨棄
+    assert HashCache("cache.json", 'values', 2).get("a.bin", lambda p: 9.0) == 9.0
+
+
+def test_changed_file_is_rehashed(workdir):
+    with open("a.bin", 'wb') as f:
+        f.write(b"old")
+    cache = HashCache()
+    before = cache.digest("a.bin")
+    with open("a.bin", 'wb') as f:
+        f.write(b"newer")
+    assert cache.digest("a.bin") != before
+    assert cache.get("a.bin", lambda p: os.path.getsize(p)) == 5
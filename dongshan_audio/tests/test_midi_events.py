@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import midi_events
+
+midiutil = pytest.importorskip('midiutil')
+
+
+def _midiutil_bytes(tmp_path, notes, programs, bpm, num_tracks=3):
+    # 原本 events_to_midi 的寫法：MIDIFile + addTempo + addProgramChange / addNote(ch, ch, ...)
+    mid = midiutil.MIDIFile(num_tracks)
+    mid.addTempo(0, 0, bpm)
+    for ch, program in programs:
+        mid.addProgramChange(ch, ch, 0, program)
+    for n in notes:
+        mid.addNote(int(n['ch']), int(n['ch']), int(n['note']), float(n['t']), float(n['dur']),
+                    int(n['vel']))
+    path = tmp_path / "midiutil.mid"
+    with open(path, 'wb') as f:
+        mid.writeFile(f)
+    return path.read_bytes()
+
+
+def _write_smf_bytes(tmp_path, notes, programs, bpm, num_tracks=3):
+    path = tmp_path / "direct.mid"
+    midi_events.write_smf(str(path), notes, programs, bpm, num_tracks)
+    return path.read_bytes()
+
+
+def test_theme_matches_midiutil(tmp_path, workdir):
+    generate_bgm = pytest.importorskip('generate_bgm')
+    theme = generate_bgm.THEMES[0]
+    notes, programs = generate_bgm.gen_note_events(theme, 60)
+    assert len(notes) > 100
+    assert (_write_smf_bytes(tmp_path, notes, programs, theme['bpm'])
+            == _midiutil_bytes(tmp_path, notes, programs, theme['bpm']))
+
+
+def test_overlapping_same_pitch_notes_match_midiutil(tmp_path):
+    # 同音高重疊 (deinterleave)、重複音符與不落在整數 tick 的時間，都要與 midiutil 相同
+    rows = [
+        (0.0, 2.0, 60, 80, 0), (1.0, 2.0, 60, 90, 0),      # 重疊
+        (0.5, 1.0, 64, 70, 0), (0.5, 1.0, 64, 70, 0),      # 重複
+        (2.0004, 0.3333, 67, 60, 1), (2.5, 1.0, 67, 60, 1),
+        (4.0, 1.0, 48, 100, 2), (3.0, 1.0, 48, 100, 2),    # 加入順序與時間相反
+    ]
+    notes = np.array(rows, dtype=midi_events.NOTE_DTYPE)
+    programs = [(0, 0), (1, 33), (2, 48)]
+    assert (_write_smf_bytes(tmp_path, notes, programs, 96)
+            == _midiutil_bytes(tmp_path, notes, programs, 96))
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from fake_tts import silent_mp3
+
+
+@pytest.fixture
+def mix(workdir, monkeypatch):
+    import mix_audio
+
+    monkeypatch.setattr(mix_audio, 'GAIN_MODE', "loudness")
+    monkeypatch.setattr(mix_audio, '_durations', None)
+    monkeypatch.setattr(mix_audio, '_loudness', None)
+    os.makedirs("bgm_mp3")
+    os.makedirs("tts_audio")
+    with open(os.path.join("bgm_mp3", "bgm_test.mp3"), 'wb') as f:
+        f.write(silent_mp3(10))
+    return mix_audio
+
+
+def _item(theme_id, clips):
+    return (theme_id, os.path.join("final_output", f"{theme_id}.mp3"),
+            os.path.join("bgm_mp3", "bgm_test.mp3"), clips)
+
+
+def test_missing_clip_in_loudness_mode_fails_theme(mix, monkeypatch):
+    # 量完長度後檔案就不見了 (例如同時重建 TTS)：響度量測的例外不可跑出 mix_story
+    missing = os.path.join("tts_audio", "00002.mp3")
+
+    def probe_then_delete(path):
+        os.remove(path)
+        return 3.0
+
+    def write_clip():
+        with open(missing, 'wb') as f:
+            f.write(silent_mp3(3))
+
+    monkeypatch.setattr(mix, 'get_audio_duration', probe_then_delete)
+    write_clip()
+
+    state, reason = mix.prepare_mix(*_item('test', [missing]))
+    assert state == 'failed'
+    assert "響度量測失敗" in reason
+    write_clip()
+    assert mix.mix_story(*_item('test', [missing])) is False
+
+
+def test_one_failing_theme_does_not_abort_batch(mix, monkeypatch):
+    def prepare(theme_id, *args):
+        if theme_id == 'bad':
+            raise RuntimeError("boom")
+        return 'done', None
+
+    monkeypatch.setattr(mix, 'prepare_mix', prepare)
+    results = asyncio.run(mix.mix_all_async([_item('bad', []), _item('good', [])], jobs=2))
+    assert [(tid, ok) for tid, ok, _, _ in results] == [('bad', False), ('good', True)]
+    assert "boom" in results[0][3]
+
+
+def test_prepare_runs_concurrently_across_themes(mix, monkeypatch):
+    # 響度分析在 prepare_mix 內；兩個主題必須同時進入，事件迴圈上逐一執行時 barrier 會逾時
+    barrier = threading.Barrier(2, timeout=5)
+
+    def prepare(*args):
+        barrier.wait()
+        return 'done', None
+
+    monkeypatch.setattr(mix, 'prepare_mix', prepare)
+    results = asyncio.run(mix.mix_all_async([_item('a', []), _item('b', [])], jobs=2))
+    assert [ok for _, ok, _, _ in results] == [True, True]
+
+def test_loudness_mode_output_meets_target(mix, monkeypatch):
+    # 語音之間的空白與 BGM 淡入淡出會讓逐檔算出的增益偏離目標約 1 LU，成品需補正回來
+    import loudness
+    import numpy_mixer
+    import pcm_cache
+
+    rate = numpy_mixer.MIX_SAMPLE_RATE
+    rng = np.random.default_rng(0)
+    t = np.arange(12 * rate) / rate
+    tone = 0.05 * np.sin(2 * np.pi * 220 * t)
+    sources = {
+        "bgm": np.stack([tone, tone], axis=1).astype(np.float32),
+        "a": (0.3 * rng.standard_normal((3 * rate, 2))).astype(np.float32),
+        "b": (0.02 * rng.standard_normal((2 * rate, 2))).astype(np.float32),
+    }
+    for name in sources:
+        with open(name, 'wb') as f:
+            f.write(name.encode())
+    monkeypatch.setattr(pcm_cache, 'load', lambda path, *args, **kwargs: sources[path])
+    encoded = {}
+    monkeypatch.setattr(numpy_mixer, 'encode',
+                        lambda buffer, out_path, *args, **kwargs: encoded.update(out=buffer))
+
+    mix.mix_numpy({'output': "out.mp3", 'bgm': "bgm", 'clips': ["a", "b"],
+                   'offsets': [3.0, 7.0], 'length': 13.0})
+    assert abs(loudness.integrated_loudness(encoded['out'], rate) - mix.TARGET_LUFS) < 0.1
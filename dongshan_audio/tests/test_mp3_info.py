@@ -0,0 +1,88 @@
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+import ffmpeg_tool
+import mp3_info
+from fake_tts import FRAME_HEADER, FRAME_SEC, FRAME_SIZE, silent_mp3
+
+# MPEG-1 Layer III, 44.1 kHz, mono；128 kbps = 417 bytes、64 kbps = 208 bytes
+HEADER_64K = bytes([0xFF, 0xFB, 0x50, 0xC4])
+
+
+def _frame(header=FRAME_HEADER, size=FRAME_SIZE):
+    return header + bytes(size - len(header))
+
+
+def _xing_frame(tag, frames, delay=None, padding=None):
+    # 不含音訊的標頭 frame：side info (mono 17 bytes) 之後是 Xing/Info，只帶 frame 數
+    body = bytearray(_frame())
+    off = 4 + 17
+    body[off:off + 12] = tag + struct.pack('>II', 0x01, frames)
+    if delay is not None:
+        lame = off + 12
+        body[lame:lame + 4] = b'LAME'
+        body[lame + 21:lame + 24] = bytes([delay >> 4, ((delay & 0x0F) << 4) | (padding >> 8),
+                                           padding & 0xFF])
+    return bytes(body)
+
+
+def _id3v2(payload_size):
+    size = bytes((payload_size >> s) & 0x7F for s in (21, 14, 7, 0))
+    return b'ID3\x03\x00\x00' + size + bytes(payload_size)
+
+
+def test_cbr_frame_walk():
+    assert mp3_info.duration_from_bytes(silent_mp3(3)) == pytest.approx(115 * FRAME_SEC)
+
+
+def test_vbr_frame_walk_sums_mixed_bitrates():
+    data = _frame() * 10 + _frame(HEADER_64K, 208) * 7
+    assert mp3_info.duration_from_bytes(data) == pytest.approx(17 * FRAME_SEC)
+
+
+def test_frame_walk_resyncs_after_garbage_and_skips_id3():
+    data = _id3v2(300) + _frame() * 4 + b'\x00garbage\xff\x00' + _frame() * 5
+    assert mp3_info.duration_from_bytes(data) == pytest.approx(9 * FRAME_SEC)
+
+
+def test_xing_frame_count_and_encoder_trim():
+    # 標頭 frame 記錄的 frame 數優先於實際走訪，並扣掉 LAME 記錄的前後補零
+    data = _xing_frame(b'Xing', 100, delay=1105, padding=500) + _frame() * 3
+    assert mp3_info.duration_from_bytes(data) == pytest.approx((100 * 1152 - 1605) / 44100)
+    data = _xing_frame(b'Info', 50) + _frame() * 50
+    assert mp3_info.duration_from_bytes(data) == pytest.approx(50 * FRAME_SEC)
+
+
+def test_vbri_frame_count():
+    body = bytearray(_frame())
+    body[36:40] = b'VBRI'
+    body[36 + 14:36 + 18] = struct.pack('>I', 80)
+    assert mp3_info.duration_from_bytes(bytes(body) + _frame() * 2) == pytest.approx(80 * FRAME_SEC)
+
+
+def test_no_frames_raises():
+    with pytest.raises(mp3_info.MP3Error):
+        mp3_info.duration_from_bytes(b'ID3' + bytes(100))
+
+
+@pytest.mark.skipif(shutil.which(ffmpeg_tool.ffmpeg()) is None, reason="找不到 ffmpeg")
+@pytest.mark.parametrize('args, exact', [
+    (['-b:a', '128k'], True),                               # CBR + Info/LAME 標頭
+    (['-q:a', '4'], True),                                  # VBR + Xing/LAME 標頭
+    (['-b:a', '32k', '-ac', '1', '-ar', '22050'], True),    # MPEG-2 單聲道
+    (['-b:a', '128k', '-write_xing', '0'], False),          # 沒有標頭：逐 frame 走訪
+])
+def test_encoded_clip_durations(tmp_path, args, exact):
+    path = str(tmp_path / "clip.mp3")
+    subprocess.run([ffmpeg_tool.ffmpeg(), '-v', 'error', '-y', '-f', 'lavfi',
+                    '-i', 'sine=frequency=440:sample_rate=44100:duration=2.5', *args, path],
+                   check=True)
+    dur = mp3_info.duration(path)
+    if exact:
+        assert dur == pytest.approx(2.5, abs=1e-6)
+    else:
+        # 走訪無法得知編碼器補的靜音，最多多出約兩個 frame
+        assert 2.5 <= dur <= 2.5 + 2 * FRAME_SEC
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import ffmpeg_tool
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 預覽輸出改到暫存目錄，不動到 dongshan_audio/preview/
+RUN_PREVIEW = """
+import sys
+import run_all
+run_all.PREVIEW_DIR = sys.argv[1]
+sys.argv = ['run_all.py', '--test', *sys.argv[2:]]
+run_all.main()
+"""
+
+
+@pytest.mark.skipif(not os.path.isfile(ffmpeg_tool.ffmpeg()), reason="找不到 ffmpeg")
+def test_preview_pipeline_end_to_end(tmp_path):
+    for module in ('edge_tts', 'pedalboard', 'soundfile'):
+        pytest.importorskip(module)
+    out = tmp_path / "preview"
+    proc = subprocess.run([sys.executable, "-c", RUN_PREVIEW, str(out), '--theme', 'train'],
+                          cwd=SCRIPT_DIR, capture_output=True, text=True, encoding='utf-8',
+                          timeout=300)
+    assert proc.returncode == 0, proc.stdout[-2000:] + proc.stderr[-2000:]
+
+    # 替身 TTS、配樂、混音與編碼都有產出
+    assert (out / "tts_audio" / "00002.mp3").stat().st_size > 0
+    assert (out / "bgm_mp3" / "bgm_train.mp3").stat().st_size > 0
+    mixes = list((out / "final_output").glob("*.mp3"))
+    assert len(mixes) == 1 and mixes[0].stat().st_size > 0
+    assert list((out / "encoded").rglob("*.opus"))
+
+
+@pytest.mark.parametrize('script', ['generate_story_audio.py', 'generate_bgm.py', 'mix_audio.py'])
+def test_scripts_reject_test_flag(script, tmp_path):
+    # 預覽模式只由 run_all.py --test 提供 (輸出到 preview/ 並使用替身 TTS)
+    proc = subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, script), '--test'],
+                          cwd=tmp_path,
+                          capture_output=True, text=True, encoding='utf-8', timeout=60)
+    assert proc.returncode == 2
+    assert "--test" in proc.stderr
@@ -0,0 +1,40 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from fake_tts import FakeTTSBackend, silent_mp3
+
+
+@pytest.fixture
+def gsa(workdir):
+    return pytest.importorskip('generate_story_audio')
+
+
+def test_existing_outputs_are_adopted_without_synthesis(gsa):
+    # 快取上線前已合成的 tts_audio/*.mp3：第一次建置收進快取，不再呼叫 TTS
+    path = os.path.join("tts_audio", "00002.mp3")
+    data = silent_mp3(2)
+    with open(path, 'wb') as f:
+        f.write(data)
+    jobs = [("既有的場景", path, gsa.DEFAULT_VOICE)]
+    manifest = gsa.tts_cache.load_manifest()
+    assert gsa.plan_tts(jobs, manifest) == ['fresh']
+
+    backend = FakeTTSBackend(latency=0.0, jitter=0.0)
+    scheduler = gsa.make_scheduler(backend, rate=0)
+    hits, ok, failed, _ = asyncio.run(gsa.build_tts(jobs, scheduler, manifest))
+    assert (hits, ok, failed, backend.calls) == (1, 0, 0, 0)
+    key = gsa._key("既有的場景", gsa.DEFAULT_VOICE)
+    with open(gsa.tts_cache.blob_path(key), 'rb') as f:
+        assert f.read() == data
+    with open(gsa.tts_cache.MANIFEST_PATH, encoding='utf-8') as f:
+        assert json.load(f)['entries']['tts_audio/00002.mp3']['key'] == key
+
+    # 已有紀錄後，文字修改照常重新合成
+    jobs = [("修改過的場景", path, gsa.DEFAULT_VOICE)]
+    assert gsa.plan_tts(jobs, manifest) == ['build']
+    scheduler = gsa.make_scheduler(backend, rate=0)
+    hits, ok, failed, _ = asyncio.run(gsa.build_tts(jobs, scheduler, manifest))
+    assert (hits, ok, failed, backend.calls) == (0, 1, 0, 1)
@@ -0,0 +1,80 @@
+import asyncio
+
+from fake_tts import FakeTTSBackend
+from tts_queue import TTSScheduler, summarize
+
+
+def _run(backend, jobs, **kwargs):
+    options = dict(rate=0, backoff=0.0, timeout=1.0)
+    options.update(kwargs)
+    return asyncio.run(TTSScheduler(backend, **options).run(jobs))
+
+
+def _jobs(tmp_path, n):
+    return [("測試語音", str(tmp_path / f"{i:05d}.mp3")) for i in range(n)]
+
+
+def test_errors_are_retried_then_reported(tmp_path):
+    backend = FakeTTSBackend(latency=0.0, jitter=0.0, error_rate=1.0)
+    results = _run(backend, _jobs(tmp_path, 3), retries=2)
+    assert [(r['ok'], r['attempts']) for r in results] == [(False, 3)] * 3
+    assert all("simulated edge-tts failure" in r['error'] for r in results)
+    assert backend.calls == 9
+    # 失敗時不留下輸出或 .part 暫存檔
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_hung_requests_time_out(tmp_path):
+    backend = FakeTTSBackend(latency=0.0, jitter=0.0, hang_rate=1.0)
+    results = _run(backend, _jobs(tmp_path, 2), retries=1, timeout=0.05)
+    assert [(r['ok'], r['attempts']) for r in results] == [(False, 2)] * 2
+    assert all(r['error'].startswith("timeout") for r in results)
+    assert backend.calls == 4
+
+
+def test_attempt_counts_match_backend_calls(tmp_path):
+    backend = FakeTTSBackend(latency=0.0, jitter=0.0, error_rate=0.4, hang_rate=0.1, seed=7)
+    results = _run(backend, _jobs(tmp_path, 40), retries=3, timeout=0.05)
+    ok, failed, retried = summarize(results)
+    assert ok + failed == 40 and retried > 0
+    assert sum(r['attempts'] for r in results) == backend.calls
+    # 成功的請求只有最後一次成功，其餘每次都是後端回報的失敗
+    assert backend.failures == backend.calls - ok
+    for i, r in enumerate(results):
+        assert r['path'] == str(tmp_path / f"{i:05d}.mp3")
+        assert (tmp_path / f"{i:05d}.mp3").exists() == r['ok']
+
+
+def test_one_failing_scene_does_not_abort_batch(tmp_path):
+    backend = FakeTTSBackend(latency=0.0, jitter=0.0)
+
+    async def synth(text, out_path, **opts):
+        if text == "壞掉的場景":
+            raise RuntimeError("boom")
+        return await backend(text, out_path, **opts)
+
+    jobs = _jobs(tmp_path, 4)
+    jobs[1] = ("壞掉的場景", jobs[1][1])
+    done = []
+    results = asyncio.run(TTSScheduler(synth, rate=0, backoff=0.0, retries=1,
+                                       on_done=done.append).run(jobs))
+    assert [r['ok'] for r in results] == [True, False, True, True]
+    assert results[1]['attempts'] == 2 and "boom" in results[1]['error']
+    assert len(done) == 4
+
+
+def test_concurrency_limit(tmp_path):
+    active, peak = 0, 0
+
+    async def synth(text, out_path, **opts):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        with open(out_path, 'wb') as f:
+            f.write(b"x")
+
+    results = asyncio.run(TTSScheduler(synth, concurrency=2, rate=0).run(_jobs(tmp_path, 6)))
+    assert all(r['ok'] for r in results)
+    assert peak == 2
@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def gsa(workdir):
+    # 匯入時會在目前目錄建立 tts_audio/
+    return pytest.importorskip('generate_story_audio')
+
+
+def test_default_is_only_the_default_voice(gsa):
+    assert gsa.parse_voices(None) == [gsa.DEFAULT_VOICE]
+    assert gsa.parse_voices("") == [gsa.DEFAULT_VOICE]
+
+
+def test_all_and_explicit_lists(gsa):
+    assert gsa.parse_voices("all") == list(gsa.VOICE_PROFILES)
+    assert gsa.parse_voices("default,kids") == ['default', 'kids']
+    with pytest.raises(ValueError):
+        gsa.parse_voices("robot")
@@ -0,0 +1,171 @@
+"""
+tracing.py — 冬山鄉探險隊：管線追蹤
+
+記錄各階段、各主題、每個子行程與每個 TTS 請求的時間區段 (含讀寫位元組數)，
+匯出成 Chrome / Perfetto 可開啟的 trace JSON (chrome://tracing 或 ui.perfetto.dev)，
+並列出最耗時的項目。未呼叫 enable() 時 span() 不做任何記錄。
+"""
+
+import itertools
+import json
+import os
+import subprocess
+import threading
+import time
+
+_enabled = False
+_events = []
+_threads = set()
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_t0 = time.perf_counter_ns()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def enabled():
+    return _enabled
+
+
+def _now_us():
+    return (time.perf_counter_ns() - _t0) / 1000
+
+
+def _emit(event):
+    tid = threading.get_ident()
+    event.update(pid=os.getpid(), tid=tid)
+    with _lock:
+        if tid not in _threads:
+            _threads.add(tid)
+            _events.append({'ph': 'M', 'name': 'thread_name', 'pid': event['pid'], 'tid': tid,
+                            'args': {'name': threading.current_thread().name}})
+        _events.append(event)
+
+
+class Span:
+    """with span(...) as sp: ...；sp.set(key=value) 補上結束時才知道的參數"""
+
+    def __init__(self, name, cat, args, is_async):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.is_async = is_async
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = _now_us()
+        if self.is_async:
+            # 同一執行緒上會互相重疊的區段 (asyncio 任務) 以 async 事件記錄
+            self.id = next(_ids)
+            _emit({'ph': 'b', 'name': self.name, 'cat': self.cat, 'id': self.id, 'ts': self.start})
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        end = _now_us()
+        if self.is_async:
+            _emit({'ph': 'e', 'name': self.name, 'cat': self.cat, 'id': self.id, 'ts': end,
+                   'args': self.args})
+        else:
+            _emit({'ph': 'X', 'name': self.name, 'cat': self.cat, 'ts': self.start,
+                   'dur': end - self.start, 'args': self.args})
+        return False
+
+
+class _NullSpan:
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+def span(name, cat='stage', is_async=False, **args):
+    if not _enabled:
+        return _NULL
+    return Span(name, cat, args, is_async)
+
+
+def _file_bytes(paths):
+    return sum(os.path.getsize(p) for p in paths if isinstance(p, str) and os.path.isfile(p))
+
+
+def command_name(cmd):
+    return os.path.splitext(os.path.basename(str(cmd[0])))[0]
+
+
+def run(cmd, outputs=(), **kwargs):
+    # subprocess.run 加上追蹤 (分類為執行檔名稱，例如 ffmpeg、fluidsynth)：
+    # 讀取量 = 指令中既有檔案 + stdin，寫出量 = outputs 檔案 + stdout
+    if not _enabled:
+        return subprocess.run(cmd, **kwargs)
+    read = _file_bytes(a for a in cmd[1:] if a not in outputs) + len(kwargs.get('input') or b'')
+    name = command_name(cmd)
+    with span(name, name, cmd=" ".join(map(str, cmd))[:300],
+              bytes_read=read) as sp:
+        result = subprocess.run(cmd, **kwargs)
+        written = _file_bytes(outputs)
+        if isinstance(result.stdout, bytes):
+            written += len(result.stdout)
+        sp.set(bytes_written=written, returncode=result.returncode)
+    return result
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def export(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events(), 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+
+def durations():
+    # [(分類, 名稱, 秒, args), ...]；async 事件以 b/e 配對計算長度
+    out, starts = [], {}
+    for e in events():
+        if e['ph'] == 'X':
+            out.append((e['cat'], e['name'], e['dur'] / 1e6, e['args']))
+        elif e['ph'] == 'b':
+            starts[e['id']] = e['ts']
+        elif e['ph'] == 'e' and e['id'] in starts:
+            out.append((e['cat'], e['name'], (e['ts'] - starts.pop(e['id'])) / 1e6, e['args']))
+    return out
+
+
+def summary(top=10):
+    # 回傳 (各分類 [(分類, 次數, 總秒數, 讀取, 寫出)], 最耗時的 top 個區段)
+    spans = durations()
+    cats = {}
+    for cat, _, sec, args in spans:
+        row = cats.setdefault(cat, [cat, 0, 0.0, 0, 0])
+        row[1] += 1
+        row[2] += sec
+        row[3] += args.get('bytes_read', 0)
+        row[4] += args.get('bytes_written', 0)
+    by_cat = sorted((tuple(r) for r in cats.values()), key=lambda r: -r[2])
+    return by_cat, sorted(spans, key=lambda s: -s[2])[:top]
+
+
+def print_summary(top=10):
+    by_cat, slowest = summary(top)
+    print("\n  ⏱️ 各分類累計耗時 (平行執行的區段會重複計入)")
+    print(f"    {'分類':<12}{'次數':>4}{'秒數':>8}{'讀取 KB':>10}{'寫出 KB':>10}")
+    for cat, count, sec, read, written in by_cat:
+        print(f"    {cat:<14}{count:>6}{sec:>10.2f}{read / 1024:>12.0f}{written / 1024:>12.0f}")
+    print(f"\n  🐢 最耗時的 {len(slowest)} 個區段")
+    for cat, name, sec, _ in slowest:
+        print(f"    {sec:8.2f}s  [{cat}] {name}")
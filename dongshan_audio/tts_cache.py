@@ -0,0 +1,183 @@
+"""
+tts_cache.py — 冬山鄉探險隊：TTS 內容定址快取
+
+以 (文字, 語音, 語速, 音調) 的雜湊值作為鍵，儲存已合成的 MP3 與字詞時間 (.words.json)。
+manifest (tts_manifest.json) 記錄每個輸出檔目前對應的快取鍵，
+快取上線前就存在的輸出檔 (manifest 沒有紀錄) 在第一次建置時直接收進快取 (adopt)，不重新合成。
+未被 manifest 引用的快取檔可用 gc 指令清除：
+
+    python tts_cache.py gc [--dry-run]
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+CACHE_DIR = "tts_cache"
+MANIFEST_PATH = "tts_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def cache_key(text, voice, rate, pitch):
+    # 任何一項設定改變都會得到不同的鍵
+    payload = json.dumps([text, voice, rate, pitch], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def blob_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.mp3")
+
+
+def words_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.words.json")
+
+
+def timing_path(out_path):
+    # 輸出檔旁的字詞時間檔，例如 tts_audio/00002.words.json
+    return os.path.splitext(out_path)[0] + ".words.json"
+
+
+def save_words(key, words):
+    # words: [{'text': 字詞, 'start': 秒, 'end': 秒}, ...]
+    tmp = words_path(key) + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(words, f, ensure_ascii=False)
+    os.replace(tmp, words_path(key))
+
+
+def load_words(key):
+    try:
+        with open(words_path(key), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {'version': MANIFEST_VERSION, 'entries': {}}
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'entries': {}}
+    if data.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'entries': {}}
+    return data
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    # 先寫暫存檔再改名，避免中斷時留下半個 manifest
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def is_up_to_date(manifest, out_path, key):
+    entry = manifest['entries'].get(_manifest_name(out_path))
+    return bool(entry) and entry['key'] == key and os.path.exists(out_path)
+
+
+def is_tracked(manifest, out_path):
+    return _manifest_name(out_path) in manifest['entries']
+
+
+def adopt(manifest, out_path, key, voice, rate, pitch):
+    # 把既有的輸出檔 (與旁邊的字詞時間檔) 當作 key 的合成結果收進快取並記錄
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _place(out_path, blob_path(key))
+    if os.path.exists(timing_path(out_path)):
+        _place(timing_path(out_path), words_path(key))
+    record(manifest, out_path, key, voice, rate, pitch)
+
+
+def has_blob(key):
+    return os.path.exists(blob_path(key))
+
+
+def _place(src, dst):
+    # 優先 hard link，不支援時退回複製；先放暫存檔再改名，讀取端不會看到寫到一半的檔案
+    tmp = dst + ".part"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def materialize(key, out_path):
+    # 從快取放到輸出位置，有字詞時間時一併放到旁邊
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    _place(blob_path(key), out_path)
+    if os.path.exists(words_path(key)):
+        _place(words_path(key), timing_path(out_path))
+
+
+def record(manifest, out_path, key, voice, rate, pitch, chunks=()):
+    # chunks：長文分段合成時各段的快取鍵，保留下來供下次只重合成有變動的句子
+    entry = {
+        'key': key,
+        'voice': voice,
+        'rate': rate,
+        'pitch': pitch,
+        'bytes': os.path.getsize(blob_path(key)),
+    }
+    if chunks:
+        entry['chunks'] = list(chunks)
+    manifest['entries'][_manifest_name(out_path)] = entry
+
+
+def referenced_keys(manifest):
+    keys = set()
+    for e in manifest['entries'].values():
+        keys.add(e['key'])
+        keys.update(e.get('chunks', ()))
+    return keys
+
+
+def gc(manifest=None, dry_run=False):
+    # 刪除 manifest 未引用的快取檔 (例如修改過文字的舊版本)
+    if manifest is None:
+        manifest = load_manifest()
+    keep = referenced_keys(manifest)
+    removed, freed = 0, 0
+    if not os.path.isdir(CACHE_DIR):
+        return removed, freed
+    for name in sorted(os.listdir(CACHE_DIR)):
+        key = name.split('.')[0]
+        path = os.path.join(CACHE_DIR, name)
+        if not name.endswith(('.mp3', '.words.json')) or key in keep:
+            continue
+        size = os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+def _manifest_name(out_path):
+    return out_path.replace(os.sep, '/')
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] != 'gc':
+        print("Usage: python tts_cache.py gc [--dry-run]")
+        return
+    dry_run = '--dry-run' in args
+    removed, freed = gc(dry_run=dry_run)
+    verb = "可清除" if dry_run else "已清除"
+    print(f"🧹 {verb} {removed} 個孤立快取檔 ({freed / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+tts_chunks.py — 冬山鄉探險隊：長文分段合成
+
+開場語這類長文一次送出時總是最慢的請求，整批都得等它。
+超過 LONG_TEXT_CHARS 的文字在句尾標點 (。！？) 切成數段，
+各段與其他場景一起排進 TTS 佇列同時合成，完成後以 MP3 frame 直接串接 (不重新編碼)，
+字詞時間也依各段長度平移合併。
+每段各自以內容雜湊快取，修改長文時只會重新合成有變動的句子。
+"""
+
+import re
+
+import mp3_info
+
+LONG_TEXT_CHARS = 120   # 超過這個長度才分段
+CHUNK_CHARS = 60        # 每段的目標長度；短句會併進同一段以免請求過多
+
+# 句尾標點，後面可接引號或括號
+_SENTENCE = re.compile(r'[^。！？]*[。！？]+[」』）"\']*|[^。！？]+$')
+
+
+def split_sentences(text):
+    return [s for s in (m.group().strip() for m in _SENTENCE.finditer(text)) if s]
+
+
+def split_text(text, long_chars=LONG_TEXT_CHARS, chunk_chars=CHUNK_CHARS):
+    # 短文回傳 [text]；長文依句子切段，每段不超過 chunk_chars (單句過長時自成一段)
+    if len(text) <= long_chars:
+        return [text]
+    chunks = []
+    for sentence in split_sentences(text):
+        if chunks and len(chunks[-1]) + len(sentence) <= chunk_chars:
+            chunks[-1] += sentence
+        else:
+            chunks.append(sentence)
+    return chunks
+
+
+# ── MP3 frame 串接 ──────────────────────────────────────────
+
+def mp3_frames(data):
+    # 取出音訊 frame (略過 ID3 標籤與 Xing/Info/VBRI 標頭 frame)；回傳 (frames, 第一個 frame 的標頭)
+    pos = mp3_info.skip_id3v2(data)
+    frames, first = [], None
+    while pos + 4 <= len(data):
+        if data[pos:pos + 3] == b'TAG':   # ID3v1 標籤在檔尾
+            break
+        hdr = mp3_info.parse_header(data[pos:pos + 4])
+        if hdr is None or hdr['length'] <= 0:
+            raise mp3_info.MP3Error(f"invalid MPEG audio frame at {pos}")
+        if first is None:
+            first = hdr
+            if mp3_info.header_tag(data, pos, hdr)[0]:
+                # 標頭記錄的是單一檔案的長度，串接後已不正確
+                pos += hdr['length']
+                continue
+        elif (hdr['sample_rate'], hdr['mono']) != (first['sample_rate'], first['mono']):
+            raise mp3_info.MP3Error("MPEG audio format changes mid-stream")
+        frames.append(data[pos:pos + hdr['length']])
+        pos += hdr['length']
+    if first is None:
+        raise mp3_info.MP3Error("no MPEG audio frame found")
+    return frames, first
+
+
+def concat_mp3(paths, out_path):
+    # 依序串接多個同格式 MP3 的音訊 frame，不重新編碼；回傳各段長度 (秒)
+    joined, durations, fmt = [], [], None
+    for path in paths:
+        with open(path, 'rb') as f:
+            frames, hdr = mp3_frames(f.read())
+        if fmt is not None and (hdr['sample_rate'], hdr['mono']) != fmt:
+            raise mp3_info.MP3Error(f"{path}: format differs from previous chunk")
+        fmt = (hdr['sample_rate'], hdr['mono'])
+        joined += frames
+        durations.append(len(frames) * hdr['samples'] / hdr['sample_rate'])
+    with open(out_path, 'wb') as f:
+        f.write(b''.join(joined))
+    return durations
+
+
+def join_words(parts, durations):
+    # 各段的字詞時間 [{'text', 'start', 'end'}] 依前面各段的長度平移後合併
+    words, offset = [], 0.0
+    for part, dur in zip(parts, durations):
+        words += [dict(w, start=w['start'] + offset, end=w['end'] + offset) for w in part]
+        offset += dur
+    return words
@@ -0,0 +1,169 @@
+"""
+tts_queue.py — 冬山鄉探險隊：TTS 工作佇列
+
+以 semaphore 限制同時連線數、token bucket 限制請求速率，
+每個請求有逾時與抖動退避重試；單一請求失敗不會中斷整批。
+
+離線壓測 (使用 fake_tts 替身)：
+    python tts_queue.py bench --jobs 65 --latency 0.5 --error-rate 0.1 --hang-rate 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+import tracing
+
+if sys.stdout and hasattr(sys.stdout, 'reconfigure'):
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+
+DEFAULT_CONCURRENCY = 5
+DEFAULT_RATE = 2.0      # 每秒請求數
+DEFAULT_BURST = 5
+DEFAULT_TIMEOUT = 60.0  # 秒
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0   # 秒，每次重試加倍
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class TTSScheduler:
+    """synth 為 async callable(text, out_path, **opts)，例如 gen_tts 或 FakeTTSBackend；
+    synth 的回傳值 (例如字詞時間) 放在結果的 'meta'"""
+
+    def __init__(self, synth, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                 burst=DEFAULT_BURST, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, on_done=None):
+        self.synth = synth
+        self.concurrency = concurrency
+        # 同一個排程器可被多個 run() 共用，併發與速率限制跨呼叫生效
+        self.sem = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.on_done = on_done
+
+    async def run(self, jobs, on_done=None):
+        # jobs: [(text, out_path), ...] 或 [(text, out_path, opts), ...]
+        # opts (例如語音設定檔) 以關鍵字參數傳給 synth → 與 jobs 同序的結果 dict 列表
+        on_done = on_done or self.on_done
+        return await asyncio.gather(*(self._run_one(job[0], job[1], on_done, *job[2:])
+                                      for job in jobs))
+
+    async def _run_one(self, text, out_path, on_done, opts=None):
+        start = time.monotonic()
+        error, meta = None, None
+        for attempt in range(1, self.retries + 2):
+            async with self.sem:
+                await self.bucket.acquire()
+                # 先寫 .part 暫存檔，成功才改名，逾時或失敗不留殘檔
+                tmp = f"{out_path}.{uuid.uuid4().hex[:8]}.part"
+                try:
+                    with tracing.span(os.path.basename(out_path), 'tts', is_async=True,
+                                      attempt=attempt, chars=len(text)) as sp:
+                        meta = await asyncio.wait_for(self.synth(text, tmp, **(opts or {})),
+                                                      self.timeout)
+                        sp.set(bytes_written=os.path.getsize(tmp))
+                    os.replace(tmp, out_path)
+                    error = None
+                except asyncio.TimeoutError:
+                    error = f"timeout after {self.timeout:.0f}s"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+            if error is None:
+                break
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if attempt <= self.retries:
+                # 指數退避 + 全抖動，避免重試同時湧入
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+        result = {
+            'path': out_path,
+            'ok': error is None,
+            'attempts': attempt,
+            'elapsed': time.monotonic() - start,
+            'error': error,
+            'meta': meta if error is None else None,
+        }
+        if on_done:
+            on_done(result)
+        return result
+
+
+def summarize(results):
+    ok = sum(1 for r in results if r['ok'])
+    retried = sum(1 for r in results if r['attempts'] > 1)
+    return ok, len(results) - ok, retried
+
+
+async def bench(args):
+    from fake_tts import FakeTTSBackend
+
+    backend = FakeTTSBackend(latency=args.latency, jitter=args.jitter,
+                             error_rate=args.error_rate, hang_rate=args.hang_rate,
+                             seed=args.seed)
+    scheduler = TTSScheduler(backend, concurrency=args.concurrency, rate=args.rate,
+                             burst=args.burst, timeout=args.timeout,
+                             retries=args.retries, backoff=args.backoff)
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = [("測試語音" * 40, os.path.join(tmp, f"{i:05d}.mp3")) for i in range(args.jobs)]
+        t0 = time.monotonic()
+        results = await scheduler.run(jobs)
+        wall = time.monotonic() - t0
+
+    ok, failed, retried = summarize(results)
+    latencies = sorted(r['elapsed'] for r in results)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"⏱️  {args.jobs} 個請求，耗時 {wall:.2f}s ({args.jobs / wall:.1f} req/s)")
+    print(f"   成功 {ok}，失敗 {failed}，重試 {retried}，後端呼叫 {backend.calls} 次")
+    print(f"   單請求 p50 {latencies[len(latencies) // 2]:.2f}s / p95 {p95:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS 佇列離線壓測")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    b = sub.add_parser('bench')
+    b.add_argument('--jobs', type=int, default=65)
+    b.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    b.add_argument('--rate', type=float, default=DEFAULT_RATE)
+    b.add_argument('--burst', type=int, default=DEFAULT_BURST)
+    b.add_argument('--timeout', type=float, default=5.0)
+    b.add_argument('--retries', type=int, default=DEFAULT_RETRIES)
+    b.add_argument('--backoff', type=float, default=0.2)
+    b.add_argument('--latency', type=float, default=0.5)
+    b.add_argument('--jitter', type=float, default=0.3)
+    b.add_argument('--error-rate', type=float, default=0.05)
+    b.add_argument('--hang-rate', type=float, default=0.01)
+    b.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()